@@ -0,0 +1,163 @@
+"""
+   Module to be used with matlab_plot_functions.py, for saving the figures to a
+   file and loading them back, e.g. so that one job prepares the figures and
+   other jobs export them, without preparing the data again.
+
+   The file is an uncompressed .npz file: one .npy member per x and y array of
+   each series, plus a JSON description of everything else in the figures. As
+   the members are stored as they are, the arrays can be memory-mapped straight
+   from the file when loading, so only the parts that are used are read.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import os
+import json
+import struct
+import zipfile
+from numpy import nan, array, savez, load, memmap
+from numpy.lib import format as npy_format
+
+from matlab_utils import *
+from plot_encoding import as_vector
+from output_files import replace_file
+from plot_styles import series_style
+
+# Version of the file layout, in case it ever needs to change
+__store_version = 1
+
+# --------------------------------------------------------------------------------
+def write_figure_store(filename, figInfos, figIdx=-1):
+    # Saves the figures in figInfos, and the current figure index, to filename
+    arrays = {}
+    figs_meta = []
+
+    for Ifig in range(0,length(figInfos)):
+        figInfo = figInfos[Ifig]
+        # The styles are rebuilt from the linestyles, colors and markers on loading.
+        # Series from append_points() are stored with their points, as plain series.
+        fig_meta = dict([(key, val) for (key, val) in figInfo.items() if key not in ('data', 'styles', 'rings')])
+
+        if isinstance(figInfo['data'], list):
+            fig_meta['num_series'] = length(figInfo['data'])
+            for Id in range(0,length(figInfo['data'])):
+                arrays[sprintf('fig%i_series%i_x', Ifig+1, Id+1)] = as_vector(figInfo['data'][Id]['x'])
+                arrays[sprintf('fig%i_series%i_y', Ifig+1, Id+1)] = as_vector(figInfo['data'][Id]['y'])
+        else:
+            # Figure slot that is not in use, see close()
+            fig_meta['num_series'] = -1
+
+        figs_meta.append(fig_meta)
+
+    arrays['meta'] = array(json.dumps({'version': __store_version, 'figIdx': figIdx, 'figures': figs_meta}))
+
+    # Written next to filename first, and then moved in place, as the output_to_*
+    # functions do with OutputFile
+    tmp_filename = filename + '.tmp'
+    fid = open(tmp_filename, 'wb')
+    try:
+        savez(fid, **arrays)
+        fid.flush()
+        os.fsync(fid.fileno())
+    finally:
+        fid.close()
+
+    replace_file(tmp_filename, filename)
+
+
+# --------------------------------------------------------------------------------
+def read_figure_store(filename, lazy=True):
+    # Returns the figures and the current figure index saved by write_figure_store().
+    # With lazy, the series arrays are read-only memory maps of the file.
+    store = load(filename)
+    try:
+        meta = json.loads(store['meta'].item())
+        if meta['version'] > __store_version:
+            error('%s was saved by a newer version of figure_store.py', filename)
+
+        if lazy:
+            offsets = __npy_offsets(filename)
+
+        def get_array(name):
+            if lazy and name + '.npy' in offsets:
+                (offset, shape, fortran_order, dtype) = offsets[name + '.npy']
+                return memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape,
+                              order='F' if fortran_order else 'C')
+            return store[name]
+
+        figInfos = []
+        for Ifig in range(0,length(meta['figures'])):
+            figInfo = dict(meta['figures'][Ifig])
+            num_series = figInfo.pop('num_series')
+
+            # Stores written before hist() only have line series
+            if 'plot_types' not in figInfo:
+                figInfo['plot_types'] = ['line'] * max(num_series, 0)
+                figInfo['bar_widths'] = [0] * max(num_series, 0)
+
+            figInfo['styles'] = [series_style(figInfo, Id) for Id in range(0,max(num_series, 0))]
+
+            if num_series < 0:
+                figInfo['data'] = nan
+            else:
+                figInfo['data'] = [{'x': get_array(sprintf('fig%i_series%i_x', Ifig+1, Id+1)),
+                                    'y': get_array(sprintf('fig%i_series%i_y', Ifig+1, Id+1))}
+                                   for Id in range(0,num_series)]
+            figInfos.append(figInfo)
+    finally:
+        store.close()
+
+    return figInfos, meta['figIdx']
+
+
+# --------------------------------------------------------------------------------
+def __npy_offsets(filename):
+    # For each uncompressed .npy member of the .npz file, the offset of the array
+    # data within the file, and its shape, order and dtype
+    offsets = {}
+
+    zip_file = zipfile.ZipFile(filename)
+    fid = open(filename, 'rb')
+    try:
+        for info in zip_file.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                continue
+
+            # Local file header: 30 bytes, then the file name and the extra field,
+            # whose lengths are the last two fields of the header
+            fid.seek(info.header_offset)
+            name_len, extra_len = struct.unpack('<HH', fid.read(30)[26:30])
+            fid.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = npy_format.read_magic(fid)
+            if version == (1, 0):
+                shape, fortran_order, dtype = npy_format.read_array_header_1_0(fid)
+            else:
+                shape, fortran_order, dtype = npy_format.read_array_header_2_0(fid)
+
+            # Empty arrays cannot be memory-mapped
+            if not dtype.hasobject and 0 not in shape:
+                offsets[info.filename] = (fid.tell(), shape, fortran_order, dtype)
+    finally:
+        fid.close()
+        zip_file.close()
+
+    return offsets
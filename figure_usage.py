@@ -0,0 +1,74 @@
+"""
+   Module to be used with matlab_plot_functions.py and the output_to_* modules,
+   to keep track of when each figure was last used, and whether it has been
+   exported since it last changed. matlab_plot_functions.py uses this to decide
+   which figures to close first when there is a cap on the number of figures,
+   see set_max_figures().
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+# For each figure index, [order of last use, exported since last change]
+__usage = {}
+__use_count = 0
+
+# --------------------------------------------------------------------------------
+def touch_figure(figIdx):
+    # Records that figIdx was just used
+    global __use_count
+
+    __use_count += 1
+    __usage.setdefault(figIdx, [0, 0])[0] = __use_count
+
+
+# --------------------------------------------------------------------------------
+def figure_changed(figIdx):
+    # Records that figIdx was changed, so it has things that are not exported yet
+    touch_figure(figIdx)
+    __usage[figIdx][1] = 0
+
+
+# --------------------------------------------------------------------------------
+def figure_exported(figIdx):
+    touch_figure(figIdx)
+    __usage[figIdx][1] = 1
+
+
+# --------------------------------------------------------------------------------
+def forget_figure(figIdx=None):
+    # Drops what is known about figIdx, or about all figures if figIdx is None
+    if figIdx is None:
+        __usage.clear()
+    else:
+        __usage.pop(figIdx, None)
+
+
+# --------------------------------------------------------------------------------
+def is_exported(figIdx):
+    return figIdx in __usage and __usage[figIdx][1] == 1
+
+
+# --------------------------------------------------------------------------------
+def lru_exported_figures(figIdxs):
+    # The figures in figIdxs that have been exported since they last changed,
+    # least recently used first
+    exported = [figIdx for figIdx in figIdxs if is_exported(figIdx)]
+    return sorted(exported, key=lambda figIdx: __usage[figIdx][0])
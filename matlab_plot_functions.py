@@ -1,9 +1,18 @@
 """
    Module that provides access to Matlab-like plotting functions, such as
-      figure, clf, plot, title, xlabel, ylabel, grid, hold, legend, close
+      figure, clf, plot, hist, histc, append_points, title, xlabel, ylabel, grid, hold, legend,
+      close, events
+
+   as well as save_figures and load_figures, to store the figures in a file
+   and load them back in another process, and set_max_figures and
+   figure_memory_stats, for long-running processes that create many figures,
+   and start_memory_profiling, stop_memory_profiling and memory_report, to
+   find out how much memory plot() and each export take
 
    These functions are to be used with 
-          output_to_flot, output_to_nvd3, output_to_matplotlib
+          output_to_flot, output_to_nvd3, output_to_matplotlib, output_to_png
+   (or output(figIdx, backend, ...), for any backend in plot_backends.py, or
+   export(figIdx, targets), for several of them at once)
    in order to visualize your plots
 
    The syntax tries to follow Matlab-like syntax as much as possible,
@@ -29,18 +38,36 @@
    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
    SOFTWARE.
 """
-from numpy import nan, isnan
-import matplotlib.pyplot as plt
+from numpy import nan, isnan, allclose
 import subprocess
 import platform
+from multiprocessing.pool import ThreadPool
 
 db_figIdx  = -1
 db_figInfo = []
 
+# For export(): the backends that take a series_cache, and those that use
+# matplotlib, which has to stay on one thread
+__json_backends   = ('flot', 'nvd3')
+__pyplot_backends = ('matplotlib', 'png')
+
+# Maximum number of open figures, see set_max_figures(); 0 for no maximum
+__max_figures = 0
+__num_evicted = 0
+
 from matlab_utils import *
-from output_to_flot import output_to_flot
-from output_to_nvd3 import output_to_nvd3
-from output_to_matplotlib import output_to_matplotlib
+from plot_encoding import as_vector, is_time_vector, time_to_ms, bar_outline
+from plot_hist import hist_counts, histc_counts
+from plot_styles import parse_plot_fmt
+from ring_buffer import RingBuffer
+from figure_store import write_figure_store, read_figure_store
+from figure_usage import touch_figure, figure_changed, forget_figure, is_exported, lru_exported_figures
+from plot_backends import register_backend, get_backend, available_backends, LazyModule
+from plot_memory import start_memory_profiling, stop_memory_profiling, memory_report, memory_phase
+
+# Only imported when first used, so that scripts that do not use matplotlib
+# start faster, and do not need a working matplotlib backend
+plt = LazyModule('matplotlib.pyplot')
 
 # --------------------------------------------------------------------------------
 def __newfig(enabled=1):  
@@ -48,7 +75,8 @@ def __newfig(enabled=1):
         enabled = 0
 
     fig = {'data':[],  'linestyles':[],'colors':[],'markers':[],'xlabel':'','ylabel':'','title':'',
-           'legend':[],'legend_pos':[],'hold_on':0,'grid_on':0,'axislim':[nan,nan,nan,nan]}
+           'legend':[],'legend_pos':[],'hold_on':0,'grid_on':0,'axislim':[nan,nan,nan,nan],'events':[],
+           'xmode':'','plot_types':[],'bar_widths':[],'styles':[]}
 
     if enabled == 0:
         fig['data'] = nan
@@ -61,12 +89,17 @@ def figure(figIdx=-1):
     global db_figIdx, db_figInfo
 
     if (figIdx == -1):
-        db_figIdx = len(db_figInfo) + 1
+        # As in Matlab, a new figure gets the lowest index not in use
+        free_idx = [I+1 for I in range(0,len(db_figInfo)) if not isinstance(db_figInfo[I]['data'], list)]
+        db_figIdx = free_idx[0] if free_idx else len(db_figInfo) + 1
     else:
         db_figIdx = figIdx
 
     if (db_figIdx > len(db_figInfo)) or (not isinstance(db_figInfo[db_figIdx-1]['data'], list)):
         clf(db_figIdx)        
+        __evict_figures()
+    else:
+        touch_figure(db_figIdx)
 # End: figure()
 
 
@@ -85,6 +118,7 @@ def clf(figIdx=-1):
             db_figInfo.append(__newfig('disabled'))
             
     db_figInfo[db_figIdx-1] = __newfig()
+    figure_changed(db_figIdx)
 
     
 # --------------------------------------------------------------------------------
@@ -97,19 +131,80 @@ def close(figs_to_close):
     if ischar(figs_to_close):
         if figs_to_close=='all':
             db_figIdx  = -1
-            db_figInfo = []
+            # Emptied in place, as the output_to_* modules hold on to db_figInfo
+            del db_figInfo[:]
+            forget_figure()
         else:
             error('Unsupported value for figs_to_close')
     else:
-        # Just mark the figures as 'deleted'
+        # The slots of closed figures are kept, so that the other figures keep
+        # their indices, but everything in them is dropped, and figure() reuses them
         if isinstance(figs_to_close, int):
             figs_to_close = [figs_to_close]
             
         for figIdx in figs_to_close:
-            db_figInfo[figIdx-1]['data'] = nan
+            if figIdx <= len(db_figInfo):
+                db_figInfo[figIdx-1] = __newfig('disabled')
+            forget_figure(figIdx)
 # End close()
 
 
+# --------------------------------------------------------------------------------
+def set_max_figures(max_figures):
+    # Sets the maximum number of open figures, or 0 for no maximum. When a new
+    # figure goes over it, the least recently used figures that have been exported
+    # since they last changed are closed. Figures with changes that have not been
+    # exported are never closed this way, so the maximum can be exceeded.
+    global __max_figures
+
+    __max_figures = max_figures
+    __evict_figures()
+
+
+# --------------------------------------------------------------------------------
+def __evict_figures():
+    global __num_evicted
+
+    if __max_figures <= 0:
+        return
+
+    active_figs = get_active_figures()
+    num_excess  = len(active_figs) - __max_figures
+    if num_excess <= 0:
+        return
+
+    candidates = [figIdx for figIdx in lru_exported_figures(active_figs) if figIdx != db_figIdx]
+    for figIdx in candidates[0:num_excess]:
+        close(figIdx)
+        __num_evicted += 1
+
+
+# --------------------------------------------------------------------------------
+def figure_memory_stats():
+    # Returns a dict with the number of figures and the size of their data, e.g.
+    # to be reported to a monitoring system. data_bytes is exact for NumPy arrays
+    # and ring buffers, and assumes 8 bytes per value for anything else.
+    active_figs = get_active_figures()
+
+    num_series = num_points = data_bytes = 0
+    for figIdx in active_figs:
+        rings = db_figInfo[figIdx-1].get('rings', {})
+        for (Id, series) in enumerate(db_figInfo[figIdx-1]['data']):
+            num_series += 1
+            num_points += length(series['x'])
+            for v in rings.get(Id, (series['x'], series['y'])):
+                data_bytes += getattr(v, 'nbytes', 8*length(v))
+
+    return {'num_slots':    len(db_figInfo),
+            'num_figures':  len(active_figs),
+            'num_exported': len([figIdx for figIdx in active_figs if is_exported(figIdx)]),
+            'num_series':   num_series,
+            'num_points':   num_points,
+            'data_bytes':   data_bytes,
+            'max_figures':  __max_figures,
+            'num_evicted':  __num_evicted}
+
+
 # --------------------------------------------------------------------------------
 def grid(str):
     global db_figIdx, db_figInfo
@@ -123,6 +218,7 @@ def grid(str):
         grid_on = 0
 
     db_figInfo[db_figIdx-1]['grid_on'] = grid_on
+    figure_changed(db_figIdx)
 
 
 # --------------------------------------------------------------------------------
@@ -186,10 +282,61 @@ def legend(*varargin):
 
     db_figInfo[db_figIdx-1]['legend']     = legend_array
     db_figInfo[db_figIdx-1]['legend_pos'] = {'location':location, 'xy_margin':location_xy_margin}
+    figure_changed(db_figIdx)
 
 
 # --------------------------------------------------------------------------------
 def plot(x, y, plot_fmt='b'):
+    with memory_phase(max(db_figIdx, 1), 'plot'):
+        __add_series(x, y, parse_plot_fmt(plot_fmt))
+
+
+# --------------------------------------------------------------------------------
+def hist(data, nbins=10, plot_fmt='b', binrange=None):
+    # As Matlab's hist(data, nbins) or hist(data, centers), drawn as bars. Only
+    # the counts are stored in the figure, not the samples. data too large for
+    # memory can also be an iterable of arrays (e.g. a generator), which needs
+    # binrange=(lo, hi) or the bin centers. Returns the counts and the centers.
+    style = parse_plot_fmt(plot_fmt)
+
+    with memory_phase(max(db_figIdx, 1), 'hist'):
+        (counts, centers, width) = hist_counts(data, nbins, binrange)
+
+        __add_series(centers, counts, style, 'bar', width)
+
+    return counts, centers
+
+
+# --------------------------------------------------------------------------------
+def histc(data, edges, plot_fmt='b'):
+    # As Matlab's histc(data, edges): counts[k] is the number of values in
+    # [edges[k], edges[k+1]), and counts[-1] the number equal to edges[-1]. The
+    # bars are drawn between the edges, with the last count in the last bar.
+    style = parse_plot_fmt(plot_fmt)
+
+    with memory_phase(max(db_figIdx, 1), 'histc'):
+        counts = histc_counts(data, edges)
+
+        edges = as_vector(edges)
+        bar_counts = counts[0:-1].copy()
+        bar_counts[-1] += counts[-1]
+
+        centers = (edges[0:-1] + edges[1:]) / 2
+        widths  = edges[1:] - edges[0:-1]
+
+        if allclose(widths, widths[0]):
+            __add_series(centers, bar_counts, style, 'bar', widths.mean())
+        else:
+            # The backends draw all the bars of a series with the same width, so
+            # bars of different widths are drawn as their outline, from the edges
+            (x, y) = bar_outline(centers, bar_counts, widths)
+            __add_series(x, y, style)
+
+    return counts
+
+
+# --------------------------------------------------------------------------------
+def __add_series(x, y, style, plot_type='line', bar_width=0):
     global db_figIdx, db_figInfo
     
     if db_figIdx == -1:
@@ -198,55 +345,124 @@ def plot(x, y, plot_fmt='b'):
     if db_figIdx > len(db_figInfo):
         figure(db_figIdx)
 
+    if (not db_figInfo[db_figIdx-1]['hold_on']) or (not isinstance(db_figInfo[db_figIdx-1]['data'], list)):
+        clf()
 
-    fmt_color = {'b':'rgb(0, 0, 255)',  'r':'rgb(255, 0, 0)',  'g':'rgb(0, 255, 0)', 
-                 'm':'rgb(255, 0, 255)','c':'rgb(0, 255, 255)','k':'rgb(0, 0,   0)'}
+    x = __x_values(db_figInfo[db_figIdx-1], x)
+    __append_series(db_figIdx, x, y, style, plot_type, bar_width)
 
-    fmt_marker = {'o':'circle', 's':'square', 'd':'diamond', '\^':'triangle', '\+':'cross'}
 
-    srch = regexp(plot_fmt,'(?<color>[brgmck])?(?<linestyle>-{1,2})?(?<marker>[osd\^\+])?(?<alpha>\[alpha:[01]\.[0-9]+\])?')
+def __append_series(figIdx, x, y, style, plot_type='line', bar_width=0):
+    # Adds a series to figure figIdx, after the ones it has, with x already
+    # converted by __x_values()
+    figInfo = db_figInfo[figIdx-1]
 
-    if isempty(srch.group('color')):
-        color = 'b'
-    elif length(srch.group('color')) == 1:
-        color = srch.group('color')
-    else:
-        error('Badly formatted plot_fmt')
+    figInfo['data'].append({'x':x,'y':y})
+    figInfo['linestyles'].append(style.linestyle)
+    figInfo['colors'].append(style.color_str)
+    figInfo['markers'].append(style.marker)
+    figInfo['styles'].append(style)
+    figInfo['plot_types'].append(plot_type)
+    figInfo['bar_widths'].append(bar_width)
+    figure_changed(figIdx)
 
-    if isempty(srch.group('linestyle')):
-        linestyle = '-'
-    elif regexp(srch.group('linestyle'),'^-|--$'):
-        linestyle = srch.group('linestyle')
+
+def __x_values(figInfo, x):
+    # Times (datetime64 arrays, or lists of datetime objects) are stored as
+    # milliseconds since 1970-01-01 UTC, and give the figure a time x axis
+    if is_time_vector(x):
+        x     = time_to_ms(x)
+        xmode = 'time'
     else:
-        error('Badly formatted plot_fmt')
+        xmode = ''
 
-    if isempty(srch.group('marker')):
-        marker = ''
-    elif length(srch.group('marker')) == 1:
-        marker = srch.group('marker')
+    if not isempty(figInfo['data']) and figInfo['xmode'] != xmode:
+        error('Cannot mix time and numeric x values in the same figure')
 
-        for marker_shortname, marker_fullname in fmt_marker.iteritems():
-            marker = regexprep(marker,marker_shortname,marker_fullname)
-    else:
-        error('Badly formatted plot_fmt')
+    figInfo['xmode'] = xmode
+    return x
 
-    if isempty(srch.group('alpha')):
-        alpha = 1
-    else:
-        alpha = float(regexprep(srch.group('alpha'),'\[alpha:([01]\.[0-9]+)\]','$1'))
 
-    color_str = fmt_color[color]
+# --------------------------------------------------------------------------------
+def append_points(figIdx, series, x, y, capacity=None, plot_fmt='b'):
+    # Appends points to series `series` (1-based) of figure figIdx, which then
+    # keeps only its last `capacity` points, e.g. for a figure with the last hour
+    # of a process that runs for days. The points are kept in preallocated ring
+    # buffers, so appending does not allocate, and the exporters only see (and
+    # write) the points in the window. A series one past the last one is created,
+    # with plot_fmt, and a series from plot() keeps its last `capacity` points.
+    # capacity is only needed the first time points are appended to a series.
+    global db_figIdx, db_figInfo
 
-    if alpha < 1:
-        color_str = regexprep(color_str,'rgb\(([^\(]+)\)',sprintf('rgba($1, %g)',alpha))
+    if figIdx > len(db_figInfo) or not isinstance(db_figInfo[figIdx-1]['data'], list):
+        figure(figIdx)
 
-    if (not db_figInfo[db_figIdx-1]['hold_on']) or (not isinstance(db_figInfo[db_figIdx-1]['data'], list)):
-        clf()
+    figInfo = db_figInfo[figIdx-1]
+    Id = series - 1
+    if Id < 0 or Id > length(figInfo['data']):
+        error('Series %i not present in figure %i', series, figIdx)
 
-    db_figInfo[db_figIdx-1]['data'].append({'x':x,'y':y})
-    db_figInfo[db_figIdx-1]['linestyles'].append(linestyle)
-    db_figInfo[db_figIdx-1]['colors'].append(color_str)
-    db_figInfo[db_figIdx-1]['markers'].append(marker)
+    x = as_vector(__x_values(figInfo, x))
+    y = as_vector(y)
+    if len(x) != len(y):
+        error('x and y must have the same number of elements')
+
+    rings = figInfo.setdefault('rings', {})
+    if Id not in rings:
+        if capacity is None:
+            error('append_points() needs the capacity of series %i', series)
+        rings[Id] = (RingBuffer(capacity), RingBuffer(capacity))
+
+        if Id == length(figInfo['data']):
+            __append_series(figIdx, rings[Id][0].values(), rings[Id][1].values(), parse_plot_fmt(plot_fmt))
+        else:
+            rings[Id][0].append(figInfo['data'][Id]['x'])
+            rings[Id][1].append(figInfo['data'][Id]['y'])
+
+    (x_ring, y_ring) = rings[Id]
+    x_ring.append(x)
+    y_ring.append(y)
+
+    # Views of the ring buffers, with the points in order
+    figInfo['data'][Id]['x'] = x_ring.values()
+    figInfo['data'][Id]['y'] = y_ring.values()
+    figure_changed(figIdx)
+
+
+# --------------------------------------------------------------------------------
+def events(x, descr, y=None):
+    global db_figIdx, db_figInfo
+
+    if db_figIdx == -1:
+        db_figIdx = 1
+
+    if db_figIdx > len(db_figInfo):
+        figure(db_figIdx)
+
+    # events(x, 'descr') for a single event, or events(x_list, descr_list) for
+    # several ones. Each event is shown as a vertical line at x, with its
+    # description next to it, at height y if given. x can also be times.
+    if ischar(descr):
+        x     = [x]
+        descr = [descr]
+        y     = None if y is None else [y]
+
+    x = time_to_ms(x) if is_time_vector(x) else as_vector(x)
+    descr = list(descr)
+    if length(x) != length(descr):
+        error('events() needs as many descriptions as x values')
+
+    if y is not None:
+        y = as_vector(y)
+        if length(y) != length(x):
+            error('events() needs as many y values as x values')
+
+    for I in range(0,length(descr)):
+        evt = {'x':float(x[I]), 'descr':descr[I]}
+        if y is not None:
+            evt['y'] = float(y[I])
+        db_figInfo[db_figIdx-1]['events'].append(evt)
+    figure_changed(db_figIdx)
 
 
 # --------------------------------------------------------------------------------
@@ -257,6 +473,7 @@ def title(str):
         db_figIdx = 1
 
     db_figInfo[db_figIdx-1]['title'] = str
+    figure_changed(db_figIdx)
 
 
 # --------------------------------------------------------------------------------
@@ -267,6 +484,7 @@ def xlabel(str):
         db_figIdx = 1
 
     db_figInfo[db_figIdx-1]['xlabel'] = str
+    figure_changed(db_figIdx)
         
 
 # --------------------------------------------------------------------------------
@@ -277,6 +495,7 @@ def ylabel(str):
         db_figIdx = 1
 
     db_figInfo[db_figIdx-1]['ylabel'] = str
+    figure_changed(db_figIdx)
 
 # --------------------------------------------------------------------------------
 def get_active_figures():
@@ -298,7 +517,108 @@ def axisset(axis_idx, axis_vals):
             db_figInfo.append(__newfig('disabled'))
             
     for I in range(0,len(axis_idx)):
-        db_figInfo[db_figIdx-1]['axislim'][axis_idx[I]-1] = axis_vals[I]
+        axis_val = axis_vals[I]
+        if is_time_vector([axis_val]):
+            axis_val = time_to_ms([axis_val])[0]
+        db_figInfo[db_figIdx-1]['axislim'][axis_idx[I]-1] = axis_val
+    figure_changed(db_figIdx)
+
+# --------------------------------------------------------------------------------
+def save_figures(filename):
+    # Saves all the figures to filename (an .npz file), so that they can be
+    # exported later with load_figures(), without preparing the data again
+    write_figure_store(filename, db_figInfo, db_figIdx)
+
+# --------------------------------------------------------------------------------
+def load_figures(filename, lazy=True):
+    # Replaces all the figures with the ones saved by save_figures(). With lazy,
+    # the data of the series is memory-mapped from the file, and only read from
+    # disk as it is used.
+    global db_figIdx, db_figInfo
+
+    figInfos, figIdx = read_figure_store(filename, lazy)
+
+    # db_figInfo is updated in place, as the output_to_* modules hold on to it
+    db_figInfo[:] = figInfos
+    db_figIdx = figIdx
+    forget_figure()
+
+# --------------------------------------------------------------------------------
+def output(figIdx, backend='flot', *args, **kwargs):
+    # Exports figure figIdx with the given backend, e.g. output(1, 'flot', 'plot.html').
+    # The backend module is only imported the first time it is used.
+    with memory_phase(figIdx, backend):
+        return get_backend(backend)(figIdx, *args, **kwargs)
+
+def output_to_flot(figIdx, *args, **kwargs):
+    return output(figIdx, 'flot', *args, **kwargs)
+
+def output_to_nvd3(figIdx, *args, **kwargs):
+    return output(figIdx, 'nvd3', *args, **kwargs)
+
+def output_to_matplotlib(figIdx, *args, **kwargs):
+    return output(figIdx, 'matplotlib', *args, **kwargs)
+
+def output_to_png(figIdx, *args, **kwargs):
+    return output(figIdx, 'png', *args, **kwargs)
+
+# --------------------------------------------------------------------------------
+def export(figIdx, targets, num_workers=1):
+    # Exports figure figIdx with several backends at once, e.g.
+    #    export(1, {'flot': 'plot.html', 'nvd3': 'widget.html', 'png': 'report.png'})
+    # where the value for each backend is the filename, or (filename, options) with
+    # a dict of options for that backend, e.g. ('plot.html', {'use_worker': 1}).
+    # The series are converted to JSON text once, for all the backends that need
+    # it, by the first of them (with num_workers), and then the other backends run
+    # in parallel threads, except for matplotlib, which runs on this thread.
+    # Backends given num_workers > 1 in their options also run first, on this
+    # thread, as their worker processes must not be forked while other threads
+    # are running.
+    series_cache = {}
+
+    jobs = []
+    for backend in sorted(targets.keys()):
+        if ischar(targets[backend]) or targets[backend] is None:
+            (filename, options) = (targets[backend], {})
+        else:
+            (filename, options) = (targets[backend][0], dict(targets[backend][1]))
+
+        if backend in __json_backends:
+            options['series_cache'] = series_cache
+
+        # The backends are imported here, as imports from several threads would
+        # wait for each other anyway
+        jobs.append((get_backend(backend), backend, () if filename is None else (filename,), options))
+
+    first_jobs = [job for job in jobs if job[1] in __json_backends][0:1]
+    for (export_fn, backend, args, options) in first_jobs:
+        options.setdefault('num_workers', num_workers)
+    first_jobs += [job for job in jobs if job not in first_jobs and job[3].get('num_workers', 1) > 1]
+
+    for (export_fn, backend, args, options) in first_jobs:
+        __run_export(export_fn, backend, figIdx, args, options)
+
+    other_jobs = [job for job in jobs if job not in first_jobs]
+    pool = ThreadPool(max(len(other_jobs), 1))
+    try:
+        results = [pool.apply_async(__run_export, (export_fn, backend, figIdx, args, options))
+                   for (export_fn, backend, args, options) in other_jobs if backend not in __pyplot_backends]
+
+        for (export_fn, backend, args, options) in other_jobs:
+            if backend in __pyplot_backends:
+                __run_export(export_fn, backend, figIdx, args, options)
+
+        # Raises the first error of the threads, if any
+        for result in results:
+            result.get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def __run_export(export_fn, backend, figIdx, args, options):
+    with memory_phase(figIdx, backend):
+        export_fn(figIdx, *args, **options)
 
 # --------------------------------------------------------------------------------
 def open_html_file(html_file):
@@ -319,6 +639,14 @@ def debug_print_info():
     print "db_figInfo = "
     print db_figInfo
 
+# --------------------------------------------------------------------------------
+if __name__ == '__main__':
+    # python -m matlab_plot_functions render spec.json, see plot_cli.py. It imports
+    # this file again as matlab_plot_functions, and works with that copy.
+    import sys
+    import plot_cli
+    sys.exit(plot_cli.main(sys.argv[1:]))
+
 
 
 
@@ -0,0 +1,259 @@
+"""
+   Module to be used with output_to_flot.py and output_to_nvd3.py, for writing
+   the JSON data files and the HTML pages.
+
+   Files are written to a temporary file in the same folder, and moved in place
+   when closed, so that a web server never serves a partially written file.
+   Optionally, the final name includes a hash of the contents, e.g.
+   data/plot.3f2a9c0b1d4e5f60.json, so that each version of a data file has its
+   own name, and can be served with "Cache-Control: immutable". Older versions
+   are deleted once they are past a retention period.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import os
+import re
+import time
+import glob
+import hashlib
+import tempfile
+from os import path
+
+from matlab_utils import *
+
+# Number of hex digits of the content hash used in file names
+__hash_len = 16
+
+# --------------------------------------------------------------------------------
+class OutputFile(object):
+    # File-like object to be used with fprintf() and fclose(). After fclose(),
+    # the name attribute holds the final name of the file.
+    #
+    # Readers never see a partially written file: the contents go to a temporary
+    # file in the same folder, which is flushed to disk and then renamed over the
+    # target in one step. If the process dies before fclose(), the previous
+    # version of the file stays in place.
+    #
+    # The temporary file is only created once there is something to write to it.
+    # Used as a context manager, e.g.
+    #    with OutputFile(filename) as fid:
+    #        fprintf(fid, ...)
+    #        fclose(fid)
+    # an error before fclose() drops the temporary file, see abort().
+
+    # The many small fprintf() calls are gathered and written in pieces of at
+    # least this many characters
+    buffer_size = 1 << 20
+
+    def __init__(self, filename, content_hash=0):
+        self.name = filename
+        self.content_hash = content_hash
+        self.hasher = hashlib.sha1() if content_hash else None
+
+        self.buffer = []
+        self.buffer_len = 0
+
+        self.tmp_file = None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+        return False
+
+    def __open_tmp_file(self):
+        out_dir = path.dirname(self.name)
+        self.tmp_file = tempfile.NamedTemporaryFile(mode='w', dir=out_dir if out_dir else '.',
+                                                    prefix='.'+path.basename(self.name)+'.',
+                                                    suffix='.tmp', delete=False)
+
+    def write(self, text):
+        self.buffer.append(text)
+        self.buffer_len += len(text)
+        if self.buffer_len >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer_len == 0:
+            return
+
+        text = ''.join(self.buffer)
+        self.buffer = []
+        self.buffer_len = 0
+
+        if self.tmp_file is None:
+            self.__open_tmp_file()
+        self.tmp_file.write(text)
+        if self.hasher is not None:
+            self.hasher.update(text)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+
+        self.flush()
+        if self.tmp_file is None:
+            self.__open_tmp_file()  # empty file
+        self.tmp_file.flush()
+        os.fsync(self.tmp_file.fileno())
+        self.tmp_file.close()
+
+        if self.content_hash:
+            self.name = hashed_filename(self.name, self.hasher.hexdigest())
+            if path.exists(self.name):
+                # Same contents as a file that is already in place
+                os.remove(self.tmp_file.name)
+                return
+
+        # Temporary files are only readable by the owner; use the same permissions
+        # as a file created with open()
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.tmp_file.name, 0o666 & ~umask)
+
+        replace_file(self.tmp_file.name, self.name)
+
+    def abort(self):
+        # Drops everything written so far, leaving any existing file untouched
+        if self.closed:
+            return
+        self.closed = True
+
+        self.buffer = []
+        self.buffer_len = 0
+        if self.tmp_file is not None:
+            self.tmp_file.close()
+            if path.exists(self.tmp_file.name):
+                os.remove(self.tmp_file.name)
+
+
+# --------------------------------------------------------------------------------
+def replace_file(src_filename, dst_filename):
+    # Renames src_filename to dst_filename, replacing it if it exists, and makes
+    # sure the rename itself is on disk
+    if hasattr(os, 'replace'):
+        os.replace(src_filename, dst_filename)
+    else:
+        # Python 2: rename() replaces the target in one step on POSIX, but fails on
+        # Windows if it exists
+        if os.name == 'nt' and path.exists(dst_filename):
+            os.remove(dst_filename)
+        os.rename(src_filename, dst_filename)
+
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(path.dirname(dst_filename) or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# --------------------------------------------------------------------------------
+def hashed_filename(filename, hash_str):
+    # data/plot.json -> data/plot.<hash>.json
+    base, ext = path.splitext(filename)
+    return sprintf('%s.%s%s', base, hash_str[0:__hash_len], ext)
+
+
+# --------------------------------------------------------------------------------
+def remove_old_versions(filename, current_filenames, retention_days):
+    # Deletes the content-hashed versions of filename (including their chunk,
+    # segment and points files) that are not in current_filenames and were
+    # replaced more than retention_days ago. Pages that are still open, or
+    # cached, can keep loading the version they refer to until then.
+    #
+    # The time a version was replaced is not the time it was written, which can
+    # be long before, so it is kept in a small index next to filename, e.g.
+    # data/.plot.json.replaced, with one "<time> <file name>" line per version.
+    # A version first seen as not current is taken as replaced now.
+    base, ext = path.splitext(filename)
+    version_pattern = re.compile(re.escape(path.basename(base)) + '(\.(chunk|seg|points)\d+)?\.[0-9a-f]{%i}' % __hash_len
+                                 + re.escape(ext) + '$')
+    index_filename = path.join(path.dirname(filename), '.' + path.basename(filename) + '.replaced')
+
+    current_filenames = set([path.normpath(f) for f in current_filenames])
+    now = time.time()
+
+    replaced_times = __read_replaced_index(index_filename)
+    new_replaced_times = {}
+
+    for version_filename in glob.glob(base + '.*' + ext):
+        version_name = path.basename(version_filename)
+        if not version_pattern.match(version_name):
+            continue
+        if path.normpath(version_filename) in current_filenames:
+            continue
+
+        replaced_time = replaced_times.get(version_name, now)
+        if now - replaced_time >= retention_days*24*3600:
+            os.remove(version_filename)
+        else:
+            new_replaced_times[version_name] = replaced_time
+
+    if new_replaced_times == replaced_times:
+        return
+
+    if not new_replaced_times:
+        os.remove(index_filename)
+        return
+
+    with OutputFile(index_filename) as fid:
+        for version_name in sorted(new_replaced_times):
+            fprintf(fid, '%i %s\n', int(new_replaced_times[version_name]), version_name)
+        fclose(fid)
+
+
+# --------------------------------------------------------------------------------
+def __read_replaced_index(index_filename):
+    # The index of remove_old_versions(), as a dict of file name -> time replaced
+    replaced_times = {}
+    if not path.exists(index_filename):
+        return replaced_times
+
+    with open(index_filename) as fid:
+        for line in fid:
+            fields = line.split(' ', 1)
+            if len(fields) == 2:
+                replaced_times[fields[1].strip()] = float(fields[0])
+    return replaced_times
+
+
+# --------------------------------------------------------------------------------
+def remove_unused_parts(filename, current_filenames):
+    # Deletes the chunk and points files of filename without a content hash, e.g.
+    # data/plot.chunk12.json, that are not in current_filenames, as left by an
+    # earlier export with more chunks, or with progressive or scatter_density on.
+    # Unlike hashed versions, these are rewritten in place, so none are kept.
+    base, ext = path.splitext(filename)
+    part_pattern = re.compile(re.escape(path.basename(base)) + '\.(chunk|points)\d+' + re.escape(ext) + '$')
+
+    current_filenames = set([path.normpath(f) for f in current_filenames])
+
+    for part_filename in glob.glob(base + '.*' + ext):
+        if part_pattern.match(path.basename(part_filename)) and path.normpath(part_filename) not in current_filenames:
+            os.remove(part_filename)
@@ -0,0 +1,159 @@
+"""
+   Checks of the functions in output_files.py, run with
+      python output_files_test.py
+   or with pytest.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+"""
+
+import os
+import time
+import shutil
+import tempfile
+from os import path
+
+from matlab_utils import *
+from output_files import OutputFile, hashed_filename, remove_old_versions, remove_unused_parts
+
+# --------------------------------------------------------------------------------
+def test_output_file_replace():
+    # The file only changes once fclose() is called, and no temporary file is left
+    folder = tempfile.mkdtemp()
+    try:
+        filename = path.join(folder, 'plot.json')
+        __write_file(filename, 'old')
+
+        with OutputFile(filename) as fid:
+            fprintf(fid, '%s', 'new')
+            fid.flush()
+            assert __read_file(filename) == 'old'
+            fclose(fid)
+
+        assert __read_file(filename) == 'new'
+        assert os.listdir(folder) == ['plot.json']
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_output_file_abort():
+    # An error before fclose() leaves the previous file in place, and removes the
+    # temporary file, also once it holds more than a buffer of text
+    folder = tempfile.mkdtemp()
+    try:
+        filename = path.join(folder, 'plot.json')
+        __write_file(filename, 'old')
+
+        try:
+            with OutputFile(filename) as fid:
+                fprintf(fid, '%s', 'x' * (OutputFile.buffer_size + 1))
+                assert len(os.listdir(folder)) == 2
+                error('Export failed')
+        except Exception:
+            pass
+
+        assert __read_file(filename) == 'old'
+        assert os.listdir(folder) == ['plot.json']
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_output_file_content_hash():
+    # With content_hash, the file is named after its contents, and writing the
+    # same contents again gives the same file
+    folder = tempfile.mkdtemp()
+    try:
+        filename = path.join(folder, 'plot.json')
+
+        v1 = __write_version(filename, 'v1')
+        assert v1 != filename and path.dirname(v1) == folder
+        assert __read_file(v1) == 'v1'
+        assert __write_version(filename, 'v1') == v1
+        assert __write_version(filename, 'v2') != v1
+        assert not path.exists(filename)
+    finally:
+        shutil.rmtree(folder)
+
+
+# --------------------------------------------------------------------------------
+def test_remove_old_versions():
+    # Versions are kept for retention_days after they stop being current, however
+    # long ago they were written
+    folder = tempfile.mkdtemp()
+    try:
+        filename = path.join(folder, 'plot.json')
+        index_filename = path.join(folder, '.plot.json.replaced')
+        days_ago = lambda days: time.time() - days*24*3600
+
+        v1 = __write_version(filename, 'v1')
+        os.utime(v1, (days_ago(30), days_ago(30)))
+        v2 = __write_version(filename, 'v2')
+        remove_old_versions(filename, [v2], 7)
+        assert path.exists(v1) and path.exists(v2)
+        assert path.basename(v1) in __read_file(index_filename)
+
+        # v1 replaced 10 days ago
+        __write_file(index_filename, sprintf('%i %s\n', int(days_ago(10)), path.basename(v1)))
+        v3 = __write_version(filename, 'v3')
+        remove_old_versions(filename, [v3], 7)
+        assert not path.exists(v1) and path.exists(v2) and path.exists(v3)
+        assert path.basename(v1) not in __read_file(index_filename)
+
+        # Other files next to them are left alone
+        others = [filename, path.join(folder, 'other.0123456789abcdef.json'), hashed_filename(filename, '0'*40) + '.bak']
+        for other in others:
+            __write_file(other, 'other')
+
+        remove_old_versions(filename, [v3], 0)
+        assert not path.exists(v2) and path.exists(v3)
+        assert not path.exists(index_filename)
+        assert all([path.exists(other) for other in others])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_remove_unused_parts():
+    # Only the chunk and points files without a content hash that are not current
+    # are removed
+    folder = tempfile.mkdtemp()
+    try:
+        filename = path.join(folder, 'plot.json')
+        names = ['plot.json', 'plot.chunk1.json', 'plot.chunk2.json', 'plot.points1.json',
+                 'plot.chunk3.0123456789abcdef.json', 'other.chunk1.json']
+        for name in names:
+            __write_file(path.join(folder, name), name)
+
+        remove_unused_parts(filename, [filename, path.join(folder, 'plot.chunk1.json')])
+
+        assert sorted(os.listdir(folder)) == sorted(['plot.json', 'plot.chunk1.json',
+                                                     'plot.chunk3.0123456789abcdef.json', 'other.chunk1.json'])
+    finally:
+        shutil.rmtree(folder)
+
+
+# --------------------------------------------------------------------------------
+def __write_version(filename, text):
+    with OutputFile(filename, content_hash=1) as fid:
+        fprintf(fid, '%s', text)
+        fclose(fid)
+    return fid.name
+
+
+def __write_file(filename, text):
+    fid = open(filename, 'w')
+    fid.write(text)
+    fid.close()
+
+
+def __read_file(filename):
+    fid = open(filename, 'r')
+    try:
+        return fid.read()
+    finally:
+        fid.close()
+
+
+if __name__ == '__main__':
+    for check in [test_output_file_replace, test_output_file_abort, test_output_file_content_hash,
+                  test_remove_old_versions, test_remove_unused_parts]:
+        check()
+    print('All output_files.py checks passed')
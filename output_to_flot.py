@@ -23,16 +23,77 @@
    SOFTWARE.
 """
 
+import json
 from os import path, makedirs
-from numpy import nan, isnan
+from collections import OrderedDict
+from numpy import nan, isnan, isfinite, floor
 
 from matlab_utils import *
 from matlab_plot_functions import db_figIdx, db_figInfo
+from figure_usage import figure_exported
+from plot_encoding import as_vector, num_str_array, mark_gaps, xy_pairs_str, xy_pairs_strs, cached_xy_pairs_strs, \
+                          encoding_pool, decimate_minmax, split_xy, series_groups, concat_with_gaps, data_domain, series_stats
+from plot_density import density_grid, coarse_counts, density_png, png_data_uri
+from svg_snapshot import figure_to_svg
+from plot_worker import get_worker_str_array, get_worker_client_str_array
+from plot_runtime import write_runtime_file, copy_vendored_files, page_url
+from output_files import OutputFile, remove_old_versions, remove_unused_parts
+from plot_memory import memory_phase, note_temporary
+from plot_append import manifest_filename_for, read_manifest, write_manifest, new_manifest, \
+                        appended_points, add_segment, remove_segments
 
 # --------------------------------------------------------------------------------
-def output_to_flot(figIdx, html_filename, json_filename='', flot_folder='flot', extra_str=''):
+def output_to_flot(figIdx, html_filename, json_filename='', flot_folder='flot', extra_str='', use_worker=0,
+                   progressive=0, num_chunks=10, svg_snapshot=0, content_hash=0, retention_days=7,
+                   append=0, compact_every=30, num_workers=1, time_offsets=0, scatter_density=0, merge_series=1,
+                   series_cache=None, data_stats=1):
     global db_figIdx, db_figInfo
 
+    # In progressive mode, the JSON file only has a coarse overview of each series,
+    # and the full resolution data goes to num_chunks chunk files, which the page
+    # streams in after drawing the overview
+    overview_buckets = 500
+
+    # With content_hash, the data files are named after a hash of their contents,
+    # e.g. data/plot.3f2a9c0b1d4e5f60.json, so that they never change once written
+    # and can be cached indefinitely. Versions that are no longer current are
+    # deleted after retention_days.
+
+    # In append mode, when the only change since the last export is that points
+    # were added to the end of the series, just the new points are written, to a
+    # segment file that the page appends to the data of the JSON file. Once there
+    # are compact_every segments, the JSON file is written in full again.
+
+    # With num_workers > 1, the series are converted to JSON text by that many
+    # worker processes, and then written in order.
+
+    # With scatter_density > 0, series with markers and more points than that are
+    # drawn as a density image of their points (without the line), which the page
+    # swaps for the markers once the zoomed range has at most that many points.
+    # The points themselves go to a separate file, only loaded at that point.
+
+    # With merge_series, the series without a legend label that look the same are
+    # written as a single series, with gaps between them, so that thousands of
+    # small series cost about as much as a few large ones. Not in append mode, as
+    # the segments add points to each series of the figure.
+
+    # series_cache is a dict shared with other exporters of the same figure, see
+    # export() in matlab_plot_functions.py, so that each series is only converted
+    # to JSON text once.
+
+    # With data_stats, each series carries the range and count of its points,
+    # and whether its x values are sorted, see series_stats(). The page uses them
+    # to bound zooming out, and to find the point under the mouse of the sorted
+    # series by binary search. Not in append mode, where the segments add points
+    # that they would not cover.
+    stats_index_points = 64
+
+    if progressive and use_worker:
+        error('progressive and use_worker cannot be used together')
+
+    if append and (progressive or use_worker or time_offsets or scatter_density):
+        error('append cannot be used together with progressive, use_worker, time_offsets or scatter_density')
+
     if db_figIdx == -1:
         db_figIdx = 1
 
@@ -47,114 +108,320 @@ def output_to_flot(figIdx, html_filename, json_filename='', flot_folder='flot',
         if not path.exists(data_dir):
             makedirs(data_dir)
 
-    # ----------------------------
-    fid = fopen(json_filename,'w')
-
-    fprintf(fid,'{\n')
-
     if figIdx > length(db_figInfo):
         error('Figure %i not present', figIdx)
 
     # Helper functions
-    num_fmt_array = ['%g', '%i']
-    isint         = lambda x: (floor(x)==x)
-    num_fmt       = lambda x: num_fmt_array[isint(x)]
-    num_str       = lambda x: sprintf(num_fmt(x),x)
     use_comma_if  = lambda test: ', ' if test else ''
     
     # Start printing info about figIdx
     figInfo = db_figInfo[figIdx-1]
 
-    # Title
-    if not isempty(figInfo['title']):
-        fprintf(fid,'  "title": "%s",\n', figInfo['title'])
+    # With time_offsets, the x values of a time axis are written as offsets from
+    # the first time, see "xbase" below
+    xbase = 0
+    if time_offsets and figInfo['xmode'] == 'time':
+        xmin = data_domain(figInfo)[0][0]
+        if isfinite(xmin):
+            xbase = floor(xmin)
 
-    # x & y labels
-    if not isempty(figInfo['xlabel']):
-        fprintf(fid,'  "xlabel": "%s",\n', figInfo['xlabel'])
+    # Static image of the plot to show until the data is loaded, if requested
+    if svg_snapshot:
+        snapshot_str = figure_to_svg(figInfo, 750, 450, svg_id='placeholder2_snapshot')
+    else:
+        snapshot_str = ''
 
-    if not isempty(figInfo['ylabel']):
-        fprintf(fid,'  "ylabel": "%s",\n', figInfo['ylabel'])
+    if append:
+        manifest_filename = manifest_filename_for(json_filename)
+        manifest = read_manifest(manifest_filename)
+        start_idx = appended_points(manifest, figInfo, extra_str)
 
-    # legend location
-    if not isempty(figInfo['legend_pos']) and not isempty(figInfo['legend_pos']['location']):
-        fprintf(fid,'  "legend_pos": "%s",\n', figInfo['legend_pos']['location'])
-  
-        if not isempty(figInfo['legend_pos']['xy_margin']):
-            fprintf(fid,'  "legend_xy_margin": %s,\n', figInfo['legend_pos']['xy_margin'])
+        if start_idx is not None and length(manifest['segments']) < compact_every:
+            new_points = [(as_vector(series['x'])[Ip:], as_vector(series['y'])[Ip:])
+                          for (series, Ip) in zip(figInfo['data'], start_idx)]
+
+            if any([len(x) > 0 for (x, y) in new_points]):
+                # Missing points at either end are kept as gaps, as they are
+                # between the points of other segments
+                segment_strs = xy_pairs_strs(new_points, num_workers, trim_gaps=0)
+
+                with OutputFile(sprintf('%s.seg%i.json', regexprep(json_filename,'\.json$',''), manifest['next_segment']),
+                                content_hash) as fid:
+                    fprintf(fid,'{\n  "all_data": [\n')
+                    fprintf(fid,'%s\n', ', \n'.join(['     ' + s for s in segment_strs]))
+                    fprintf(fid,'   ]\n}\n')
+                    fclose(fid)
+
+                add_segment(manifest, figInfo, fid.name)
+                write_manifest(manifest_filename, manifest)
 
-    # axis limits
-    axis_lim_descr = ["xmin", "xmax", "ymin", "ymax"]
-    for I in range(0,length(axis_lim_descr)):
-        if not isnan(figInfo['axislim'][I]):
-            fprintf(fid,'  "%s": %g,\n', axis_lim_descr[I], figInfo['axislim'][I])
+            create_html_for_flot(html_filename, page_url(manifest['base'], html_filename), flot_folder, use_worker,
+                                 snapshot_str, [page_url(f, html_filename) for f in manifest['segments']])
+            figure_exported(figIdx)
+            return
 
-    # Data
-    fprintf(fid,'  "all_data": [\n')
+    # Density images, and the files with their points
+    series_xy = [(as_vector(series['x']) - xbase, as_vector(series['y'])) for series in figInfo['data']]
 
+    density_strs = {}
+    density_stats = {}
+    points_filenames = []
     for Id in range(0,length(figInfo['data'])):
-        fprintf(fid,'     {\n') 
-        if not isempty(figInfo['legend']) and not isempty(figInfo['legend'][Id]):
-            fprintf(fid,'       "label": "%s",\n', figInfo['legend'][Id])
+        if scatter_density <= 0 or isempty(figInfo['markers'][Id]) or len(series_xy[Id][0]) <= scatter_density:
+            continue
 
-        if figInfo['linestyles'][Id] == '--':
-            fprintf(fid,'       "dashes": { "show": "true" },\n')
-        else:
-            # For now, everything that isn't a dashed line is a solid line
-            fprintf(fid,'       "lines": { "show": "true" },\n')
+        # The points file and the image are in the actual x values, without xbase
+        (x, y) = (as_vector(figInfo['data'][Id]['x']), series_xy[Id][1])
+
+        points_str = xy_pairs_str(x, y)
+        with OutputFile(sprintf('%s.points%i.json', regexprep(json_filename,'\.json$',''), Id+1), content_hash) as fid:
+            fprintf(fid,'{\n  "data": %s\n}\n', points_str)
+            fclose(fid)
+        points_filenames.append(fid.name)
+
+        # Without an index, as the page does not have the points to search
+        density_stats[Id] = series_stats(x, y)
+
+        (counts, extent) = density_grid(x, y)
+        density_strs[Id] = sprintf('{ "image": "%s", "extent": %s, "cells": %s, "max_points": %i, "points_url": "%s" }',
+                                   png_data_uri(density_png(counts, figInfo['colors'][Id])),
+                                   json.dumps([float(v) for v in extent]),
+                                   json.dumps(coarse_counts(counts).astype(int).tolist()),
+                                   scatter_density, page_url(fid.name, html_filename))
+
+        # In place of the points, the corners of the image, so that Flot scales
+        # the axes to fit it
+        series_xy[Id] = (as_vector(extent[0:2]) - xbase, as_vector(extent[2:4]))
+
+    if merge_series and not append:
+        groups = series_groups(figInfo, density_strs.keys())
+    else:
+        groups = [[Id] for Id in range(0,length(figInfo['data']))]
+    series_xy = [concat_with_gaps([series_xy[Id] for Id in group]) for group in groups]
+    note_temporary('series_xy', series_xy)
+
+    # The overview of progressive mode does not have the points of the index
+    if data_stats and not append:
+        stats_strs = [json.dumps(density_stats[group[0]] if group[0] in density_stats else
+                                 series_stats(x, y, figInfo['bar_widths'][group[0]],
+                                              0 if progressive else stats_index_points, xbase), sort_keys=True)
+                      for (group, (x, y)) in zip(groups, series_xy)]
+    else:
+        stats_strs = []
+
+    # The chunk files are written first, so they exist once the page can see them
+    if progressive:
+        chunk_filenames = [sprintf('%s.chunk%i.json', regexprep(json_filename,'\.json$',''), Ic)
+                           for Ic in range(1,num_chunks+1)]
+
+        # The gaps are marked before splitting, so those at the edges of chunks are kept
+        series_chunks = [split_xy(*(mark_gaps(x, y) + (num_chunks,))) if group[0] not in density_strs
+                         else split_xy(x[0:0], y[0:0], num_chunks)
+                         for (group, (x, y)) in zip(groups, series_xy)]
+
+        # Data
+        series_xy = [decimate_minmax(*(mark_gaps(x, y) + (overview_buckets,))) for (x, y) in series_xy]
+
+        # The same workers encode the chunks and the overview: chunk Ic of each
+        # series, then the overview of each series
+        num_series = length(series_xy)
+        all_series = [chunks[Ic] for Ic in range(0,num_chunks) for chunks in series_chunks] + series_xy
+        with encoding_pool(all_series, num_workers, [None]*(num_chunks*num_series) + [1]*num_series) as encode:
+            with memory_phase(figIdx, 'flot.chunks'):
+                for Ic in range(0,num_chunks):
+                    chunk_strs = encode(range(Ic*num_series, (Ic+1)*num_series))
+                    note_temporary('chunk_strs', chunk_strs)
+
+                    with OutputFile(chunk_filenames[Ic], content_hash) as fid:
+                        fprintf(fid,'{\n  "all_data": [\n')
+                        fprintf(fid,'%s\n', ', \n'.join(['     ' + s for s in chunk_strs]))
+                        fprintf(fid,'   ]\n}\n')
+                        fclose(fid)
+                    chunk_filenames[Ic] = fid.name
+
+            with memory_phase(figIdx, 'flot.encode'):
+                data_strs = encode(range(num_chunks*num_series, (num_chunks+1)*num_series))
+                note_temporary('data_strs', data_strs)
+    else:
+        chunk_filenames = []
+
+        # Data. In append mode, a missing run at the end is kept as a gap, as more
+        # points may follow in segments
+        with memory_phase(figIdx, 'flot.encode'):
+            keys = [('density' if group[0] in density_strs else 'pairs', tuple(group), xbase) for group in groups]
+            data_strs = cached_xy_pairs_strs(series_xy, keys, series_cache, num_workers, trim_gaps=not append)
+            note_temporary('data_strs', data_strs)
+
+    (all_events, data_extra_str) = __merged_events(figInfo['events'], extra_str)
+
+    # ----------------------------
+    with OutputFile(json_filename, content_hash) as fid:
+        fprintf(fid,'{\n')
 
-        if not isempty(figInfo['markers'][Id]):
-            fprintf(fid,'       "points": { "symbol": "%s", "show": "true" },\n',figInfo['markers'][Id])
+        # Title
+        if not isempty(figInfo['title']):
+            fprintf(fid,'  "title": "%s",\n', figInfo['title'])
 
-        fprintf(fid,'       "color": "%s",\n', figInfo['colors'][Id])
+        # x & y labels
+        if not isempty(figInfo['xlabel']):
+            fprintf(fid,'  "xlabel": "%s",\n', figInfo['xlabel'])
+
+        if not isempty(figInfo['ylabel']):
+            fprintf(fid,'  "ylabel": "%s",\n', figInfo['ylabel'])
+
+        # legend location
+        if not isempty(figInfo['legend_pos']) and not isempty(figInfo['legend_pos']['location']):
+            fprintf(fid,'  "legend_pos": "%s",\n', figInfo['legend_pos']['location'])
   
-        # ------------------------------------------------------------------------
-        # I^th data
-        x = figInfo['data'][Id]['x']
-        y = figInfo['data'][Id]['y']
+            if not isempty(figInfo['legend_pos']['xy_margin']):
+                fprintf(fid,'  "legend_xy_margin": %s,\n', figInfo['legend_pos']['xy_margin'])
+
+        # axis limits
+        axis_lim_descr = ["xmin", "xmax", "ymin", "ymax"]
+        for I in range(0,length(axis_lim_descr)):
+            if not isnan(figInfo['axislim'][I]):
+                fprintf(fid,'  "%s": %s,\n', axis_lim_descr[I], num_str_array([figInfo['axislim'][I]])[0])
+
+        # time x axis, in milliseconds since 1970-01-01 UTC. With time_offsets, the
+        # x values are written relative to xbase, which keeps them short.
+        if figInfo['xmode'] == 'time':
+            fprintf(fid,'  "xmode": "time",\n')
+            if xbase != 0:
+                fprintf(fid,'  "xbase": %s,\n', num_str_array([xbase])[0])
+
+        # events
+        if not isempty(all_events):
+            fprintf(fid,'  "events": [\n%s\n  ],\n', ', \n'.join(
+                ['    ' + json.dumps(evt, sort_keys=True) for evt in sorted(all_events, key=lambda evt: evt['x'])]))
+
+        # chunk files with the full resolution data, in progressive mode
+        if progressive:
+            fprintf(fid,'  "chunks": [%s],\n', ', '.join(['"' + page_url(f, html_filename) + '"' for f in chunk_filenames]))
+
+        fprintf(fid,'  "all_data": [\n')
+
+        for Ig in range(0,length(groups)):
+            Id = groups[Ig][0]
+            fprintf(fid,'     {\n') 
+            if not isempty(figInfo['legend']) and not isempty(figInfo['legend'][Id]):
+                fprintf(fid,'       "label": "%s",\n', figInfo['legend'][Id])
+
+            if Id in density_strs:
+                # Neither the line nor the markers are shown, until the page swaps the
+                # image for the markers
+                fprintf(fid,'       "lines": { "show": false },\n')
+                fprintf(fid,'       "density": %s,\n', density_strs[Id])
+            elif figInfo['plot_types'][Id] == 'bar':
+                fprintf(fid,'       "bars": { "show": "true", "align": "center", "fill": 0.6, "barWidth": %s },\n',
+                        num_str_array([figInfo['bar_widths'][Id]])[0])
+            elif figInfo['linestyles'][Id] == '--':
+                fprintf(fid,'       "dashes": { "show": "true" },\n')
+            else:
+                # For now, everything that isn't a dashed line is a solid line
+                fprintf(fid,'       "lines": { "show": "true" },\n')
+
+            if Id in density_strs:
+                fprintf(fid,'       "points": { "symbol": "%s", "show": false },\n',figInfo['markers'][Id])
+            elif not isempty(figInfo['markers'][Id]):
+                fprintf(fid,'       "points": { "symbol": "%s", "show": "true" },\n',figInfo['markers'][Id])
+
+            fprintf(fid,'       "color": "%s",\n', figInfo['colors'][Id])
+
+            if not isempty(stats_strs):
+                fprintf(fid,'       "stats": %s,\n', stats_strs[Ig])
   
-        data_str = '['
-        for Ix in mrange[1:length(x)]:
-            sep_str = ' ' if Ix == 1 else ', '
-            try:
-                data_str = sprintf('%s%s[%s, %s]',data_str,sep_str, num_str(x[Ix]), num_str(y[Ix]))
-            except:
-                print('Entering debugging...')
-                import pdb; pdb.set_trace()
-        data_str = sprintf('%s ]', data_str)
-
-        fprintf(fid,'       "data": %s\n', data_str)
-        # ------------------------------------------------------------------------
+            # ------------------------------------------------------------------------
+            # I^th data
+            fprintf(fid,'       "data": %s\n', data_strs[Ig])
+            # ------------------------------------------------------------------------
     
-        fprintf(fid,'     }%s\n', use_comma_if(Id != (length(figInfo['data'])-1) ))
+            fprintf(fid,'     }%s\n', use_comma_if(Ig != (length(groups)-1) ))
+
+        fprintf(fid,'   ]%s\n', use_comma_if(not isempty(data_extra_str)))
 
-    fprintf(fid,'   ]%s\n', use_comma_if(not isempty(extra_str)))
+        # Extra info passed in by user
+        if not isempty(data_extra_str):
+            fprintf(fid, data_extra_str)
 
-    # Extra info passed in by user
-    if not isempty(extra_str):
-        fprintf(fid, extra_str)
+        fprintf(fid,'}\n')
 
-    fprintf(fid,'}\n')
+        fclose(fid)
+    data_filename = fid.name
 
-    fclose(fid)
+    if content_hash:
+        remove_old_versions(json_filename, [data_filename] + chunk_filenames + points_filenames, retention_days)
+    else:
+        remove_unused_parts(json_filename, chunk_filenames + points_filenames)
+
+    # In append mode, start a new manifest, with no segments
+    if append:
+        write_manifest(manifest_filename, new_manifest(figInfo, extra_str, data_filename,
+                                                       manifest['next_segment'] if manifest else 1))
 
     # Finished saving to JSON file, now create HTML file for plotting
     #if not path.exists(html_filename):
-    create_html_for_flot(html_filename, json_filename, flot_folder)
+    create_html_for_flot(html_filename, page_url(data_filename, html_filename), flot_folder, use_worker, snapshot_str)
+
+    # The segments are now part of the JSON file. With content_hash, they are
+    # deleted by remove_old_versions() instead, once past retention_days.
+    if append and manifest and not content_hash:
+        remove_segments(manifest['segments'])
+
+    # Only once all the files are written, as set_max_figures() can then drop
+    # the data of the figure
+    figure_exported(figIdx)
 # End output_to_flot()
     
 
+# --------------------------------------------------------------------------------
+def __merged_events(events, extra_str):
+    # Pages used to get their events only through extra_str, e.g.
+    #    '"events": [ {"x": 5, "descr": "restart"} ]'
+    # which still works, also together with events(). As the JSON file cannot
+    # have "events" twice, those of extra_str are then taken out of it and
+    # written with the others. Returns (events, extra_str).
+    if isempty(events) or isempty(regexp(extra_str, '"events"\s*:')):
+        return (events, extra_str)
+
+    try:
+        extra = json.loads('{' + extra_str + '}', object_pairs_hook=OrderedDict)
+    except ValueError:
+        error('extra_str has "events", but is not JSON that they can be taken out of to add those of events()')
+
+    if 'events' not in extra:
+        return (events, extra_str)
+
+    extra_events = extra.pop('events')
+    if not isinstance(extra_events, list) or not all([isinstance(evt, dict) and 'x' in evt for evt in extra_events]):
+        error('The "events" of extra_str must be a list of objects with an "x", as from events()')
+
+    extra_str = ',\n'.join(['  ' + json.dumps(key) + ': ' + json.dumps(value) for (key, value) in extra.items()])
+    return (events + extra_events, extra_str + '\n' if extra_str else '')
+
+
 # --------------------------------------------------------------------------------    
-def create_html_for_flot(html_filename, json_filename, flot_folder='flot'):
-    fid = fopen(html_filename,'w')
+def create_html_for_flot(html_filename, json_filename, flot_folder='flot', use_worker=0, snapshot_str='',
+                         segment_filenames=[]):
+    # The plotting code goes to a runtime file shared by all the pages in the
+    # same folder, so that the HTML page itself is only a small stub.
+    # json_filename and segment_filenames are URLs for the page, see page_url().
+    html_dir = path.dirname(html_filename)
+    runtime_filename = write_runtime_file(html_dir, 'plot_runtime_flot', __get_runtime_str())
+    copy_vendored_files(html_dir, flot_folder, ['jquery.flot.axislabels.js', 'jquery.flot.dashes.js'])
 
-    html_str = __get_html_str(json_filename, flot_folder)
-    fprintf(fid,'%s\n',html_str)
+    html_str = __get_html_str(json_filename, flot_folder, use_worker, snapshot_str, runtime_filename, segment_filenames)
 
-    fclose(fid)
+    with OutputFile(html_filename) as fid:
+        fprintf(fid,'%s',html_str)
+        fclose(fid)
 
 # --------------------------------------------------------------------------------
-def __get_html_str(json_filename, flot_folder):
+def __get_html_str(json_filename, flot_folder, use_worker, snapshot_str, runtime_filename, segment_filenames):
+    # The snapshot image is positioned over the placeholder, until Flot replaces it
+    if isempty(snapshot_str):
+        placeholder_str = '               <div id="placeholder2" style="height:450px"></div>'
+    else:
+        placeholder_str = '               <div id="placeholder2" style="height:450px;position:relative;">' + snapshot_str + '</div>'
   
     str_array = [
         '<!DOCTYPE html>',
@@ -175,29 +442,81 @@ def __get_html_str(json_filename, flot_folder):
         '    <script language="javascript" type="text/javascript" src="'+flot_folder+'/jquery.flot.axislabels.js"></script>',
         '    <script language="javascript" type="text/javascript" src="'+flot_folder+'/jquery.flot.dashes.js"></script>',
         '',
+        '    <!-- Plotting code, shared by all pages -->',
+        '    <script language="javascript" type="text/javascript" src="'+runtime_filename+'"></script>',
+        '',
         '  </head>',
         '',
         '  <body>',
         '        <div>',
         '            <div class="flot-plot" style="max-width:750px;">',
         '               <h3 id="placeholder2_title" style="text-align:center;"></h3>',
-        '               <div id="placeholder2" style="height:450px"></div>',
+        placeholder_str,
         '            </div>',
         '',
         '        </div>',
         '  </body>',
         '',
         '<script type="text/javascript">',
+        sprintf('plot_flot_page({ json_url: "%s", use_worker: %i%s });', json_filename, use_worker,
+                ', segments: ' + json.dumps(segment_filenames) if not isempty(segment_filenames) else ''),
+        '</script>',
+        '',
+        '</html>',
+        ''
+    ]
+
+    return '\n'.join(str_array)
+
+# --------------------------------------------------------------------------------
+# The runtime is the same for all the pages, so it is only put together once
+__runtime_str = ''
+
+def __get_runtime_str():
+    global __runtime_str
+
+    if not isempty(__runtime_str):
+        return __runtime_str
+
+    str_array = [
+        '// Plotting code for the pages created by output_to_flot.py',
+        '// Each page calls plot_flot_page({ json_url: ..., use_worker: ..., segments: [...] })',
+        '',
+    ] + get_worker_str_array() + [
+        '',
+        'function plot_flot_page(cfg) {',
         '$(function () {',
         '',
         '   all_plots = [];',
         '',
         '   plot2 = [];',
-        '   //options2 = {};',
+        '   options2 = {};',
+        '   plot_worker = null;',
+        '',
+        '   // Zoomed-in axis ranges, if any, kept when the plot is redrawn with more data',
+        '   zoom_ranges = null;',
+        '',
+        '   // The image, corners and points of each density series, by points_url. They are',
+        '   // kept here rather than in the series, which Flot deep-copies on every $.plot()',
+        '   var density_cache = {};',
+        '',
+        '   // Range of the data of all the series, from their "stats", which zooming out',
+        '   // does not go past',
+        '   var full_domain = null;',
+        '',
+        '   // For nearest_sorted_point(): points looked at on either side of the mouse, at most',
+        '   var hover_scan = 1000;',
+        '',
+        '   // In progressive mode, redraw at most this often while chunks stream in',
+        '   var chunk_redraw_ms = 1000;',
         '',
         '   function onDataReceived2(data_ext, fig_id) {',
         '       var data2    = data_ext.all_data;',
-        '       var options2 = {};',
+        '       add_x_base(data2, data_ext.xbase);',
+        '       init_density(data2);',
+        '       full_domain = stats_domain(data2, data_ext);',
+        '       use_sorted_hover(data2);',
+        '       options2 = {};',
         '         // Possile options:',
         '           //series:    { lines: { show: true }, points: { show: true }, dashes: { show: true } }, ',
         '           options2.crosshair = { mode: "x" };',
@@ -219,14 +538,24 @@ def __get_html_str(json_filename, flot_folder):
         '       if(!(data_ext.legend_pos == undefined)) { if(options2.legend == undefined) { options2.legend = {};}; options2.legend.position = data_ext.legend_pos; }',
         '       if(!(data_ext.legend_xy_margin == undefined)) { if(options2.legend == undefined) { options2.legend = {};}; options2.legend.margin = data_ext.legend_xy_margin; }',
         '',
+        '       // x values in milliseconds since 1970-01-01 UTC',
+        '       if(data_ext.xmode == "time") { if(options2.xaxis == undefined) { options2.xaxis = {};}; options2.xaxis.mode = "time"; }',
+        '',
         '       // Enable zoom',
         '       options2.selection = { mode: "xy" };',
         '',
+        '       // Use the points decimated by the worker, if any, as they are',
+        '       // and draw the events, if any, on the overlay',
+        '       // draw the density images, if any, in place of their series,',
+        '       options2.hooks  = { processRawData: [use_typed_points], drawSeries: [draw_density], drawOverlay: [draw_events] };',
+        '       options2.events = sort_events(data_ext.events);',
+        '',
         '       // and plot all we got',
+        '       $("#"+fig_id+"_snapshot").remove();',
         '       plot2 = $.plot($("#"+fig_id), data2, options2);',
         '',
-        '       // add text labels',
-        '       add_plot_labels(plot2, data_ext.events);',
+        '       // add the events',
+        '       plot2.triggerRedrawOverlay();',
         '',
         '       //all_plots.push(plot2);',
         '       //all_plots.push({placeholder: $("#"+fig_id), data: data2, options: options2});',
@@ -234,14 +563,354 @@ def __get_html_str(json_filename, flot_folder):
         '',
         '       // change title strings',
         '       $("#"+fig_id+"_title").text(data_ext.title);',
+        '',
+        '       // In progressive mode, stream in the full resolution data',
+        '       if(!(data_ext.chunks == undefined)) { load_chunks(data_ext.chunks, data2, data_ext.xbase); }',
+        '   }',
+        '',
+        '   function add_x_base(series, xbase) {',
+        '       // With time_offsets, x values are written relative to xbase',
+        '       if (!xbase) { return; }',
+        '       for (var idx = 0; idx < series.length; idx++)',
+        '       {',
+        '           var points = series[idx].data;',
+        '           for (var i = 0; i < points.length; i++) { if (points[i] != null) { points[i][0] += xbase; } }',
+        '       }',
+        '   }',
+        '',
+        '   function load_chunks(chunk_urls, series, xbase) {',
+        '       var overview = [], loaded = [];',
+        '       for (var idx = 0; idx < series.length; idx++) { overview.push(series[idx].data); loaded.push([]); }',
+        '       var last_draw = new Date().getTime();',
+        '',
+        '       function redraw(done) {',
+        '           for (var idx = 0; idx < series.length; idx++)',
+        '           {',
+        '               if (series[idx].density) { continue; } // not in the chunks',
+        '               series[idx].data = done ? loaded[idx] : merge_with_overview(loaded[idx], overview[idx]);',
+        '           }',
+        '           plot2 = $.plot($("#placeholder2"), series, $.extend(true, {}, options2, zoom_ranges));',
+        '           plot2.triggerRedrawOverlay();',
+        '           last_draw = new Date().getTime();',
+        '       }',
+        '',
+        '       function load_chunk(k) {',
+        '           if (k == chunk_urls.length) { redraw(true); return; }',
+        '           $.ajax({',
+        '                url: chunk_urls[k],',
+        '                method: \'GET\',',
+        '                dataType: \'json\',',
+        '                success: function(chunk) {',
+        '                    add_x_base(chunk.all_data.map(function(points) { return { data: points }; }), xbase);',
+        '                    for (var idx = 0; idx < loaded.length; idx++)',
+        '                    {',
+        '                        var points = chunk.all_data[idx];',
+        '                        for (var i = 0; i < points.length; i++) { loaded[idx].push(points[i]); }',
+        '                    }',
+        '                    if (new Date().getTime() - last_draw >= chunk_redraw_ms) { redraw(false); }',
+        '                    load_chunk(k+1);',
+        '                }',
+        '           });',
+        '       }',
+        '       load_chunk(0);',
         '   }',
         '',
-        '   $.ajax({',
-        sprintf('            url: "%s",',json_filename),
+        '   function merge_with_overview(loaded, overview) {',
+        '       // The loaded points, followed by the overview points past the last loaded x',
+        '       var i = loaded.length - 1;',
+        '       while (i >= 0 && loaded[i] == null) { i--; }',
+        '       if (i < 0) { return overview; }',
+        '       var last_x = loaded[i][0];',
+        '       for (i = 0; i < overview.length; i++) { if (!(overview[i] == null) && overview[i][0] > last_x) { break; } }',
+        '       return loaded.concat(overview.slice(i));',
+        '   }',
+        '',
+        '   var json_url = cfg.json_url;',
+        '',
+        '   function load_data() {',
+        '       $.ajax({',
+        '            url: json_url,',
         '            method: \'GET\',',
         '            dataType: \'json\',',
-        '            success: (function(fig_id) { return function(response) {onDataReceived2(response,fig_id);}})(\'placeholder2\')',
-        '   });',
+        '            success: (function(fig_id) { return function(response) { load_segments(response, function() {onDataReceived2(response,fig_id);}); }})(\'placeholder2\')',
+        '       });',
+        '   }',
+        '',
+        '   // In append mode, the page lists the segment files with the points added since',
+        '   // the JSON file was last written in full; they are appended to its series in order',
+        '   function load_segments(data_ext, on_done) {',
+        '       var segment_urls = cfg.segments || [];',
+        '       var segments = [], num_loaded = 0;',
+        '       if (segment_urls.length == 0) { on_done(); return; }',
+        '       for (var k = 0; k < segment_urls.length; k++)',
+        '       {',
+        '           $.ajax({',
+        '                url: segment_urls[k],',
+        '                method: \'GET\',',
+        '                dataType: \'json\',',
+        '                success: (function(k) { return function(segment) {',
+        '                    segments[k] = segment;',
+        '                    if (++num_loaded < segment_urls.length) { return; }',
+        '                    for (var idx = 0; idx < data_ext.all_data.length; idx++)',
+        '                    {',
+        '                        var parts = [];',
+        '                        for (var s = 0; s < segments.length; s++) { parts.push(segments[s].all_data[idx]); }',
+        '                        data_ext.all_data[idx].data = Array.prototype.concat.apply(data_ext.all_data[idx].data, parts);',
+        '                    }',
+        '                    on_done();',
+        '                }})(k)',
+        '           });',
+        '       }',
+        '   }',
+        '',
+        '   // With use_worker, the data is fetched, parsed and decimated in a Web Worker,',
+        '   // falling back to loading it on the main thread if the worker cannot run',
+        '   if (cfg.use_worker)',
+        '   {',
+        '       plot_worker = plot_worker_start(json_url, "data", worker_target_points(),',
+        '                         function(msg) { set_typed_points(msg.data_ext.all_data, msg.series); onDataReceived2(msg.data_ext, \'placeholder2\'); },',
+        '                         function(err) { plot_worker = null; load_data(); });',
+        '   }',
+        '   else',
+        '   {',
+        '       load_data();',
+        '   }',
+        '',
+    ] + get_worker_client_str_array() + [
+        '',
+        '   function worker_target_points() {',
+        '       // Number of min/max buckets per series: one per horizontal pixel',
+        '       return Math.max($("#placeholder2").width(), 100);',
+        '   }',
+        '',
+        '   function use_typed_points(plot, series, data, datapoints) {',
+        '       // Flot hook: hand the points from the worker straight to Flot, instead',
+        '       // of letting it copy them point by point',
+        '       if (series.typed_points == undefined) { return; }',
+        '       datapoints.format    = [{ x: true, number: true, required: true }, { y: true, number: true, required: true }];',
+        '       datapoints.pointsize = 2;',
+        '       datapoints.points    = series.typed_points;',
+        '   }',
+        '',
+        '   function set_typed_points(all_data, series) {',
+        '       for (var idx = 0; idx < series.length; idx++)',
+        '       {',
+        '           if ((all_data[idx].bars && all_data[idx].bars.show) || all_data[idx].density)',
+        '           {',
+        '               // Flot draws bars from [x, y, bottom] points, so bars get plain pairs,',
+        '               // as do density images, whose markers are swapped in by update_density()',
+        '               var bar_points = series[idx].points;',
+        '               all_data[idx].data = [];',
+        '               all_data[idx].typed_points = undefined;',
+        '               for (var i = 1; i < bar_points.length; i += 2) { if (bar_points[i] === bar_points[i]) { all_data[idx].data.push([bar_points[i-1], bar_points[i]]); } }',
+        '               continue;',
+        '           }',
+        '           all_data[idx].data = [];',
+        '           all_data[idx].typed_points = series[idx].points;',
+        '           if (series[idx].has_gaps)',
+        '           {',
+        '               // Flot only breaks lines at null points, not at NaN',
+        '               var points = Array.prototype.slice.call(series[idx].points);',
+        '               for (var i = 1; i < points.length; i += 2) { if (points[i] !== points[i]) { points[i-1] = null; points[i] = null; } }',
+        '               all_data[idx].typed_points = points;',
+        '           }',
+        '       }',
+        '   }',
+        '',
+        '   function zoom_to(xmin, xmax, ymin, ymax) {',
+        '       // With xmin == null, back to the full range of the data',
+        '       zoom_ranges = (xmin == null) ? null : { xaxis: { min: xmin, max: xmax }, yaxis: { min: ymin, max: ymax } };',
+        '       var zoom_options = $.extend(true, {}, options2, zoom_ranges);',
+        '       function replot(data2) {',
+        '           update_density(data2, zoom_ranges, function() {',
+        '               plot2 = $.plot($("#placeholder2"), data2, zoom_options);',
+        '               plot2.triggerRedrawOverlay();',
+        '           });',
+        '       }',
+        '       if (plot_worker == null)',
+        '       {',
+        '           replot(plot2.getData());',
+        '           return;',
+        '       }',
+        '       // Ask the worker for the full resolution points in the new range',
+        '       plot_worker_request(plot_worker, { cmd: "range", xmin: (xmin == null) ? full_domain.xmin : xmin,',
+        '                                          xmax: (xmin == null) ? full_domain.xmax : xmax, target_points: worker_target_points() },',
+        '           function(msg) {',
+        '               var data2 = plot2.getData();',
+        '               set_typed_points(data2, msg.series);',
+        '               replot(data2);',
+        '           });',
+        '   }',
+        '',
+        '   function stats_domain(all_data, data_ext) {',
+        '       // The range of the data of all the series, with the xmin, xmax, ymin and ymax',
+        '       // limits, if any, taking precedence, or null if a series has no stats',
+        '       var domain = { xmin: Infinity, xmax: -Infinity, ymin: Infinity, ymax: -Infinity };',
+        '       for (var idx = 0; idx < all_data.length; idx++)',
+        '       {',
+        '           var stats = all_data[idx].stats;',
+        '           if (stats == undefined) { return null; }',
+        '           if (stats.count == 0) { continue; }',
+        '           domain.xmin = Math.min(domain.xmin, stats.xmin); domain.xmax = Math.max(domain.xmax, stats.xmax);',
+        '           domain.ymin = Math.min(domain.ymin, stats.ymin); domain.ymax = Math.max(domain.ymax, stats.ymax);',
+        '       }',
+        '       for (var key in domain) { if (!(data_ext[key] == undefined)) { domain[key] = data_ext[key]; } }',
+        '       return (domain.xmin <= domain.xmax && domain.ymin <= domain.ymax) ? domain : null;',
+        '   }',
+        '',
+        '   function use_sorted_hover(all_data) {',
+        '       // Flot looks for the point under the mouse through every point of the',
+        '       // hoverable series. The series with sorted x are left out of that, and',
+        '       // searched by nearest_sorted_point() instead.',
+        '       for (var idx = 0; idx < all_data.length; idx++)',
+        '       {',
+        '           var s = all_data[idx];',
+        '           if (s.stats && s.stats.sorted && !s.density && !(s.bars && s.bars.show)) { s.hoverable = false; }',
+        '       }',
+        '   }',
+        '',
+        '   function search_sorted(s, x) {',
+        '       // Binary search for the first point of series s at or after x, or for a gap',
+        '       // (null point) just before it. The coarse index of the series, if it is for',
+        '       // the points Flot has, narrows the search down first.',
+        '       var pts = s.datapoints.points, ps = s.datapoints.pointsize;',
+        '       var lo = 0, hi = pts.length / ps, index = s.stats.index;',
+        '       if (index && index.length == hi)',
+        '       {',
+        '           var a = 0, b = index.x.length;',
+        '           while (a < b) { var m = (a + b) >> 1; if (index.x[m] < x) { a = m + 1; } else { b = m; } }',
+        '           if (a > 0) { lo = (a - 1) * index.step + 1; }',
+        '           if (a < index.x.length) { hi = Math.min(hi, a * index.step + 1); }',
+        '       }',
+        '       while (lo < hi)',
+        '       {',
+        '           var mid = (lo + hi) >> 1, k = mid;',
+        '           while (k < hi && pts[k*ps] == null) { k++; }',
+        '           if (k < hi && pts[k*ps] < x) { lo = k + 1; } else { hi = mid; }',
+        '       }',
+        '       return lo;',
+        '   }',
+        '',
+        '   function nearest_sorted_point(pos) {',
+        '       // The point closest to the mouse, within mouseActiveRadius pixels, of the',
+        '       // series left to us by use_sorted_hover(), in the format of Flot items',
+        '       var offset = plot2.offset(), radius = plot2.getOptions().grid.mouseActiveRadius;',
+        '       var mx = pos.pageX - offset.left, my = pos.pageY - offset.top;',
+        '       var data2 = plot2.getData(), best = null, best_dist2 = radius*radius;',
+        '       for (var idx = 0; idx < data2.length; idx++)',
+        '       {',
+        '           var s = data2[idx];',
+        '           if (s.hoverable !== false) { continue; }',
+        '           var pts = s.datapoints.points, ps = s.datapoints.pointsize, n = pts.length / ps;',
+        '           var k0 = search_sorted(s, s.xaxis.c2p(mx));',
+        '           // Outwards from there, until the points are too far away in x alone',
+        '           for (var dir = -1; dir <= 1; dir += 2)',
+        '           {',
+        '               for (var k = (dir < 0) ? k0 - 1 : k0, m = 0; k >= 0 && k < n && m < hover_scan; k += dir, m++)',
+        '               {',
+        '                   if (pts[k*ps] == null) { continue; }',
+        '                   var dx = s.xaxis.p2c(pts[k*ps]) - mx, dy = s.yaxis.p2c(pts[k*ps+1]) - my;',
+        '                   if (dx*dx > best_dist2) { break; }',
+        '                   if (dx*dx + dy*dy < best_dist2)',
+        '                   {',
+        '                       best_dist2 = dx*dx + dy*dy;',
+        '                       best = { series: s, seriesIndex: idx, dataIndex: k, datapoint: [pts[k*ps], pts[k*ps+1]],',
+        '                                pageX: offset.left + mx + dx, pageY: offset.top + my + dy, dist2: best_dist2 };',
+        '                   }',
+        '               }',
+        '           }',
+        '       }',
+        '       return best;',
+        '   }',
+        '',
+        '   function init_density(all_data) {',
+        '       // A series drawn as a density image has the corners of the image as its',
+        '       // data, which are put back whenever the image is shown again',
+        '       for (var idx = 0; idx < all_data.length; idx++)',
+        '       {',
+        '           var density = all_data[idx].density;',
+        '           if (!density) { continue; }',
+        '           var cached = { corners: all_data[idx].data, img: new Image(), points: null };',
+        '           cached.img.onload = function() { if (plot2.draw) { plot2.draw(); } };',
+        '           cached.img.src    = density.image;',
+        '           density_cache[density.points_url] = cached;',
+        '           density.show_points = false;',
+        '       }',
+        '   }',
+        '',
+        '   function density_points_in(density, ranges) {',
+        '       // Estimate of the number of points in the ranges, from the coarse grid of',
+        '       // counts, assuming the points are spread evenly within each cell',
+        '       var e = density.extent, cells = density.cells;',
+        '       var rows = cells.length, cols = rows > 0 ? cells[0].length : 0;',
+        '       var cell_w = (e[1] - e[0]) / cols, cell_h = (e[3] - e[2]) / rows;',
+        '       var overlap = function(lo, hi, from, to) { return Math.max(0, Math.min(hi, to) - Math.max(lo, from)) / (hi - lo); };',
+        '       var total = 0;',
+        '       for (var r = 0; r < rows; r++)',
+        '       {',
+        '           var y_hi = e[3] - r*cell_h;',
+        '           var fy = overlap(y_hi - cell_h, y_hi, ranges.yaxis.min, ranges.yaxis.max);',
+        '           if (fy == 0) { continue; }',
+        '           for (var c = 0; c < cols; c++)',
+        '           {',
+        '               if (cells[r][c] == 0) { continue; }',
+        '               total += cells[r][c] * fy * overlap(e[0] + c*cell_w, e[0] + (c+1)*cell_w, ranges.xaxis.min, ranges.xaxis.max);',
+        '           }',
+        '       }',
+        '       return total;',
+        '   }',
+        '',
+        '   function update_density(all_data, ranges, on_done) {',
+        '       // Shows the markers of the density series with few enough points in the',
+        '       // zoomed ranges, loading their points first if needed, and the images of the others',
+        '       var pending = 0;',
+        '       function show(series) {',
+        '           var density = series.density, cached = density_cache[density.points_url];',
+        '           density.show_points = ranges != null && density_points_in(density, ranges) <= density.max_points;',
+        '           series.points.show  = density.show_points;',
+        '           if (!density.show_points) { series.data = cached.corners; return; }',
+        '           if (cached.points == null)',
+        '           {',
+        '               pending++;',
+        '               $.ajax({',
+        '                    url: density.points_url,',
+        '                    method: \'GET\',',
+        '                    dataType: \'json\',',
+        '                    success: function(response) { cached.points = response.data; show(series); if (--pending == 0) { on_done(); } }',
+        '               });',
+        '               return;',
+        '           }',
+        '           var points = cached.points, visible = [];',
+        '           for (var i = 0; i < points.length; i++)',
+        '           {',
+        '               var p = points[i];',
+        '               if (p != null && p[0] >= ranges.xaxis.min && p[0] <= ranges.xaxis.max && p[1] >= ranges.yaxis.min && p[1] <= ranges.yaxis.max) { visible.push(p); }',
+        '           }',
+        '           series.data = visible;',
+        '           series.typed_points = undefined;',
+        '       }',
+        '       for (var idx = 0; idx < all_data.length; idx++) { if (all_data[idx].density) { show(all_data[idx]); } }',
+        '       if (pending == 0) { on_done(); }',
+        '   }',
+        '',
+        '   function draw_density(plot, ctx, series) {',
+        '       // Flot hook: draws the density image of a series, scaled to the axes and',
+        '       // clipped to the plot area, before the series itself is drawn',
+        '       var density = series.density;',
+        '       if (!density || density.show_points) { return; }',
+        '       var img = density_cache[density.points_url].img;',
+        '       if (!img.complete) { return; }',
+        '       var e = density.extent, offset = plot.getPlotOffset();',
+        '       var x0 = series.xaxis.p2c(e[0]), x1 = series.xaxis.p2c(e[1]);',
+        '       var y0 = series.yaxis.p2c(e[3]), y1 = series.yaxis.p2c(e[2]);',
+        '       ctx.save();',
+        '       ctx.translate(offset.left, offset.top);',
+        '       ctx.beginPath();',
+        '       ctx.rect(0, 0, plot.width(), plot.height());',
+        '       ctx.clip();',
+        '       ctx.drawImage(img, x0, y0, x1 - x0, y1 - y0);',
+        '       ctx.restore();',
+        '   }',
         '',
         '',
         '  ',
@@ -254,11 +923,7 @@ def __get_html_str(json_filename, flot_folder):
         '            ranges.yaxis.to = ranges.yaxis.from + 0.00001;',
         '        ',
         '        // do the zooming',
-        '        plot2 = $.plot($("#placeholder2"), plot2.getData(ranges.xaxis.from, ranges.xaxis.to),',
-        '                      $.extend(true, {}, options2, {',
-        '                          xaxis: { min: ranges.xaxis.from, max: ranges.xaxis.to },',
-        '                          yaxis: { min: ranges.yaxis.from, max: ranges.yaxis.to }',
-        '                      }));',
+        '        zoom_to(ranges.xaxis.from, ranges.xaxis.to, ranges.yaxis.from, ranges.yaxis.to);',
         '    });',
         '   // Enable zoom out',
         '    $("#placeholder2").bind("dblclick", function (event) {',
@@ -273,11 +938,19 @@ def __get_html_str(json_filename, flot_folder):
         '        var xax_min2 = xc-dx2/2;  var xax_max2 = xc+dx2/2; ',
         '        var yax_min2 = yc-dy2/2;  var yax_max2 = yc+dy2/2; ',
         '',
-        '        plot2 = $.plot($("#placeholder2"), plot2.getData(xax_min2, xax_max2),',
-        '                      $.extend(true, {}, options2, {',
-        '                          xaxis: { min: xax_min2, max: xax_max2 },',
-        '                          yaxis: { min: yax_min2, max: yax_max2 }',
-        '                      }));',
+        '        // Not past the range of the data, and back to the full view once all of it is in view',
+        '        if (full_domain != null)',
+        '        {',
+        '            xax_min2 = Math.max(xax_min2, Math.min(full_domain.xmin, xax_min)); xax_max2 = Math.min(xax_max2, Math.max(full_domain.xmax, xax_max));',
+        '            yax_min2 = Math.max(yax_min2, Math.min(full_domain.ymin, yax_min)); yax_max2 = Math.min(yax_max2, Math.max(full_domain.ymax, yax_max));',
+        '            if (xax_min2 <= full_domain.xmin && xax_max2 >= full_domain.xmax && yax_min2 <= full_domain.ymin && yax_max2 >= full_domain.ymax)',
+        '            {',
+        '                zoom_to(null, null, null, null);',
+        '                return;',
+        '            }',
+        '        }',
+        '',
+        '        zoom_to(xax_min2, xax_max2, yax_min2, yax_max2);',
         '						  });',
         '',
         '',
@@ -298,6 +971,7 @@ def __get_html_str(json_filename, flot_folder):
         '',
         '',
         '    var previousPoint = null;',
+        '    var sorted_highlight = null;',
         '    $("#placeholder2").bind("plothover", function (event, pos, item) {',
         '       ////$("#x").text(pos.x.toFixed(2));',
         '       ////$("#y").text(pos.y.toFixed(2));',
@@ -326,6 +1000,13 @@ def __get_html_str(json_filename, flot_folder):
         '         */',
         '         // ----------- ',
         '',
+        '            // Flot does not look through the series with sorted x, see use_sorted_hover(),',
+        '            // nor highlights their points',
+        '            var near = nearest_sorted_point(pos);',
+        '            if (near && (!item || near.dist2 < (item.pageX-pos.pageX)*(item.pageX-pos.pageX) + (item.pageY-pos.pageY)*(item.pageY-pos.pageY))) { item = near; }',
+        '            if (sorted_highlight) { plot2.unhighlight(sorted_highlight.series, sorted_highlight.datapoint); sorted_highlight = null; }',
+        '            if (item && item === near) { plot2.highlight(item.series, item.datapoint); sorted_highlight = item; }',
+        '',
         '            if (item) {',
         '                if (previousPoint != item.dataIndex) {',
         '                    previousPoint = item.dataIndex;',
@@ -344,54 +1025,71 @@ def __get_html_str(json_filename, flot_folder):
         '        ',
         '    });',
         '',
-        '    function add_plot_labels(plot, events, add_vert_lines) ',
+        '    function sort_events(events) {',
+        '      if(events == undefined) { return []; }',
+        '      return events.slice().sort(function(a, b) { return a.x - b.x; });',
+        '    }',
+        '',
+        '    function draw_events(plot, ctx)',
         '    {',
-        '      if(events == undefined) {return plot;}',
-        '      if(add_vert_lines == undefined) { add_vert_lines = 1; }',
+        '      // Flot hook: draws the events on the overlay canvas, as vertical lines with',
+        '      // text labels, without adding any series or DOM elements. Labels go in two',
+        '      // alternating rows, and a label that would overlap the previous label in its',
+        '      // row is skipped, so that more labels show up as the user zooms in.',
+        '      var events = plot.getOptions().events;',
+        '      if(events == undefined || events.length == 0) { return; }',
         '',
-        '      var data        = plot.getData();',
-        '      var options     = plot.getOptions();',
         '      var xaxis       = plot.getAxes().xaxis;',
         '      var yaxis       = plot.getAxes().yaxis;',
         '      var placeholder = plot.getPlaceholder();',
+        '      var plotOffset  = plot.getPlotOffset();',
+        '      var height      = plot.height();',
         '',
-        '      if(add_vert_lines == 1)',
+        '      ctx.save();',
+        '      ctx.translate(plotOffset.left, plotOffset.top);',
+        '',
+        '      // First, the vertical lines',
+        '      ctx.lineWidth   = 1;',
+        '      ctx.strokeStyle = "rgba(0, 255, 0, 0.25)";',
+        '      ctx.beginPath();',
+        '      for (var idx=0; idx < events.length; idx++ )',
         '      {',
-        '        // First, add vertical lines',
-        '        for (var idx=0; idx < events.length; idx++ )',
-        '        {',
-        '           evt = events[idx];',
-        '           data.push({ data: [[evt.x, yaxis.min], [evt.x, yaxis.max]], lines: { show: true }, color: "rgba(0, 255, 0, 0.25)" });',
-        '        }',
-        '        // Plot again, to add the vertical lines, if any',
-        '        plot = $.plot(placeholder, data, options);      ',
+        '         if (events[idx].x < xaxis.min || events[idx].x > xaxis.max) { continue; }',
+        '         var x_k = Math.round(xaxis.p2c(events[idx].x)) + 0.5;',
+        '         ctx.moveTo(x_k, 0);',
+        '         ctx.lineTo(x_k, height);',
         '      }',
+        '      ctx.stroke();',
         '',
-        '      // Second, add labels next to the vertical lines',
-        '      var y1  = yaxis.min + 0.25*(yaxis.max-yaxis.min); var y2 = yaxis.min + 0.32*(yaxis.max-yaxis.min);',
-        '      var y_k = y2; // y1 or y2 ==> y_k = (y1+y2)-y_k to flip',
+        '      // Second, the labels next to the vertical lines',
+        '      ctx.font         = placeholder.css("font-size") + " " + placeholder.css("font-family");',
+        '      ctx.fillStyle    = placeholder.css("color");',
+        '      ctx.textBaseline = "top";',
+        '      var rows     = [0.75*height, 0.68*height];',
+        '      var row_end  = [-Infinity, -Infinity];',
+        '      var row_k    = 1; // alternates between rows 0 and 1',
         '      for (var idx=0; idx < events.length; idx++ )',
         '      {',
-        '         evt = events[idx];',
-        '         y_k = (evt.y == undefined) ? (y1+y2)-y_k : evt.y;',
-        '         var o_k = plot.pointOffset({ x: evt.x, y: y_k});',
-        '         placeholder.append(\'<div class="event_labels" style="position:absolute;left:\' + (o_k.left + 4) + \'px;top:\' + o_k.top + \'px;text-align:left;min-width:200px;">\' + evt.descr + \'</div>\');',
+        '         var evt = events[idx];',
+        '         if (evt.x < xaxis.min || evt.x > xaxis.max) { continue; }',
+        '         var x_k = xaxis.p2c(evt.x) + 4;',
+        '         if (!(evt.y == undefined)) { ctx.fillText(evt.descr, x_k, yaxis.p2c(evt.y)); continue; }',
+        '',
+        '         row_k = 1 - row_k;',
+        '         if (x_k < row_end[row_k]) { row_k = 1 - row_k; }',
+        '         if (x_k < row_end[row_k]) { continue; } // no room in either row at this zoom level',
+        '         ctx.fillText(evt.descr, x_k, rows[row_k]);',
+        '         row_end[row_k] = x_k + ctx.measureText(evt.descr).width + 8;',
         '      }',
         '',
-        '      return plot;',
+        '      ctx.restore();',
         '    }',
         '',
         '});',
-        '</script>',
-        '',
-        '</html>'
+        '}',
+        ''
     ]
 
-    str = ''
-    for I in range(0,length(str_array)):
-        str += sprintf('%s\n',str_array[I])
-
-    return str
-
-
+    __runtime_str = '\n'.join(str_array)
 
+    return __runtime_str
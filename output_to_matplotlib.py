@@ -26,13 +26,56 @@
 
 from os import path
 from numpy import nan, isnan
-import matplotlib.pyplot as plt
+import datetime
+from matplotlib.dates import date2num
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 from matlab_utils import *
 from matlab_plot_functions import db_figIdx, db_figInfo
+from plot_encoding import as_vector, series_groups, concat_with_gaps
+from plot_styles import series_style
+from output_files import replace_file
+from figure_usage import figure_exported
+from plot_backends import LazyModule
+
+# Only needed to show figures, see output_to_png()
+plt = LazyModule('matplotlib.pyplot')
 
 # --------------------------------------------------------------------------------
 def output_to_matplotlib(figIdx):
+    figInfo = __figure_info(figIdx)
+
+    # Start plotting figure figIdx
+    fig = plt.figure(figIdx)
+    __draw_figure(figInfo, fig, fig.gca())
+    figure_exported(figIdx)
+# End output_to_matplotlib()
+
+
+# --------------------------------------------------------------------------------
+def output_to_png(figIdx, png_filename, dpi=100):
+    # Draws figure figIdx as output_to_matplotlib() does, and saves it to
+    # png_filename instead of showing it, e.g. for reports sent by email.
+    # The figure is drawn by the Agg canvas, without pyplot, so that no display
+    # is needed whatever the matplotlib backend is.
+    figInfo = __figure_info(figIdx)
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    __draw_figure(figInfo, fig, fig.add_subplot(1, 1, 1))
+
+    # Written next to png_filename first, so that it is replaced in one step
+    fig.savefig(png_filename + '.tmp', format='png', dpi=dpi)
+    replace_file(png_filename + '.tmp', png_filename)
+
+    # Only once the file is written, as set_max_figures() can then drop the data
+    # of the figure
+    figure_exported(figIdx)
+
+
+# --------------------------------------------------------------------------------
+def __figure_info(figIdx):
     global db_figIdx, db_figInfo
 
     if db_figIdx == -1:
@@ -41,66 +84,89 @@ def output_to_matplotlib(figIdx):
     if figIdx > length(db_figInfo):
         error('Figure %i not present', figIdx)
 
+    return db_figInfo[figIdx-1]
 
-    fmt_color = {'rgb(0, 0, 255)':'b',  'rgb(255, 0, 0)':'r',  'rgb(0, 255, 0)':'g', 
-                 'rgb(255, 0, 255)':'m','rgb(0, 255, 255)':'c','rgb(0, 0,   0)':'k'}
-
-    fmt_marker = {'circle':'o', 'square':'s', 'diamond':'d', 'triangle':'^', 'cross':'+'}
 
+# --------------------------------------------------------------------------------
+def __draw_figure(figInfo, fig, ax):
     fmt_legend_pos = {'ne':'upper right', 'nw':'upper left', 'se':'lower right', 'sw':'lower left'}
     
-    # Start plotting figure figIdx
-    plt.figure(figIdx)
-
-    figInfo = db_figInfo[figIdx-1]
+    # Times are stored in milliseconds since 1970-01-01 UTC, and matplotlib
+    # wants its own date numbers, in days
+    if figInfo['xmode'] == 'time':
+        epoch_num = date2num(datetime.datetime(1970, 1, 1))
+        to_plot_x = lambda x: epoch_num + as_vector(x)/86400000.0
+    else:
+        to_plot_x = lambda x: x
 
-    # Data
-    for Id in range(0,length(figInfo['data'])):
+    # Data. The series without a legend label that look the same are plotted as
+    # one line, with gaps between them, which matplotlib draws much faster than
+    # as many separate lines.
+    for group in series_groups(figInfo):
+        Id = group[0]
         if not isempty(figInfo['legend']) and not isempty(figInfo['legend'][Id]):
             label = figInfo['legend'][Id]
         else:
             label = None
             
-        if figInfo['linestyles'][Id] == '--':
+        # The color and marker are those of the plot_fmt, which matplotlib takes as they are
+        style = series_style(figInfo, Id)
+
+        if style.linestyle == '--':
             linestyle = '--'
         else:
             # For now, everything that isn't a dashed line is a solid line
             linestyle = '-'
 
-        if not isempty(figInfo['markers'][Id]):
-            marker = fmt_marker[figInfo['markers'][Id]]
+        if not isempty(style.marker_char):
+            marker = style.marker_char
         else:
             marker = None
-            
-        color = fmt_color[figInfo['colors'][Id]]
   
         # x & y data
-        x = figInfo['data'][Id]['x']
-        y = figInfo['data'][Id]['y']
+        (x, y) = concat_with_gaps([(figInfo['data'][Is]['x'], figInfo['data'][Is]['y']) for Is in group])
+        x = to_plot_x(x)
         
-        plt.plot(x, y, label=label, color=color, linestyle=linestyle, marker=marker)
+        if figInfo['plot_types'][Id] == 'bar':
+            ax.bar(x, y, figInfo['bar_widths'][Id] / (86400000.0 if figInfo['xmode'] == 'time' else 1),
+                   align='center', label=label, color=style.color, alpha=0.6*style.alpha, edgecolor=style.color,
+                   linestyle=linestyle)
+        else:
+            ax.plot(x, y, label=label, color=style.color, alpha=style.alpha, linestyle=linestyle, marker=marker)
+
+    # Events, as vertical lines with their descriptions next to them
+    for evt in figInfo['events']:
+        evt_x = to_plot_x([evt['x']])[0]
+        ax.axvline(evt_x, color=(0, 1, 0, 0.25))
+        if 'y' in evt:
+            ax.text(evt_x, evt['y'], ' ' + evt['descr'])
+        else:
+            ax.text(evt_x, 0.3, ' ' + evt['descr'], transform=ax.get_xaxis_transform())
+
+    if figInfo['xmode'] == 'time':
+        ax.xaxis_date()
+        fig.autofmt_xdate()
 
     # Title
     if not isempty(figInfo['title']):
-        plt.title(figInfo['title'])
+        ax.set_title(figInfo['title'])
 
     # x & y labels
     if not isempty(figInfo['xlabel']):
-        plt.xlabel(figInfo['xlabel'])
+        ax.set_xlabel(figInfo['xlabel'])
 
     if not isempty(figInfo['ylabel']):
-        plt.ylabel(figInfo['ylabel'])
+        ax.set_ylabel(figInfo['ylabel'])
 
     # legend location
     if not isempty(figInfo['legend_pos']) and not isempty(figInfo['legend_pos']['location']):
         legend_pos = fmt_legend_pos[figInfo['legend_pos']['location']]
     else:
         legend_pos = None
-    plt.legend(loc=legend_pos)
+    ax.legend(loc=legend_pos)
         
     # axis limits
-    if not isnan(figInfo['axislim'][0]): plt.xlim(xmin=figInfo['axislim'][0])
-    if not isnan(figInfo['axislim'][1]): plt.xlim(xmax=figInfo['axislim'][1])
-    if not isnan(figInfo['axislim'][2]): plt.ylim(ymin=figInfo['axislim'][2])
-    if not isnan(figInfo['axislim'][3]): plt.ylim(ymax=figInfo['axislim'][3])
-# End output_to_matplotlib()
+    if not isnan(figInfo['axislim'][0]): ax.set_xlim(left=to_plot_x([figInfo['axislim'][0]])[0])
+    if not isnan(figInfo['axislim'][1]): ax.set_xlim(right=to_plot_x([figInfo['axislim'][1]])[0])
+    if not isnan(figInfo['axislim'][2]): ax.set_ylim(bottom=figInfo['axislim'][2])
+    if not isnan(figInfo['axislim'][3]): ax.set_ylim(top=figInfo['axislim'][3])
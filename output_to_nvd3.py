@@ -23,16 +23,47 @@
    SOFTWARE.
 """
 
+import json
 from os import path, makedirs
-from numpy import nan, isnan
+from numpy import nan, isnan, isfinite, floor
 
 from matlab_utils import *
 from matlab_plot_functions import db_figIdx, db_figInfo
+from figure_usage import figure_exported
+from plot_encoding import as_vector, num_str_array, cached_xy_pairs_strs, series_groups, concat_with_gaps, \
+                          bar_outline, data_domain, series_stats, stats_domain
+from svg_snapshot import figure_to_svg
+from plot_worker import get_worker_str_array, get_worker_client_str_array
+from plot_runtime import write_runtime_file, page_url
+from output_files import OutputFile, remove_old_versions
+from plot_memory import memory_phase, note_temporary
 
 # --------------------------------------------------------------------------------
-def output_to_nvd3(figIdx, html_filename, json_filename='', extra_str=''):
+def output_to_nvd3(figIdx, html_filename, json_filename='', extra_str='', use_worker=0, svg_snapshot=0,
+                   content_hash=0, retention_days=7, num_workers=1, time_offsets=0, merge_series=1,
+                   series_cache=None, data_stats=1):
     global db_figIdx, db_figInfo
 
+    # With content_hash, the data files are named after a hash of their contents,
+    # e.g. data/plot.3f2a9c0b1d4e5f60.json, so that they never change once written
+    # and can be cached indefinitely. Versions that are no longer current are
+    # deleted after retention_days.
+
+    # With num_workers > 1, the series are converted to JSON text by that many
+    # worker processes, and then written in order.
+
+    # With merge_series, the series without a legend label that look the same are
+    # written as a single series, with gaps between them, so that they are drawn
+    # as one path.
+
+    # series_cache is a dict shared with other exporters of the same figure, see
+    # export() in matlab_plot_functions.py, so that each series is only converted
+    # to JSON text once.
+
+    # With data_stats, each line series carries the range and count of its points,
+    # and whether any are missing, see series_stats(), so that the page does not
+    # scan the points for them.
+
     if db_figIdx == -1:
         db_figIdx = 1
 
@@ -47,114 +78,197 @@ def output_to_nvd3(figIdx, html_filename, json_filename='', extra_str=''):
         if not path.exists(data_dir):
             makedirs(data_dir)
 
-    # ----------------------------
-    fid = fopen(json_filename,'w')
-
-    fprintf(fid,'{\n')
-
     if figIdx > length(db_figInfo):
         error('Figure %i not present', figIdx)
 
     # Helper functions
-    num_fmt_array = ['%g', '%i']
-    isint         = lambda x: (floor(x)==x)
-    num_fmt       = lambda x: num_fmt_array[isint(x)]
-    num_str       = lambda x: sprintf(num_fmt(x),x)
     use_comma_if  = lambda test: ', ' if test else ''
+
+    # NVD3 point shape for each of the marker names used by plot()
+    nvd3_shape = {'circle':'circle', 'square':'square', 'diamond':'diamond',
+                  'cross':'cross', 'triangle':'triangle-up'}
     
     # Start printing info about figIdx
     figInfo = db_figInfo[figIdx-1]
 
-    # Title
-    if not isempty(figInfo['title']):
-        fprintf(fid,'  "title": "%s",\n', figInfo['title'])
+    # With time_offsets, the x values of a time axis are written as offsets from
+    # the first time, see "xbase" below
+    xbase = 0
+    if time_offsets and figInfo['xmode'] == 'time':
+        xmin = data_domain(figInfo)[0][0]
+        if isfinite(xmin):
+            xbase = floor(xmin)
+
+    if merge_series:
+        groups = series_groups(figInfo)
+    else:
+        groups = [[Id] for Id in range(0,length(figInfo['data']))]
+
+    series_xy = []
+    for group in groups:
+        x, y = concat_with_gaps([(as_vector(figInfo['data'][Id]['x']) - xbase, figInfo['data'][Id]['y'])
+                                 for Id in group])
+        if figInfo['plot_types'][group[0]] == 'bar':
+            (x, y) = bar_outline(x, y, figInfo['bar_widths'][group[0]])
+        series_xy.append((x, y))
+    note_temporary('series_xy', series_xy)
+
+    # x & y domains, so that the browser does not need to scan the data for them.
+    # With data_stats, they come from the statistics of each series, which are
+    # also written, see series_stats().
+    if data_stats:
+        all_stats = [series_stats(x, y, xbase=xbase) for (x, y) in series_xy]
+        xdomain, ydomain = stats_domain(all_stats, figInfo['axislim'])
+    else:
+        xdomain, ydomain = data_domain(figInfo)
+
+    # Data, already in the series format that NVD3 expects. A line with markers
+    # becomes a "line" series followed by a "scatter" series, and the scatter
+    # series refers to the values of the line series through "values_from"
+    # instead of repeating the data. Bars (from hist()) are a filled line along
+    # their outline, as the bars of multiChart are laid out like categories and
+    # would not line up with the x axis of the lines.
+    keys = [('outline' if figInfo['plot_types'][group[0]] == 'bar' else 'pairs', tuple(group), xbase)
+            for group in groups]
+    with memory_phase(figIdx, 'nvd3.encode'):
+        data_strs = cached_xy_pairs_strs(series_xy, keys, series_cache, num_workers)
+        note_temporary('data_strs', data_strs)
+
+    series_strs = []
+    for Ig in range(0,length(groups)):
+        Id = groups[Ig][0]
+        if not isempty(figInfo['legend']) and not isempty(figInfo['legend'][Id]):
+            key_str = sprintf('       "key": "%s",\n', figInfo['legend'][Id])
+        else:
+            key_str = ''
 
-    # x & y labels
-    if not isempty(figInfo['xlabel']):
-        fprintf(fid,'  "xlabel": "%s",\n', figInfo['xlabel'])
+        color_str = sprintf('       "color": "%s",\n', figInfo['colors'][Id])
 
-    if not isempty(figInfo['ylabel']):
-        fprintf(fid,'  "ylabel": "%s",\n', figInfo['ylabel'])
+        # For now, everything that isn't a dashed line is a solid line
+        if figInfo['linestyles'][Id] == '--':
+            classed_str = '       "classed": "dashed",\n'
+        else:
+            classed_str = ''
 
-    # legend location
-    if not isempty(figInfo['legend_pos']) and not isempty(figInfo['legend_pos']['location']):
-        fprintf(fid,'  "legend_pos": "%s",\n', figInfo['legend_pos']['location'])
-  
-        if not isempty(figInfo['legend_pos']['xy_margin']):
-            fprintf(fid,'  "legend_xy_margin": %s,\n', figInfo['legend_pos']['xy_margin'])
+        # ------------------------------------------------------------------------
+        # I^th data
+        data_str = data_strs[Ig]
+        # ------------------------------------------------------------------------
 
-    # axis limits
-    axis_lim_descr = ["xmin", "xmax", "ymin", "ymax"]
-    for I in range(0,length(axis_lim_descr)):
-        if not isnan(figInfo['axislim'][I]):
-            fprintf(fid,'  "%s": %g,\n', axis_lim_descr[I], figInfo['axislim'][I])
+        if figInfo['plot_types'][Id] == 'bar':
+            classed_str += '       "area": true,\n'
 
-    # Data
-    fprintf(fid,'  "all_data": [\n')
+        if data_stats:
+            stats_str = '       "stats": ' + json.dumps(all_stats[Ig], sort_keys=True) + ',\n'
+        else:
+            stats_str = ''
+
+        line_series = length(series_strs)
+        series_strs.append('     {\n' + key_str +
+                           '       "type": "line",\n' +
+                           '       "yAxis": 1,\n' + classed_str + color_str + stats_str +
+                           '       "values": ' + data_str + '\n' +
+                           '     }')
+
+        if not isempty(figInfo['markers'][Id]) and figInfo['plot_types'][Id] != 'bar':
+            # We have a line plus markers
+            series_strs.append('     {\n' + key_str +
+                               '       "type": "scatter",\n' +
+                               '       "yAxis": 1,\n' +
+                               '       "classed": "no_legend",\n' +
+                               sprintf('       "shape": "%s",\n', nvd3_shape[figInfo['markers'][Id]]) +
+                               color_str +
+                               sprintf('       "values_from": %i\n', line_series) +
+                               '     }')
 
-    for Id in range(0,length(figInfo['data'])):
-        fprintf(fid,'     {\n') 
-        if not isempty(figInfo['legend']) and not isempty(figInfo['legend'][Id]):
-            fprintf(fid,'       "label": "%s",\n', figInfo['legend'][Id])
+    # ----------------------------
+    with OutputFile(json_filename, content_hash) as fid:
+        fprintf(fid,'{\n')
 
-        if figInfo['linestyles'][Id] == '--':
-            fprintf(fid,'       "dashes": { "show": "true" },\n')
-        else:
-            # For now, everything that isn't a dashed line is a solid line
-            fprintf(fid,'       "lines": { "show": "true" },\n')
+        # Title
+        if not isempty(figInfo['title']):
+            fprintf(fid,'  "title": "%s",\n', figInfo['title'])
 
-        if not isempty(figInfo['markers'][Id]):
-            fprintf(fid,'       "points": { "symbol": "%s", "show": "true" },\n',figInfo['markers'][Id])
+        # x & y labels
+        if not isempty(figInfo['xlabel']):
+            fprintf(fid,'  "xlabel": "%s",\n', figInfo['xlabel'])
 
-        fprintf(fid,'       "color": "%s",\n', figInfo['colors'][Id])
-  
-        # ------------------------------------------------------------------------
-        # I^th data
-        x = figInfo['data'][Id]['x']
-        y = figInfo['data'][Id]['y']
+        if not isempty(figInfo['ylabel']):
+            fprintf(fid,'  "ylabel": "%s",\n', figInfo['ylabel'])
+
+        # legend location
+        if not isempty(figInfo['legend_pos']) and not isempty(figInfo['legend_pos']['location']):
+            fprintf(fid,'  "legend_pos": "%s",\n', figInfo['legend_pos']['location'])
   
-        data_str = '['
-        for Ix in mrange[1:length(x)]:
-            sep_str = ' ' if Ix == 1 else ', '
-            try:
-                data_str = sprintf('%s%s[%s, %s]',data_str,sep_str, num_str(x[Ix]), num_str(y[Ix]))
-            except:
-                print('Entering debugging...')
-                import pdb; pdb.set_trace()
-        data_str = sprintf('%s ]', data_str)
-
-        fprintf(fid,'       "data": %s\n', data_str)
-        # ------------------------------------------------------------------------
-    
-        fprintf(fid,'     }%s\n', use_comma_if(Id != (length(figInfo['data'])-1) ))
+            if not isempty(figInfo['legend_pos']['xy_margin']):
+                fprintf(fid,'  "legend_xy_margin": %s,\n', figInfo['legend_pos']['xy_margin'])
+
+        # axis limits
+        axis_lim_descr = ["xmin", "xmax", "ymin", "ymax"]
+        for I in range(0,length(axis_lim_descr)):
+            if not isnan(figInfo['axislim'][I]):
+                fprintf(fid,'  "%s": %s,\n', axis_lim_descr[I], num_str_array([figInfo['axislim'][I]])[0])
+
+        # time x axis, in milliseconds since 1970-01-01 UTC. With time_offsets, the
+        # x values are written relative to xbase, which keeps them short.
+        if figInfo['xmode'] == 'time':
+            fprintf(fid,'  "xmode": "time",\n')
+            if xbase != 0:
+                fprintf(fid,'  "xbase": %s,\n', num_str_array([xbase])[0])
+
+        if isfinite(xdomain).all():
+            fprintf(fid,'  "xdomain": [%s],\n', ', '.join(num_str_array(xdomain)))
+        if isfinite(ydomain).all():
+            fprintf(fid,'  "ydomain": [%s],\n', ', '.join(num_str_array(ydomain)))
+
+        fprintf(fid,'  "all_data": [\n')
+        fprintf(fid,'%s\n', ', \n'.join(series_strs))
+
+        fprintf(fid,'   ]%s\n', use_comma_if(not isempty(extra_str)))
+
+        # Extra info passed in by user
+        if not isempty(extra_str):
+            fprintf(fid, extra_str)
 
-    fprintf(fid,'   ]%s\n', use_comma_if(not isempty(extra_str)))
+        fprintf(fid,'}\n')
 
-    # Extra info passed in by user
-    if not isempty(extra_str):
-        fprintf(fid, extra_str)
+        fclose(fid)
+    data_filename = fid.name
 
-    fprintf(fid,'}\n')
+    if content_hash:
+        remove_old_versions(json_filename, [data_filename], retention_days)
 
-    fclose(fid)
+    # Static image of the plot to show until the data is loaded, if requested
+    if svg_snapshot:
+        snapshot_str = figure_to_svg(figInfo, 800, 500, svg_id='chart_snapshot')
+    else:
+        snapshot_str = ''
 
     # Finished saving to JSON file, now create HTML file for plotting
     #if not path.exists(html_filename):
-    create_html_for_nvd3(html_filename, json_filename)
+    create_html_for_nvd3(html_filename, page_url(data_filename, html_filename), use_worker, snapshot_str)
+
+    # Only once all the files are written, as set_max_figures() can then drop
+    # the data of the figure
+    figure_exported(figIdx)
 # End output_to_nvd3()
     
 
 # --------------------------------------------------------------------------------    
-def create_html_for_nvd3(html_filename, json_filename):
-    fid = fopen(html_filename,'w')
+def create_html_for_nvd3(html_filename, json_filename, use_worker=0, snapshot_str=''):
+    # The plotting code goes to a runtime file shared by all the pages in the
+    # same folder, so that the HTML page itself is only a small stub.
+    # json_filename is the URL of the data for the page, see page_url().
+    runtime_filename = write_runtime_file(path.dirname(html_filename), 'plot_runtime_nvd3', __get_runtime_str())
 
-    html_str = __get_html_str(json_filename)
-    fprintf(fid,'%s\n',html_str)
+    html_str = __get_html_str(json_filename, use_worker, snapshot_str, runtime_filename)
 
-    fclose(fid)
+    with OutputFile(html_filename) as fid:
+        fprintf(fid,'%s',html_str)
+        fclose(fid)
 
 # --------------------------------------------------------------------------------
-def __get_html_str(json_filename):
+def __get_html_str(json_filename, use_worker, snapshot_str, runtime_filename):
   
     str_array = [
         '<!DOCTYPE html>',
@@ -165,6 +279,7 @@ def __get_html_str(json_filename):
         '  <script src="https://cdnjs.cloudflare.com/ajax/libs/d3/3.5.2/d3.min.js" charset="utf-8"></script>',
         '  <script src="https://cdnjs.cloudflare.com/ajax/libs/nvd3/1.8.5/nv.d3.min.js"></script>',
         '  <link href="https://cdnjs.cloudflare.com/ajax/libs/nvd3/1.8.5/nv.d3.css" rel="stylesheet" type="text/css">',
+        '  <script src="'+runtime_filename+'"></script>',
         '  <style>',
         '    .dashed { stroke-dasharray: 5,5; }',
         '  </style>',
@@ -173,10 +288,36 @@ def __get_html_str(json_filename):
         '<body>',
         '  <div id="chart" style="max-width:800px;">',
         '    <h3 id="chart_title" style="text-align:center;"></h3>',
-        '    <svg style="height:500px"> </svg>',
+        '    <svg style="height:500px"> ' + snapshot_str + '</svg>',
         '  </div>',
         '',
         '  <script>',
+        sprintf('    plot_nvd3_page({ json_url: "%s", use_worker: %i });', json_filename, use_worker),
+        '  </script>',
+        '',
+        '</body>',
+        '</html>',
+        ''
+    ]
+
+    return '\n'.join(str_array)
+
+# --------------------------------------------------------------------------------
+# The runtime is the same for all the pages, so it is only put together once
+__runtime_str = ''
+
+def __get_runtime_str():
+    global __runtime_str
+
+    if not isempty(__runtime_str):
+        return __runtime_str
+
+    str_array = [
+        '// Plotting code for the pages created by output_to_nvd3.py',
+        '// Each page calls plot_nvd3_page({ json_url: ..., use_worker: ... })',
+        '',
+    ] + get_worker_str_array() + [
+        '',
         '    function onDataReceived(data_ext, div_id) {',
         '        var xlabel = (data_ext.xlabel == undefined) ? "" : data_ext.xlabel;',
         '        var ylabel = (data_ext.ylabel == undefined) ? "" : data_ext.ylabel;',
@@ -187,8 +328,12 @@ def __get_html_str(json_filename):
         '        var ymin = (data_ext.ymin == undefined) ? "" : data_ext.ymin;',
         '        var ymax = (data_ext.ymax == undefined) ? "" : data_ext.ymax;',
         '',
-        '        var data = transform_data_for_nvd3(data_ext.all_data);',
-        '        var xval_minmax = calc_xval_minmax(data_ext.all_data);',
+        '        // The chart replaces the snapshot image, if any',
+        '        d3.select("#"+div_id+"_snapshot").remove();',
+        '',
+        '        var data = data_ext.all_data;',
+        '        add_x_base(data, data_ext.xbase);',
+        '        resolve_shared_values(data);',
         '        ',
         '        nv.addGraph(function() {',
         '            var chart = nv.models.multiChart();',
@@ -196,10 +341,24 @@ def __get_html_str(json_filename):
         '            //chart.useInteractiveGuideline(true);  //Nice looking tooltips and a guideline',
         '            chart.showLegend(true);       //Show the legend, allowing users to turn on/off line series.',
         '            ',
+        '            // Points are [x, y] pairs, read in place by these accessors',
+        '            chart.x(function(d) { return d[0]; });',
+        '            chart.y(function(d) { return d[1]; });',
+        '',
+        '            // [x, null] points are gaps in the data, where the lines break',
+        '            chart.lines1.defined(function(d) { return d[1] !== null; });',
+        '            ',
         '            ',
         '            //Chart x-axis settings',
         '            if (xlabel != "") { chart.xAxis.axisLabel(xlabel); }',
         '            //chart.xAxis.tickFormat(d3.format(",r"));',
+        '            if (data_ext.xmode == "time")',
+        '            {',
+        '                // x values in milliseconds since 1970-01-01 UTC',
+        '                var days = (data_ext.xdomain == undefined) ? 0 : (data_ext.xdomain[1] - data_ext.xdomain[0])/86400000;',
+        '                var time_format = d3.time.format.utc(days > 2 ? "%Y-%m-%d" : "%Y-%m-%d %H:%M");',
+        '                chart.xAxis.tickFormat(function(d) { return time_format(new Date(d)); });',
+        '            }',
         '            ',
         '            //Chart y-axis settings',
         '            if (ylabel != "") { chart.yAxis1.axisLabel(ylabel); }',
@@ -212,14 +371,19 @@ def __get_html_str(json_filename):
         '            // NVD3 does not support legend positioning (minimal options, for a couple of chart types)',
         '',
         '            // xmin, xmax, ymin, ymax',
-        '            // Neither of the approaches below work in NVD3',
-        '            //chart.forceX([xmin, xmax]);',
-        '            //chart.forceY([ymin, ymax]);',
-        '            //chart.xAxis.scale().domain([xmin, xmax]);',
-        '            //chart.yAxis1.scale().domain([ymin, ymax]);',
+        '            // xdomain and ydomain are precomputed by output_to_nvd3(), and already',
+        '            // include any xmin, xmax, ymin, ymax limits',
+        '            // (chart.forceX() and chart.xAxis.scale().domain() do not work in NVD3)',
+        '            if (!(data_ext.ydomain == undefined)) { chart.yDomain1(data_ext.ydomain); }',
         '',
         '            // Add fix for bug in NVD3 which doesnt align the scatter plots correctly on the x-axis',
-        '            chart.scatters1.xDomain(xval_minmax);',
+        '            if (!(data_ext.xdomain == undefined)) { chart.scatters1.xDomain(data_ext.xdomain); }',
+        '',
+        '            // Marker shape of each scatter series. The scatter model tags each point',
+        '            // with the index of its series among the visible scatter series.',
+        '            var shapes = scatter_shapes(data);',
+        '            chart.scatters1.pointShape(function(d) { return shapes[d.series] || "circle"; });',
+        '            chart.legend.dispatch.on("stateChange.shapes", function() { shapes = scatter_shapes(data); });',
         '',
         '            /* Done setting the chart up. Time to render it*/',
         '            var myData = data;',
@@ -239,154 +403,83 @@ def __get_html_str(json_filename):
         '        ',
         '    } // Ends onDataReceived()',
         '',
-        '    function transform_data_for_nvd3(data) {',
-        '        /*',
-        '          Input data is in the format: ',
-        '          [',
-        '            {',
-        '              "label": "Bob",',
-        '              "lines": { "show": "true" },',
-        '              "points": { "symbol": "triangle", "show": "true" },',
-        '              "color": "rgb(0, 0, 255)",',
-        '              "data": [ [1, 0.16246], [2, -0.490934], [3, 0.030281], [4, 0.604252], [5, 0.837906], [6, -0.408311], [7, -0.659382], [8, 0.856244], [9, 0.814229], [10, 0.102328] ]',
-        '            }, ',
-        '            {',
-        '              "label": "Mike",',
-        '              "lines": { "show": "true" },',
-        '              "points": { "symbol": "square", "show": "true" },',
-        '              "color": "rgb(255, 0, 0)",',
-        '              "data": [ [1, -0.243522], [2, 0.590499], [3, -0.679284], [4, -0.0370529], [5, -1.08272], [6, 0.984992], [7, 0.466757], [8, -1.5899], [9, 0.814412], [10, 0.971441] ]',
-        '            }',
-        '           ]',
-        '           ',
-        '           NVD3 expects data in this format:',
-        '           [',
-        '            {',
-        '                values: sin,      //values - represents the array of {x,y} data points',
-        '                key: "Sine Wave", //key  - the name of the series.',
-        '                color: "#ff7f0e",  //color - optional: choose your own line color.',
-        '                type: "line",',
-        '                yAxis: 1',
-        '            },',
-        '            {',
-        '                values: cos,',
-        '                key: "Cosine Wave",',
-        '                color: "#2ca02c",',
-        '                type: "line",',
-        '                yAxis: 1,',
-        '                classed: "dashed"  ',
-        '            },',
-        '            {',
-        '                values: cos,',
-        '                key: "Cosine Wave2",',
-        '                color: "#2ca02c",',
-        '                type: "scatter",',
-        '                yAxis: 1,',
-        '                classed: "no_legend"  ',
-        '            }',
-        '           ]',
-        '        */',
-        '        var results = []',
+        '    function add_x_base(data, xbase) {',
+        '        // With time_offsets, x values are written relative to xbase',
+        '        if (!xbase) { return; }',
         '        for (var idx = 0; idx < data.length; idx++)',
         '        {',
-        '            var data_k = data[idx];',
-        '            var marker_type = "";',
-        '            var marker_type_map = {',
-        '                circle: "circle",',
-        '                square: "square",',
-        '                diamond: "diamond",',
-        '                cross: "cross",',
-        '                triangle: "triangle-up" };',
-        '            if(!(data_k.points == undefined))',
-        '            {',
-        '                marker_type = marker_type_map[data_k.points.symbol];',
-        '            }',
+        '            var values = data[idx].values || [];',
+        '            for (var i = 0; i < values.length; i++) { values[i][0] += xbase; }',
+        '        }',
+        '    }',
         '',
-        '            var line_type = "";',
-        '            if(!(data_k.lines == undefined))',
-        '            {',
-        '                line_type = "line";',
-        '            }',
-        '            if(!(data_k.dashes == undefined))',
-        '            {',
-        '                line_type = "dashed";',
-        '            }',
-        '            ',
-        '            var data_vals = [];',
-        '            for (var i = 0; i < data_k.data.length; i++)',
+        '    function resolve_shared_values(data) {',
+        '        // A scatter series with markers for a line series shares the values',
+        '        // of that line series, instead of carrying its own copy',
+        '        for (var idx = 0; idx < data.length; idx++)',
+        '        {',
+        '            if (!(data[idx].values_from == undefined))',
         '            {',
-        '                var d = {x: data_k.data[i][0], y: data_k.data[i][1]};',
-        '                if (marker_type != "") { d.shape = marker_type; }',
-        '                data_vals.push(d);',
-        '            }',
-        '            ',
-        '            var result = { key: data_k.label,',
-        '                           values: data_vals,',
-        '                           color: data_k.color,',
-        '                           yAxis: 1 };',
-        '            if (line_type == "")',
-        '            {',
-        '                if(marker_type == "")',
-        '                {',
-        '                    // We should never be here',
-        '                    // Maybe give the user an error?',
-        '                }',
-        '                else',
-        '                {',
-        '                    // We have a line with only markers',
-        '                    result.type = "scatter";',
-        '                    results.push(result);',
-        '                }',
-        '            }',
-        '            else',
-        '            {',
-        '                if (line_type == "dashed")',
-        '                {',
-        '                    result.classed = "dashed";',
-        '                }',
-        '                ',
-        '                result.type = "line";',
-        '                results.push(result);',
-        '                ',
-        '                if(marker_type != "")',
-        '                {',
-        '                    // We have a line plus markers',
-        '                    result2 = $.extend({}, result);',
-        '                    result2.type = "scatter";',
-        '                    result2.classed = "no_legend";',
-        '                    results.push(result2);',
-        '                }',
+        '                var values = data[data[idx].values_from].values;',
+        '                var stats = data[data[idx].values_from].stats;',
+        '                var has_gaps = (stats == undefined) ? values.some(function(d) { return d[1] === null; }) : stats.gaps;',
+        '                // No markers at the gaps',
+        '                data[idx].values = has_gaps ? values.filter(function(d) { return d[1] !== null; }) : values;',
         '            }',
         '        }',
-        '',
-        '        return results;',
         '    }',
         '',
-        '    function calc_xval_minmax(data)',
-        '    {',
-        '        var xmin = Infinity;',
-        '        var xmax = -Infinity;',
-        '        ',
+        '    function scatter_shapes(data) {',
+        '        var shapes = [];',
         '        for (var idx = 0; idx < data.length; idx++)',
         '        {',
-        '            var data_k = data[idx];',
-        '            for (var i = 0; i < data_k.data.length; i++)',
+        '            if (data[idx].type == "scatter" && !data[idx].disabled) { shapes.push(data[idx].shape); }',
+        '        }',
+        '        return shapes;',
+        '    }',
+        '',
+        '    function plot_nvd3_page(cfg) {',
+        '        // With use_worker, the data is fetched, parsed and decimated in a Web Worker,',
+        '        // falling back to loading it on the main thread if the worker cannot run',
+        '        if (cfg.use_worker)',
+        '        {',
+        '            plot_worker_start(cfg.json_url, "values", Math.max($("#chart").width(), 100),',
+        '                function(msg) { set_worker_values(msg.data_ext.all_data, msg.series); onDataReceived(msg.data_ext, "chart"); },',
+        '                function(err) { load_data(cfg.json_url); });',
+        '        }',
+        '        else',
+        '        {',
+        '            load_data(cfg.json_url);',
+        '        }',
+        '    }',
+        '',
+        '    function load_data(json_url) {',
+        '        $.ajax({',
+        '            url: json_url,',
+        '            method: "GET",',
+        '            dataType: "json",',
+        '            success: (function(div_id) { return function(response) {onDataReceived(response, div_id);}})("chart")',
+        '        });',
+        '    }',
+        '',
+    ] + get_worker_client_str_array() + [
+        '',
+        '    function set_worker_values(data, series) {',
+        '        // The worker sends the decimated points as [x1, y1, x2, y2, ...] arrays',
+        '        for (var idx = 0; idx < series.length; idx++)',
+        '        {',
+        '            if (series[idx] == null) { continue; } // values_from series',
+        '            var points = series[idx].points;',
+        '            var values = new Array(points.length/2);',
+        '            for (var i = 0; i < values.length; i++)',
         '            {',
-        '                x = data_k.data[i][0];',
-        '                xmin = Math.min(xmin, x);',
-        '                xmax = Math.max(xmax, x);',
+        '                var y = points[2*i+1];',
+        '                values[i] = [points[2*i], (y !== y) ? null : y];',
         '            }',
+        '            data[idx].values = values;',
         '        }',
-        '        return [xmin, xmax];',
         '    }',
         '',
-        '    $.ajax({',
-        sprintf('            url: "%s",',json_filename),
-        '        method: "GET",',
-        '        dataType: "json",',
-        '        success: (function(div_id) { return function(response) {onDataReceived(response, div_id);}})("chart")',
-        '    });',
-        '',
         '    ',
         '    function clean_legend() {',
         '        objs = d3.selectAll(".nv-legend text")[0];',
@@ -413,17 +506,9 @@ def __get_html_str(json_filename):
         '        }',
         '    }',
         '',
-        '</script>',
-        '',
-        '</body>',
-        '</html>'
+        ''
     ]
 
-    str = ''
-    for I in range(0,length(str_array)):
-        str += sprintf('%s\n',str_array[I])
-
-    return str
-
-
+    __runtime_str = '\n'.join(str_array)
 
+    return __runtime_str
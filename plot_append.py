@@ -0,0 +1,153 @@
+"""
+   Module to be used with output_to_flot.py, for exporting figures whose series
+   only grow over time, e.g. a daily job that adds a few points to a long
+   history.
+
+   Next to the JSON file, a manifest records how many points of each series have
+   been written so far. As long as the rest of the figure is unchanged, later
+   exports only write the new points, to a segment file, and the page appends
+   the segments to the data of the JSON file.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import os
+import json
+import hashlib
+from os import path
+
+from matlab_utils import *
+from plot_encoding import as_vector
+from output_files import OutputFile
+
+# --------------------------------------------------------------------------------
+def manifest_filename_for(json_filename):
+    # data/plot.json -> data/plot.manifest.json
+    return regexprep(json_filename, '\.json$', '') + '.manifest.json'
+
+
+# --------------------------------------------------------------------------------
+def figure_meta_hash(figInfo, extra_str=''):
+    # Hash of everything in the figure other than the data points. Segments can
+    # only be added while this stays the same.
+    meta = dict([(key, val) for (key, val) in figInfo.items() if key not in ('data', 'hold_on', 'rings')])
+    meta['num_series'] = length(figInfo['data'])
+    meta['extra_str']  = extra_str
+
+    return hashlib.sha1(json.dumps(meta, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+
+# --------------------------------------------------------------------------------
+def read_manifest(manifest_filename):
+    # Returns the manifest written by write_manifest(), or None if there is no
+    # usable one
+    if not path.exists(manifest_filename):
+        return None
+
+    try:
+        fid = open(manifest_filename, 'r')
+        try:
+            return json.load(fid)
+        finally:
+            fid.close()
+    except ValueError:
+        return None
+
+
+# --------------------------------------------------------------------------------
+def write_manifest(manifest_filename, manifest):
+    manifest_str = json.dumps(manifest, sort_keys=True, indent=2)
+    with OutputFile(manifest_filename) as fid:
+        fprintf(fid, '%s\n', manifest_str)
+        fclose(fid)
+
+
+# --------------------------------------------------------------------------------
+def new_manifest(figInfo, extra_str, base_filename, next_segment=1):
+    # Manifest for a JSON file that was just written with all the points of figInfo
+    manifest = {'meta_hash': figure_meta_hash(figInfo, extra_str),
+                'base': base_filename,
+                'segments': [],
+                'next_segment': next_segment}
+    __set_high_water_marks(manifest, figInfo)
+
+    return manifest
+
+
+# --------------------------------------------------------------------------------
+def appended_points(manifest, figInfo, extra_str=''):
+    # Returns, for each series, the index of the first point not yet written, or
+    # None if the figure has changed in any other way since the manifest was
+    # written, and needs to be exported in full
+    if manifest is None or manifest['meta_hash'] != figure_meta_hash(figInfo, extra_str):
+        return None
+
+    if not path.exists(manifest['base']) or not all([path.exists(f) for f in manifest['segments']]):
+        return None
+
+    start_idx = []
+    for (series, num_written, last_xy) in zip(figInfo['data'], manifest['counts'], manifest['last_points']):
+        x = as_vector(series['x'])
+        y = as_vector(series['y'])
+        if len(x) < num_written:
+            return None
+
+        # The last point written must still be the same, otherwise the series was
+        # not only appended to
+        if num_written > 0 and not (__same_value(x[num_written-1], last_xy[0]) and
+                                    __same_value(y[num_written-1], last_xy[1])):
+            return None
+
+        start_idx.append(num_written)
+
+    return start_idx
+
+
+# --------------------------------------------------------------------------------
+def add_segment(manifest, figInfo, segment_filename):
+    # Records that the points up to the end of each series are now written
+    if not isempty(segment_filename):
+        manifest['segments'].append(segment_filename)
+    manifest['next_segment'] += 1
+    __set_high_water_marks(manifest, figInfo)
+
+
+# --------------------------------------------------------------------------------
+def remove_segments(segment_filenames):
+    for segment_filename in segment_filenames:
+        if path.exists(segment_filename):
+            os.remove(segment_filename)
+
+
+# --------------------------------------------------------------------------------
+def __set_high_water_marks(manifest, figInfo):
+    manifest['counts'] = []
+    manifest['last_points'] = []
+
+    for series in figInfo['data']:
+        x = as_vector(series['x'])
+        y = as_vector(series['y'])
+        manifest['counts'].append(len(x))
+        manifest['last_points'].append([float(x[-1]), float(y[-1])] if len(x) > 0 else [])
+
+
+def __same_value(a, b):
+    return a == b or (a != a and b != b)  # NaN == NaN here
@@ -0,0 +1,78 @@
+"""
+   Checks of the functions in plot_append.py, run with
+      python plot_append_test.py
+   or with pytest.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+"""
+
+import os
+import copy
+import shutil
+import tempfile
+from os import path
+
+from numpy import nan
+
+from matlab_utils import *
+from plot_append import new_manifest, add_segment, appended_points
+
+# --------------------------------------------------------------------------------
+def test_appended_points():
+    folder = tempfile.mkdtemp()
+    try:
+        base_filename = path.join(folder, 'plot.json')
+        __write_file(base_filename)
+
+        figInfo  = __fig_info([1, 2, 3], [4, 5, nan])
+        manifest = new_manifest(figInfo, '', base_filename)
+
+        # Nothing new yet, then the points from index 3 on
+        assert appended_points(manifest, figInfo) == [3]
+        figInfo['data'][0] = {'x': [1, 2, 3, 4, 5], 'y': [4, 5, nan, 7, 8]}
+        assert appended_points(manifest, figInfo) == [3]
+
+        # Once written as a segment, only the points after it
+        segment_filename = path.join(folder, 'plot.seg1.json')
+        __write_file(segment_filename)
+        add_segment(manifest, figInfo, segment_filename)
+        assert appended_points(manifest, figInfo) == [5]
+
+        # Anything other than new points at the end needs a full export
+        changed = copy.deepcopy(figInfo)
+        changed['data'][0]['y'][4] = 0
+        assert appended_points(manifest, changed) is None
+
+        changed = copy.deepcopy(figInfo)
+        changed['data'][0] = {'x': [1, 2, 3], 'y': [4, 5, nan]}
+        assert appended_points(manifest, changed) is None
+
+        changed = copy.deepcopy(figInfo)
+        changed['title'] = 'Another title'
+        assert appended_points(manifest, changed) is None
+
+        assert appended_points(manifest, figInfo, extra_str='"grid": {}') is None
+        assert appended_points(None, figInfo) is None
+
+        # So do missing files
+        os.remove(segment_filename)
+        assert appended_points(manifest, figInfo) is None
+    finally:
+        shutil.rmtree(folder)
+
+
+# --------------------------------------------------------------------------------
+def __fig_info(x, y):
+    # The part of a figure of matlab_plot_functions.py that plot_append.py uses
+    return {'data': [{'x': x, 'y': y}], 'title': 'Title', 'legend': [], 'hold_on': 0}
+
+
+def __write_file(filename):
+    fid = open(filename, 'w')
+    fid.write('{}')
+    fid.close()
+
+
+if __name__ == '__main__':
+    test_appended_points()
+    print('All plot_append.py checks passed')
@@ -0,0 +1,125 @@
+"""
+   Module to be used with matlab_plot_functions.py, with the registry of the
+   output backends, i.e. the functions that export a figure.
+
+   Backends are registered by name, as a function or as a 'module:function'
+   string, and their modules are only imported when the backend is first used.
+   This way, a script that only uses output_to_flot never imports matplotlib.
+   Other packages can add backends through the entry point group
+   'matlab_plot_functions.backends', e.g. in their setup.py:
+
+       entry_points={'matlab_plot_functions.backends': ['svg = my_package.svg:output_to_svg']}
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import importlib
+
+from matlab_utils import *
+
+__entry_point_group = 'matlab_plot_functions.backends'
+
+# Backend name -> function, or 'module:function' until it is first used
+__backends = {'flot':       'output_to_flot:output_to_flot',
+              'nvd3':       'output_to_nvd3:output_to_nvd3',
+              'matplotlib': 'output_to_matplotlib:output_to_matplotlib',
+              'png':        'output_to_matplotlib:output_to_png'}
+
+__entry_points_loaded = 0
+
+# --------------------------------------------------------------------------------
+def register_backend(name, backend):
+    # backend is either a function f(figIdx, ...), or a 'module:function' string,
+    # to import the module only when the backend is first used
+    if not (callable(backend) or (ischar(backend) and ':' in backend)):
+        error('backend must be a function or a \'module:function\' string')
+
+    __backends[name] = backend
+
+
+# --------------------------------------------------------------------------------
+def get_backend(name):
+    # Returns the function of backend name, importing its module if needed
+    if name not in __backends:
+        __load_entry_points()
+
+    if name not in __backends:
+        error('Unknown backend %s. Available backends: %s', name, ', '.join(available_backends()))
+
+    backend = __backends[name]
+    if not callable(backend):
+        module_name, func_name = backend.split(':')
+        backend = getattr(importlib.import_module(module_name), func_name)
+        __backends[name] = backend
+
+    return backend
+
+
+# --------------------------------------------------------------------------------
+def available_backends():
+    __load_entry_points()
+    return sorted(__backends.keys())
+
+
+# --------------------------------------------------------------------------------
+def __load_entry_points():
+    # Only done when a backend that is not built in is asked for, as scanning the
+    # installed packages takes a while
+    global __entry_points_loaded
+
+    if __entry_points_loaded:
+        return
+    __entry_points_loaded = 1
+
+    try:
+        from importlib.metadata import entry_points
+        try:
+            found = entry_points(group=__entry_point_group)
+        except TypeError:
+            found = entry_points().get(__entry_point_group, [])
+        found = [(ep.name, ep.value) for ep in found]
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return
+        found = [(ep.name, ep.module_name + ':' + '.'.join(ep.attrs))
+                 for ep in pkg_resources.iter_entry_points(__entry_point_group)]
+
+    for (name, value) in found:
+        # Built-in and explicitly registered backends take precedence
+        if name not in __backends:
+            __backends[name] = value
+
+
+# --------------------------------------------------------------------------------
+class LazyModule(object):
+    # Stands in for a module, and imports it on first attribute access, e.g.
+    # plt = LazyModule('matplotlib.pyplot')
+
+    def __init__(self, module_name):
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._module_name)
+        return getattr(self._module, attr)
@@ -0,0 +1,342 @@
+"""
+   Command-line entry point for rendering many figures from data files at once,
+   without writing a script for each report:
+
+      python -m matlab_plot_functions render spec.json [--workers 8] [--output-dir out]
+
+   or to keep rendering them, as their data files change (see plot_watch.py):
+
+      python -m matlab_plot_functions watch spec.json [--workers 8] [--poll 1] [--debounce 2]
+
+   spec.json describes the figures, e.g.
+
+      { "output_dir": "reports", "targets": ["flot", "png"], "num_workers": 8,
+        "figures": [
+          { "name": "latency", "title": "Latency", "xlabel": "Time (s)", "ylabel": "ms",
+            "grid": true, "legend_location": "northwest", "axis": [0, null, 0, 250],
+            "series": [
+              { "file": "latency.csv", "x": "time", "y": "p50", "fmt": "b",   "label": "p50" },
+              { "file": "latency.csv", "x": "time", "y": "p99", "fmt": "r--", "label": "p99" } ] },
+          { "name": "sizes", "targets": ["nvd3"],
+            "series": [ { "file": "sizes.npy", "y": 0, "hist": 50, "fmt": "g" } ] } ] }
+
+   Columns are indexes, or names from the header line of text files. Without
+   "x", the x values are 1, 2, 3, ... Data file paths are relative to the
+   spec file. .npy files are memory-mapped, and text files are parsed in
+   blocks with NumPy's C parser, so large files load quickly. The figures are
+   rendered by a pool of worker processes, each exporting with export().
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import os
+import sys
+from os import path
+import io
+import json
+import time
+import argparse
+import warnings
+import functools
+import traceback
+import multiprocessing
+from numpy import load, fromstring, genfromtxt, arange, concatenate, float64
+
+from matlab_utils import *
+from matlab_plot_functions import figure, clf, hold, plot, hist, grid, legend, title, xlabel, ylabel, \
+                                  axisset, export, close
+from plot_watch import watch_figure, watch_figures
+
+# Text files are read and parsed this many bytes at a time
+__block_bytes = 1 << 24
+
+# The file written for each target, after the figure name
+__target_suffixes = {'flot': '.html', 'nvd3': '.nvd3.html', 'png': '.png'}
+
+# --------------------------------------------------------------------------------
+def main(argv):
+    parser = argparse.ArgumentParser(prog='python -m matlab_plot_functions')
+    commands = parser.add_subparsers(dest='command')
+
+    render_parser = commands.add_parser('render', help='render the figures described in a JSON spec file')
+    watch_parser  = commands.add_parser('watch', help='render them again whenever their data files change')
+    for command_parser in [render_parser, watch_parser]:
+        command_parser.add_argument('spec', help='JSON spec file')
+        command_parser.add_argument('-j', '--workers', type=int, default=None,
+                                    help='number of worker processes (default: "num_workers" in the spec, or 1)')
+        command_parser.add_argument('-o', '--output-dir', default=None,
+                                    help='folder for the output files (default: "output_dir" in the spec, or .)')
+
+    watch_parser.add_argument('--poll', type=float, default=1.0, help='seconds between checks of the data files')
+    watch_parser.add_argument('--debounce', type=float, default=2.0,
+                              help='seconds a data file must stay unchanged before its figures are rendered')
+
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = __native_strings(json.load(f))
+
+    if args.workers is not None:
+        spec['num_workers'] = args.workers
+    if args.output_dir is not None:
+        spec['output_dir'] = args.output_dir
+
+    if args.command == 'watch':
+        watch(spec, path.dirname(path.abspath(args.spec)), args.poll, args.debounce)
+        return 0
+
+    results = render(spec, path.dirname(path.abspath(args.spec)))
+
+    num_failed = 0
+    for (name, err, elapsed) in results:
+        if err is None:
+            sys.stdout.write('%s: ok (%.2fs)\n' % (name, elapsed))
+        else:
+            num_failed += 1
+            sys.stderr.write('%s: FAILED\n%s\n' % (name, err))
+
+    sys.stdout.write('%i figures rendered, %i failed\n' % (len(results) - num_failed, num_failed))
+    return 1 if num_failed > 0 else 0
+
+
+# --------------------------------------------------------------------------------
+def render(spec, spec_dir='.'):
+    # Renders all the figures of spec (as described above) and returns, for each
+    # one, (name, None or the error, seconds taken). A figure that fails does not
+    # stop the others.
+    output_dir = spec.get('output_dir', '.')
+    if not path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    tasks = [(fig_spec, spec, spec_dir) for fig_spec in spec['figures']]
+
+    num_workers = min(spec.get('num_workers', 1), len(tasks))
+    if num_workers <= 1:
+        return [__render_task(task) for task in tasks]
+
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        return pool.map(__render_task, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def watch(spec, spec_dir='.', poll_interval=1.0, debounce=2.0, max_seconds=None):
+    # Renders the figures of spec whenever their data files change, see
+    # watch_figures() in plot_watch.py, until interrupted or for max_seconds
+    output_dir = spec.get('output_dir', '.')
+    if not path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    for fig_spec in spec['figures']:
+        watch_figure(fig_spec['name'], functools.partial(draw_figure, fig_spec, spec_dir),
+                     [path.join(spec_dir, series_spec['file']) for series_spec in fig_spec['series']],
+                     figure_targets(fig_spec, output_dir, spec.get('targets', ['flot'])))
+
+    def report(name, err, elapsed):
+        if err is None:
+            sys.stdout.write('%s: ok (%.2fs)\n' % (name, elapsed))
+        else:
+            sys.stderr.write('%s: FAILED\n%s\n' % (name, err))
+        sys.stdout.flush()
+
+    return watch_figures(poll_interval, debounce, spec.get('num_workers', 1), report, max_seconds)
+
+
+def __render_task(task):
+    (fig_spec, spec, spec_dir) = task
+    name = fig_spec.get('name', '?')
+    start = time.time()
+    try:
+        render_figure(fig_spec, spec.get('output_dir', '.'), spec.get('targets', ['flot']), spec_dir)
+        return (name, None, time.time() - start)
+    except Exception:
+        return (name, traceback.format_exc(), time.time() - start)
+    finally:
+        close('all')
+
+
+# --------------------------------------------------------------------------------
+def render_figure(fig_spec, output_dir='.', targets=['flot'], spec_dir='.'):
+    # Draws fig_spec in figure 1, and exports it to fig_spec['targets'] (or
+    # targets), in output_dir
+    figure(1)
+    draw_figure(fig_spec, spec_dir)
+    export(1, figure_targets(fig_spec, output_dir, targets))
+
+
+def figure_targets(fig_spec, output_dir='.', targets=['flot']):
+    # The targets for export(): a file in output_dir, named after the figure, for
+    # each backend in fig_spec['targets'] (or targets)
+    return dict([(target, path.join(output_dir, fig_spec['name'] + __target_suffixes.get(target, '.' + target)))
+                 for target in fig_spec.get('targets', targets)])
+
+
+def draw_figure(fig_spec, spec_dir='.'):
+    # Draws fig_spec into the current figure, with the plotting functions
+    clf()
+    hold('on')
+
+    labels = []
+    for series_spec in fig_spec['series']:
+        filename = path.join(spec_dir, series_spec['file'])
+        plot_fmt = series_spec.get('fmt', 'b')
+
+        if 'hist' in series_spec:
+            (data,) = read_columns(filename, [series_spec.get('y', 0)],
+                                   series_spec.get('delimiter'), series_spec.get('skiprows', 0))
+            hist(data, series_spec['hist'], plot_fmt)
+        else:
+            if 'x' in series_spec:
+                (x, y) = read_columns(filename, [series_spec['x'], series_spec['y']],
+                                      series_spec.get('delimiter'), series_spec.get('skiprows', 0))
+            else:
+                (y,) = read_columns(filename, [series_spec['y']],
+                                    series_spec.get('delimiter'), series_spec.get('skiprows', 0))
+                x = arange(1, len(y) + 1)
+            plot(x, y, plot_fmt)
+
+        labels.append(series_spec.get('label', ''))
+
+    if any(labels):
+        if 'legend_location' in fig_spec:
+            legend(*(labels + ['Location', fig_spec['legend_location']]))
+        else:
+            legend(*labels)
+
+    if 'title' in fig_spec:
+        title(fig_spec['title'])
+    if 'xlabel' in fig_spec:
+        xlabel(fig_spec['xlabel'])
+    if 'ylabel' in fig_spec:
+        ylabel(fig_spec['ylabel'])
+    if fig_spec.get('grid'):
+        grid('on')
+
+    # [xmin, xmax, ymin, ymax], with null for the limits that are not set
+    axis_lims = fig_spec.get('axis', [])
+    axis_idx  = [I+1 for I in range(0,len(axis_lims)) if axis_lims[I] is not None]
+    if axis_idx:
+        axisset(axis_idx, [axis_lims[I-1] for I in axis_idx])
+
+
+# --------------------------------------------------------------------------------
+def read_columns(filename, columns, delimiter=None, skiprows=0):
+    # Returns the given columns of a data file, as float arrays. For .npy files,
+    # columns index the 2nd dimension (column 0 of a 1-D array is the array),
+    # and the file is memory-mapped. For .npz files, columns are member names.
+    # Anything else is a text file, with columns separated by delimiter (by
+    # default a comma if the first line has one, or else whitespace), and names
+    # for them in the first line (after skiprows), if it is not all numbers.
+    if filename.endswith('.npy'):
+        data = load(filename, mmap_mode='r')
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        return [data[:, col].astype(float64) for col in columns]
+
+    if filename.endswith('.npz'):
+        with load(filename) as data:
+            return [data[col].astype(float64).ravel() for col in columns]
+
+    return __read_text_columns(filename, columns, delimiter, skiprows)
+
+
+def __read_text_columns(filename, columns, delimiter, skiprows):
+    with open(filename, 'rb') as f:
+        for I in range(0,skiprows):
+            f.readline()
+
+        first_line = f.readline()
+        if delimiter is None:
+            delimiter = ',' if b',' in first_line else None
+        sep = delimiter.encode('ascii') if delimiter is not None else None
+
+        fields = [field.strip().decode('utf-8') for field in first_line.split(sep)]
+        has_header = not all([__is_number(field) for field in fields])
+
+        col_idx = []
+        for col in columns:
+            if isinstance(col, int):
+                col_idx.append(col)
+            elif has_header and col in fields:
+                col_idx.append(fields.index(col))
+            else:
+                error('Column %s not found in %s', col, filename)
+
+        # Each block ends at the end of a line, and the rest of the line is kept
+        # for the next block
+        pieces  = [[] for col in col_idx]
+        pending = b'' if has_header else first_line
+        while True:
+            block = f.read(__block_bytes)
+            text  = pending + block
+            if block:
+                cut = text.rfind(b'\n') + 1
+                (text, pending) = (text[0:cut], text[cut:])
+
+            if text.strip():
+                values = __parse_text_block(text, delimiter, len(fields))
+                for (I, col) in enumerate(col_idx):
+                    pieces[I].append(values[:, col].copy())
+
+            if not block:
+                break
+
+    return [concatenate(piece) if piece else arange(0.0) for piece in pieces]
+
+
+def __parse_text_block(text, delimiter, num_cols):
+    # Parses whole lines of numbers into a (lines, num_cols) array. fromstring()
+    # does it in C, in one call; blocks it cannot read in full, e.g. with empty
+    # fields or blank lines, go through genfromtxt() instead.
+    lines = text.strip().split(b'\n')
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if delimiter is None:
+            values = fromstring(text, sep=' ')
+        else:
+            values = fromstring(text.replace(b'\r', b'').replace(b'\n', delimiter.encode('ascii')),
+                                sep=delimiter)
+
+    if values.size == len(lines) * num_cols:
+        return values.reshape(len(lines), num_cols)
+
+    return genfromtxt(io.BytesIO(text), delimiter=delimiter).reshape(-1, num_cols)
+
+
+def __native_strings(obj):
+    # JSON strings are unicode in Python 2, where the plotting functions take str
+    if isinstance(obj, dict):
+        return dict([(__native_strings(key), __native_strings(value)) for (key, value) in obj.items()])
+    if isinstance(obj, list):
+        return [__native_strings(value) for value in obj]
+    if not isinstance(obj, str) and isinstance(obj, type(u'')):
+        return obj.encode('utf-8')
+    return obj
+
+
+def __is_number(field):
+    try:
+        float(field)
+        return True
+    except ValueError:
+        return False
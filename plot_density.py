@@ -0,0 +1,117 @@
+"""
+   Module to be used with output_to_flot.py, for drawing scatter plots with
+   too many points to draw one marker each. The points are counted in a 2-D
+   grid with NumPy's histogram2d(), and the grid is written as a PNG image,
+   where the opacity of each pixel grows with the number of points in it. The
+   PNG is encoded here, with zlib, so that no imaging library is needed.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import re
+import zlib
+import struct
+import base64
+from numpy import histogram2d, isfinite, log1p, zeros, uint8, around, concatenate
+
+from matlab_utils import *
+from plot_encoding import as_vector
+
+# Size of the density image, in pixels, about that of the plot area of the page
+__image_width  = 600
+__image_height = 360
+
+# The image is also summed into a coarse grid of cells of this many pixels a
+# side, which the page uses to estimate how many points are in a zoomed range
+__cell_pixels = 20
+
+# --------------------------------------------------------------------------------
+def density_grid(x, y):
+    # Counts the finite points of a series in the pixels of the density image.
+    # Returns the counts, with row 0 at the top (the largest y), and the
+    # [xmin, xmax, ymin, ymax] of the series, which the image spans.
+    x = as_vector(x)
+    y = as_vector(y)
+
+    finite = isfinite(x) & isfinite(y)
+    x = x[finite]
+    y = y[finite]
+
+    if len(x) == 0:
+        return zeros((__image_height, __image_width)), [0, 1, 0, 1]
+
+    extent = [x.min(), x.max(), y.min(), y.max()]
+    for I in (0, 2):
+        if extent[I+1] == extent[I]:
+            extent[I] -= 0.5; extent[I+1] += 0.5
+
+    # histogram2d() bins x along the rows, so the transpose has x along the
+    # columns, and flipping it puts the largest y on the first row
+    counts = histogram2d(x, y, bins=[__image_width, __image_height],
+                         range=[extent[0:2], extent[2:4]])[0]
+
+    return counts.T[::-1], extent
+
+
+# --------------------------------------------------------------------------------
+def coarse_counts(counts):
+    # Sums of counts over cells of __cell_pixels x __cell_pixels pixels, in rows
+    # from the top, as a (rows, columns) array
+    rows = counts.shape[0] // __cell_pixels
+    cols = counts.shape[1] // __cell_pixels
+    return counts[0:rows*__cell_pixels, 0:cols*__cell_pixels].reshape(
+               rows, __cell_pixels, cols, __cell_pixels).sum(axis=3).sum(axis=1)
+
+
+# --------------------------------------------------------------------------------
+def density_png(counts, color_str):
+    # PNG image of counts in the given color ('rgb(r, g, b)' or 'rgba(...)'),
+    # where empty pixels are transparent and the opacity of the others grows with
+    # the log of their count
+    rgb = [int(c) for c in re.findall('\d+', color_str)[0:3]]
+
+    max_count = counts.max()
+    alpha = zeros(counts.shape)
+    if max_count > 0:
+        alpha = (counts > 0) * (0.15 + 0.85*log1p(counts)/log1p(max_count))
+
+    (height, width) = counts.shape
+    pixels = zeros((height, width, 4), dtype=uint8)
+    pixels[:,:,0:3] = rgb
+    pixels[:,:,3]   = around(255*alpha)
+
+    # Each row starts with its filter type, 0 for none
+    raw = concatenate([zeros((height, 1), dtype=uint8), pixels.reshape(height, 4*width)], axis=1)
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            __png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            __png_chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            __png_chunk(b'IEND', b''))
+
+
+def __png_chunk(chunk_type, data):
+    return (struct.pack('>I', len(data)) + chunk_type + data +
+            struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+# --------------------------------------------------------------------------------
+def png_data_uri(png):
+    return 'data:image/png;base64,' + base64.b64encode(png).decode('ascii')
@@ -0,0 +1,467 @@
+"""
+   Module with the helper functions shared by output_to_flot.py and
+   output_to_nvd3.py for turning the series stored by matlab_plot_functions.py
+   into JSON text. All conversions work on whole NumPy arrays at a time,
+   instead of formatting one number per call, and xy_pairs_strs() can spread
+   the work for large figures over several processes.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import os
+import datetime
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from contextlib import contextmanager
+from numpy import asarray, floor, absolute, char, int64, nan, inf, arange, concatenate, unique, array_split, \
+                  isfinite, isnan, flatnonzero, where, maximum, errstate, datetime64, isnat, stack
+
+from matlab_utils import *
+
+# Integers with a magnitude above this are printed with %g, as they do not fit in an int64
+__max_int_val = 2.0**62
+
+# For encoding_pool(): series are split into pieces of at most this many points,
+# so that a few huge series are also spread over the workers
+__piece_len = 1 << 20
+
+# For series_stats(): the index has at least this many points between its entries,
+# as fewer are just as quick to search through without it
+__min_index_step = 256
+
+# The (x, y) pairs being encoded by the workers of encoding_pool(), with their
+# gaps marked. Worker processes get them through fork(), instead of having the
+# arrays pickled and sent to them.
+__series_to_encode = []
+
+# --------------------------------------------------------------------------------
+def as_vector(v):
+    # Works for lists, marrays and numpy arrays alike; marrays come back as plain
+    # 0-based numpy arrays
+    return asarray(v, dtype=float).ravel()
+
+
+# --------------------------------------------------------------------------------
+def is_time_vector(v):
+    # True for datetime64 arrays, and for lists of datetime.datetime or
+    # datetime.date objects. Called on every plot(), so lists are not converted
+    # to arrays: only their first element is looked at.
+    dtype = getattr(v, 'dtype', None)
+    if dtype is not None:
+        if dtype.kind == 'M':
+            return True
+        return dtype.kind == 'O' and v.size > 0 and isinstance(v.flat[0], (datetime.date, datetime64))
+
+    first = v
+    while isinstance(first, (list, tuple)):
+        if len(first) == 0:
+            return False
+        first = first[0]
+    return isinstance(first, (datetime.date, datetime64))
+
+
+# --------------------------------------------------------------------------------
+def time_to_ms(v):
+    # Milliseconds since 1970-01-01 UTC, as floats, with NaT as NaN, converting
+    # the whole array at once
+    t  = asarray(v).astype('datetime64[ms]').ravel()
+    ms = t.astype(int64).astype(float)
+    ms[isnat(t)] = nan
+    return ms
+
+
+# --------------------------------------------------------------------------------
+def time_label(ms, span_ms=0):
+    # e.g. '2017-03-01 14:05', or just the date if span_ms is more than 2 days
+    t = datetime64(int64(ms), 'ms')
+    if span_ms > 2*86400000:
+        return str(t.astype('datetime64[D]'))
+    return str(t.astype('datetime64[m]')).replace('T', ' ')
+
+
+# --------------------------------------------------------------------------------
+def num_str_array(v):
+    # Same output as sprintf('%i' or '%g', x) for each element, i.e. integers
+    # are printed in full and everything else with %g
+    v = as_vector(v)
+
+    strs = char.mod('%g', v).astype(object)
+
+    with errstate(invalid='ignore'):  # NaN never counts as an integer
+        is_int = (floor(v) == v) & (absolute(v) < __max_int_val)
+    if is_int.any():
+        strs[is_int] = char.mod('%d', v[is_int].astype(int64))
+
+    return strs
+
+
+# --------------------------------------------------------------------------------
+def mark_gaps(x, y, trim=1):
+    # Points where x or y is NaN or Inf are missing. Each run of missing points
+    # becomes a single gap point, with y = NaN and a finite x, which is written
+    # as [x, null] and breaks the line there. With trim, the runs at the start
+    # and at the end of the series are dropped instead.
+    x = as_vector(x)
+    y = as_vector(y)
+
+    if len(x) != len(y):
+        error('x and y must have the same number of elements')
+
+    valid = isfinite(x) & isfinite(y)
+    if valid.all():
+        return x, y
+
+    if trim:
+        valid_idx = flatnonzero(valid)
+        if len(valid_idx) == 0:
+            return x[0:0], y[0:0]
+
+        first = valid_idx[0]
+        last  = valid_idx[-1] + 1
+        x = x[first:last]; y = y[first:last]; valid = valid[first:last]
+
+    # Keep the valid points and the first point of each run of missing ones
+    keep = valid.copy()
+    keep[0] = True
+    keep[1:] |= valid[0:-1]
+
+    x = x[keep]
+    y = where(valid[keep], y[keep], nan)
+
+    # A gap point takes the closest finite x before it, or after it at the start
+    x_finite = isfinite(x)
+    if not x_finite.any():
+        return x[0:0], y[0:0]
+
+    last_finite = maximum.accumulate(where(x_finite, arange(len(x)), -1))
+    last_finite[last_finite < 0] = flatnonzero(x_finite)[0]
+
+    return x[last_finite], y
+
+
+# --------------------------------------------------------------------------------
+def xy_pairs_str(x, y, trim_gaps=1):
+    # Returns the JSON text '[ [x1, y1], [x2, y2], ... ]', with gaps as
+    # [x, null], see mark_gaps()
+    return __marked_pairs_str(*mark_gaps(x, y, trim_gaps))
+
+
+def __marked_pairs_str(x, y):
+    pairs_str = __xy_pairs_list_str(x, y)
+
+    if len(pairs_str) == 0:
+        return '[ ]'
+
+    return '[ ' + pairs_str + ' ]'
+
+
+# --------------------------------------------------------------------------------
+def xy_pairs_strs(series_xy, num_workers=1, trim_gaps=1):
+    # Returns xy_pairs_str(x, y) for each (x, y) in series_xy, in the same order.
+    # With num_workers > 1, the series are encoded by that many worker processes,
+    # or threads where fork() is not available, see encoding_pool().
+    with encoding_pool(series_xy, num_workers, trim_gaps) as encode:
+        return encode(range(0,len(series_xy)))
+
+
+# --------------------------------------------------------------------------------
+@contextmanager
+def encoding_pool(series_xy, num_workers=1, trim_gaps=1):
+    # Encodes the series in series_xy as xy_pairs_str() does, over several calls
+    # made for the same export, e.g. one for each chunk file, as in
+    #    with encoding_pool(series_xy, num_workers) as encode:
+    #        strs = encode([0, 1])
+    # for the strings of series 0 and 1. With num_workers > 1, the same worker
+    # processes (or threads, where fork() is not available) encode all of them.
+    # The gaps of all the series are marked before the workers are started, and
+    # the workers get the marked arrays through fork(), so only the indices of
+    # the pieces to encode are sent to them.
+    # trim_gaps is for all the series, or a list with one value for each, with
+    # None for the series whose gaps are already marked, see mark_gaps().
+    global __series_to_encode
+
+    if not isinstance(trim_gaps, list):
+        trim_gaps = [trim_gaps] * len(series_xy)
+
+    def marked_series(Is):
+        (x, y) = series_xy[Is]
+        return (x, y) if trim_gaps[Is] is None else mark_gaps(x, y, trim_gaps[Is])
+
+    if num_workers <= 1:
+        yield lambda indices: [__marked_pairs_str(*marked_series(Is)) for Is in indices]
+        return
+
+    # Done for each whole series, as the pieces do not know what is around them
+    marked_xy = [marked_series(Is) for Is in range(0,len(series_xy))]
+
+    pieces_of_series = [[(Is, start, min(start + __piece_len, len(x))) for start in range(0, len(x), __piece_len)]
+                        for (Is, (x, y)) in enumerate(marked_xy)]
+    num_pieces = sum([len(pieces) for pieces in pieces_of_series])
+
+    # Set before the pool is created, so that forked workers see it too
+    (previous_series, __series_to_encode) = (__series_to_encode, marked_xy)
+
+    num_procs = min(num_workers, max(num_pieces, 1))
+    if not hasattr(os, 'fork'):
+        pool = ThreadPool(num_procs)
+    elif hasattr(multiprocessing, 'get_context'):
+        pool = multiprocessing.get_context('fork').Pool(num_procs)
+    else:
+        pool = multiprocessing.Pool(num_procs)
+
+    def encode(indices):
+        indices = list(indices)
+        piece_strs = pool.map(__encode_piece, [piece for Is in indices for piece in pieces_of_series[Is]],
+                              chunksize=1)
+
+        strs = []
+        for Is in indices:
+            num_series_pieces = len(pieces_of_series[Is])
+            series_strs = piece_strs[0:num_series_pieces]
+            piece_strs  = piece_strs[num_series_pieces:]
+            strs.append('[ ' + ', '.join(series_strs) + ' ]' if series_strs else '[ ]')
+        return strs
+
+    try:
+        yield encode
+    finally:
+        pool.close()
+        pool.join()
+        __series_to_encode = previous_series
+
+
+# --------------------------------------------------------------------------------
+def cached_xy_pairs_strs(series_xy, keys, cache, num_workers=1, trim_gaps=1):
+    # Same as xy_pairs_strs(), for series that are also written by other exporters.
+    # cache is a dict with the strings already made, by (key, trim_gaps), which
+    # only has the missing ones added. keys identify the series in series_xy, and
+    # must include everything their strings depend on, e.g. the x offset.
+    if cache is None:
+        return xy_pairs_strs(series_xy, num_workers, trim_gaps)
+
+    keys = [(key, trim_gaps) for key in keys]
+    missing = [I for I in range(0,len(keys)) if keys[I] not in cache]
+
+    strs = xy_pairs_strs([series_xy[I] for I in missing], num_workers, trim_gaps)
+    for (I, pairs_str) in zip(missing, strs):
+        cache[keys[I]] = pairs_str
+
+    return [cache[key] for key in keys]
+
+
+def __encode_piece(piece):
+    # Runs in a worker process or thread
+    (Is, start, end) = piece
+    x, y = __series_to_encode[Is]
+    return __xy_pairs_list_str(x[start:end], y[start:end])
+
+
+def __xy_pairs_list_str(x, y):
+    # '[x1, y1], [x2, y2], ...', for the output of mark_gaps()
+    x_strs = num_str_array(x)
+    y_strs = num_str_array(y)
+    y_strs[isnan(y)] = 'null'
+
+    return ', '.join(['[%s, %s]' % xy for xy in zip(x_strs, y_strs)])
+
+
+# --------------------------------------------------------------------------------
+def decimate_minmax(x, y, num_buckets):
+    # Splits the points into num_buckets buckets of consecutive points, and keeps
+    # only the min and max y point of each bucket, in their original order.
+    # This keeps the visual envelope of the line with at most 2*num_buckets points.
+    # Gap points (y = NaN, see mark_gaps()) are always kept.
+    x = as_vector(x)
+    y = as_vector(y)
+
+    num_points = len(x)
+    if num_points <= 2*num_buckets:
+        return x, y
+
+    bucket_len  = -(-num_points // num_buckets)  # ceil
+    num_full    = num_points // bucket_len
+    bucket_base = arange(0, num_full*bucket_len, bucket_len)
+
+    y_buckets = y[0:num_full*bucket_len].reshape(num_full, bucket_len)
+    y_gaps    = isnan(y_buckets)
+    idx = unique(concatenate([bucket_base + where(y_gaps, inf, y_buckets).argmin(axis=1),
+                              bucket_base + where(y_gaps, -inf, y_buckets).argmax(axis=1),
+                              flatnonzero(isnan(y)),
+                              arange(num_full*bucket_len, num_points)]))
+
+    return x[idx], y[idx]
+
+
+# --------------------------------------------------------------------------------
+def series_groups(figInfo, separate=()):
+    # Groups of series that can be drawn as one: the line series without a legend
+    # label and with the same line style, color and marker. Returns the indexes
+    # of the series in each group, with the groups in the order of their first
+    # series. The series in separate always get a group of their own.
+    groups = []
+    group_of_style = {}
+
+    for Id in range(0,len(figInfo['data'])):
+        has_label = Id < len(figInfo['legend']) and not isempty(figInfo['legend'][Id])
+        if has_label or Id in separate or figInfo['plot_types'][Id] != 'line':
+            groups.append([Id])
+            continue
+
+        style = (figInfo['linestyles'][Id], figInfo['colors'][Id], figInfo['markers'][Id])
+        if style in group_of_style:
+            group_of_style[style].append(Id)
+        else:
+            group_of_style[style] = [Id]
+            groups.append(group_of_style[style])
+
+    return groups
+
+
+# --------------------------------------------------------------------------------
+def concat_with_gaps(series_xy):
+    # Joins the (x, y) series into a single one, with a missing point between
+    # each two of them, which becomes a gap (see mark_gaps())
+    if len(series_xy) == 1:
+        return series_xy[0]
+
+    gap = asarray([nan])
+    pieces_x = []
+    pieces_y = []
+    for (x, y) in series_xy:
+        pieces_x += [gap, as_vector(x)]
+        pieces_y += [gap, as_vector(y)]
+
+    return concatenate(pieces_x[1:]), concatenate(pieces_y[1:])
+
+
+# --------------------------------------------------------------------------------
+def bar_outline(x, y, width):
+    # The outline of bars of the given width centered on x, from 0 up to y, as
+    # the points of a single line: (left, 0), (left, y), (right, y), (right, 0)
+    # for each bar. For backends that draw bars as filled lines.
+    x = as_vector(x)
+    y = as_vector(y)
+
+    left  = x - width / 2.0
+    right = x + width / 2.0
+    zero  = 0 * y
+
+    return stack([left, left, right, right], axis=1).ravel(), stack([zero, y, y, zero], axis=1).ravel()
+
+
+# --------------------------------------------------------------------------------
+def split_xy(x, y, num_chunks):
+    # Splits the points of a series into num_chunks consecutive pieces
+    return zip(array_split(as_vector(x), num_chunks), array_split(as_vector(y), num_chunks))
+
+
+# --------------------------------------------------------------------------------
+def data_domain(figInfo):
+    # Returns the [xmin, xmax] and [ymin, ymax] of all the series in the figure,
+    # with any limits set through axisset() taking precedence. Missing (NaN or
+    # Inf) values are left out.
+    xmin = ymin = inf
+    xmax = ymax = -inf
+
+    for (Is, series) in enumerate(figInfo['data']):
+        x = as_vector(series['x'])
+        y = as_vector(series['y'])
+        x = x[isfinite(x)]
+        y = y[isfinite(y)]
+
+        # Bars are centered on x, and drawn from y = 0
+        half_width = 0
+        if figInfo['plot_types'][Is] == 'bar':
+            half_width = figInfo['bar_widths'][Is] / 2.0
+            ymin = min(ymin, 0); ymax = max(ymax, 0)
+
+        if len(x) > 0:
+            xmin = min(xmin, x.min() - half_width); xmax = max(xmax, x.max() + half_width)
+        if len(y) > 0:
+            ymin = min(ymin, y.min()); ymax = max(ymax, y.max())
+
+    domain = [xmin, xmax, ymin, ymax]
+    for I in range(0,4):
+        if figInfo['axislim'][I] == figInfo['axislim'][I]:  # i.e. not nan
+            domain[I] = figInfo['axislim'][I]
+
+    return domain[0:2], domain[2:4]
+
+
+# --------------------------------------------------------------------------------
+def series_stats(x, y, bar_width=0, index_points=0, xbase=0):
+    # Returns a dict with the number of points of a series ("count"), the range
+    # of their x and y ("xmin", "xmax", "ymin", "ymax"), whether any points are
+    # missing ("gaps") and whether x never decreases ("sorted"), all from one
+    # pass over the arrays. The page sets its axes and searches the points with
+    # these, instead of scanning the points for them. Missing (NaN or Inf) values
+    # are left out. For bars of bar_width, the ranges cover the whole bars, as in
+    # data_domain(). For x values written relative to xbase, the x ranges are
+    # still of the actual x values.
+    # With index_points > 0, a sorted series with enough points also gets an
+    # "index": the x of every step-th point as written by xy_pairs_str(), at
+    # most index_points of them, which narrows binary searches down to step points.
+    x = as_vector(x)
+    y = as_vector(y)
+
+    valid = isfinite(x) & isfinite(y)
+    xv = x[valid]
+    yv = y[valid]
+
+    stats = {'count': len(xv), 'gaps': len(xv) < len(x), 'sorted': bool((xv[1:] >= xv[0:-1]).all())}
+    if len(xv) == 0:
+        return stats
+
+    half_width = bar_width / 2.0
+    stats['xmin'] = float(xv.min()) - half_width + xbase
+    stats['xmax'] = float(xv.max()) + half_width + xbase
+    stats['ymin'] = float(yv.min())
+    stats['ymax'] = float(yv.max())
+    if bar_width > 0:
+        stats['ymin'] = min(stats['ymin'], 0.0); stats['ymax'] = max(stats['ymax'], 0.0)
+
+    if index_points > 0 and stats['sorted']:
+        if stats['gaps']:
+            (x, y) = mark_gaps(x, y)
+        step = max(__min_index_step, -(-len(x) // index_points))
+        if len(x) > step:
+            stats['index'] = {'length': len(x), 'step': step, 'x': (x[0::step] + xbase).tolist()}
+
+    return stats
+
+
+# --------------------------------------------------------------------------------
+def stats_domain(all_stats, axislim):
+    # Same as data_domain(), from the series_stats() of the series
+    xmin = ymin = inf
+    xmax = ymax = -inf
+
+    for stats in all_stats:
+        if stats['count'] > 0:
+            xmin = min(xmin, stats['xmin']); xmax = max(xmax, stats['xmax'])
+            ymin = min(ymin, stats['ymin']); ymax = max(ymax, stats['ymax'])
+
+    domain = [xmin, xmax, ymin, ymax]
+    for I in range(0,4):
+        if axislim[I] == axislim[I]:  # i.e. not nan
+            domain[I] = axislim[I]
+
+    return domain[0:2], domain[2:4]
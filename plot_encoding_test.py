@@ -0,0 +1,61 @@
+"""
+   Checks of the functions in plot_encoding.py, run with
+      python plot_encoding_test.py
+   or with pytest.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+"""
+
+from numpy import nan, inf, isnan, array_equal
+
+from matlab_utils import *
+from plot_encoding import mark_gaps, xy_pairs_str
+
+# --------------------------------------------------------------------------------
+def test_mark_gaps():
+    x = [1, 2, 3, 4, 5, 6, 7]
+    y = [nan, 1, nan, nan, 2, inf, nan]
+
+    # Each run of missing points becomes one gap, and with trim the runs at the
+    # ends are dropped
+    (gx, gy) = mark_gaps(x, y)
+    __check_series(gx, gy, [2, 3, 5], [1, nan, 2])
+
+    (gx, gy) = mark_gaps(x, y, 0)
+    __check_series(gx, gy, [1, 2, 3, 5, 6], [nan, 1, nan, 2, nan])
+
+    # A missing x also makes a gap, which gets a finite x
+    (gx, gy) = mark_gaps([1, 2, nan, 4], [1, 2, 3, 4])
+    __check_series(gx, gy, [1, 2, 2, 4], [1, 2, nan, 4])
+
+    # Nothing left once trimmed
+    (gx, gy) = mark_gaps([1, 2], [nan, inf])
+    assert len(gx) == 0 and len(gy) == 0
+
+    # Series without missing points are unchanged
+    (gx, gy) = mark_gaps([1, 2, 3], [4, 5, 6])
+    __check_series(gx, gy, [1, 2, 3], [4, 5, 6])
+
+    try:
+        mark_gaps([1, 2], [1])
+        assert False, 'mark_gaps() accepted x and y of different lengths'
+    except Exception as e:
+        assert 'same number of elements' in str(e)
+
+
+def test_gaps_are_written_as_null():
+    assert xy_pairs_str([1, 2, 3, 4], [1, nan, 3, nan]) == '[ [1, 1], [2, null], [3, 3] ]'
+    assert xy_pairs_str([1, 2], [nan, nan]) == '[ ]'
+
+
+# --------------------------------------------------------------------------------
+def __check_series(x, y, expected_x, expected_y):
+    assert array_equal(x, expected_x), (x, expected_x)
+    assert array_equal(isnan(y), isnan(expected_y)), (y, expected_y)
+    assert array_equal(y[~isnan(y)], [v for v in expected_y if v == v]), (y, expected_y)
+
+
+if __name__ == '__main__':
+    for check in [test_mark_gaps, test_gaps_are_written_as_null]:
+        check()
+    print('All plot_encoding.py checks passed')
@@ -0,0 +1,112 @@
+"""
+   Module to be used with matlab_plot_functions.py, with the binning behind
+   hist() and histc(). Values are binned with one NumPy pass per array, and
+   data too large for memory can be given as an iterable of arrays (e.g. a
+   generator reading a file in pieces), which are binned one at a time. Only
+   the counts are kept.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+from numpy import isfinite, linspace, searchsorted, bincount, zeros, int64, diff
+
+from matlab_utils import *
+from plot_encoding import as_vector
+
+# --------------------------------------------------------------------------------
+def hist_counts(data, nbins=10, binrange=None):
+    # As Matlab's hist(): with nbins a number, counts the values of data in nbins
+    # equal bins between their min and max (or binrange, as (lo, hi)); with nbins
+    # a vector, in bins centered at those values. Values outside the bins count in
+    # the first or last bin. Returns the counts, the bin centers and the bin width.
+    if ischar(nbins) or not hasattr(nbins, '__len__'):
+        if binrange is None:
+            if not __is_single_array(data):
+                error('hist() of data given in pieces needs binrange, or the bin centers')
+            values = __finite_values(data)
+            binrange = (values.min(), values.max()) if len(values) > 0 else (0, 1)
+
+        lo, hi = float(binrange[0]), float(binrange[1])
+        if hi == lo:
+            lo, hi = lo - 0.5, hi + 0.5
+
+        edges   = linspace(lo, hi, int(nbins) + 1)
+        centers = (edges[0:-1] + edges[1:]) / 2
+        width   = edges[1] - edges[0]
+    else:
+        centers = as_vector(nbins)
+        if len(centers) < 1 or (diff(centers) <= 0).any():
+            error('hist() bin centers must be increasing')
+        edges = __concat([centers[0]], (centers[0:-1] + centers[1:]) / 2, [centers[-1]])
+        width = diff(centers).min() if len(centers) > 1 else 1.0
+
+    # Bin k is edges[k] <= v < edges[k+1], and the last one also has v == edges[-1]
+    inner_edges = edges[1:-1]
+    counts = zeros(len(centers), dtype=int64)
+    for values in __value_chunks(data):
+        counts += bincount(searchsorted(inner_edges, values, side='right'), minlength=len(centers))
+
+    return counts, centers, width
+
+
+# --------------------------------------------------------------------------------
+def histc_counts(data, edges):
+    # As Matlab's histc(): counts[k] is the number of values with
+    # edges[k] <= v < edges[k+1], and counts[-1] the number of values equal to
+    # edges[-1]. Values outside the edges are not counted.
+    edges = as_vector(edges)
+    if len(edges) < 2:
+        error('histc() needs at least two edges')
+    if (diff(edges) <= 0).any():
+        error('histc() edges must be increasing')
+
+    counts = zeros(len(edges), dtype=int64)
+    for values in __value_chunks(data):
+        idx = searchsorted(edges, values, side='right') - 1
+        in_edges = (idx >= 0) & ((idx < len(edges) - 1) | (values == edges[-1]))
+        counts += bincount(idx[in_edges], minlength=len(edges))
+
+    return counts
+
+
+# --------------------------------------------------------------------------------
+def __is_single_array(data):
+    # Lists, marrays and NumPy arrays have a length, while generators and other
+    # iterables of pieces do not
+    return hasattr(data, '__len__')
+
+
+def __value_chunks(data):
+    if __is_single_array(data):
+        yield __finite_values(data)
+    else:
+        for chunk in data:
+            yield __finite_values(chunk)
+
+
+def __finite_values(v):
+    # NaN and Inf values are not counted
+    v = as_vector(v)
+    return v[isfinite(v)]
+
+
+def __concat(*arrays):
+    return as_vector([val for a in arrays for val in a])
@@ -0,0 +1,237 @@
+"""
+   Module to be used with matlab_plot_functions.py and the output_to_* modules,
+   for opt-in profiling of their memory use. Once start_memory_profiling() is
+   called, plot(), hist() and each export record, per figure and per phase
+   (e.g. "flot", and within it "flot.encode"), the change in resident memory
+   (RSS), and whether the phase raised the peak RSS of the process. Large
+   temporaries, such as the JSON text of the series, are noted in the phase
+   that made them. memory_report() returns it all, and a callback can get each
+   phase as it ends, e.g. to log it before a worker runs out of memory.
+
+   The only peak is the peak RSS of the process, from getrusage() ru_maxrss,
+   which does not go down again: a phase shows a peak only if it went above all
+   earlier ones, as max_rss_growth_bytes.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import sys
+import mmap
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows: no peak RSS
+
+# The last phases recorded, oldest first, with at most this many kept
+__max_records = 10000
+__records = deque(maxlen=__max_records)
+
+__enabled = 0
+__callback = None
+__large_bytes = 1 << 20
+
+# The phases being recorded in each thread, innermost last
+__thread_phases = threading.local()
+
+# --------------------------------------------------------------------------------
+def start_memory_profiling(callback=None, large_bytes=1 << 20):
+    # Starts recording the memory used by each phase, see above. callback, if
+    # given, is called with the record of each phase as it ends. Temporaries of
+    # at least large_bytes are noted.
+    global __enabled, __callback, __large_bytes
+
+    __callback    = callback
+    __large_bytes = large_bytes
+
+    __records.clear()
+    __enabled = 1
+
+
+# --------------------------------------------------------------------------------
+def stop_memory_profiling():
+    # Stops recording, and returns the memory_report() of what was recorded
+    global __enabled, __callback
+
+    report = memory_report()
+
+    __enabled  = 0
+    __callback = None
+
+    return report
+
+
+# --------------------------------------------------------------------------------
+def memory_report():
+    # Returns a dict with
+    #    phases:  the record of each phase, oldest first, see __end_phase()
+    #    figures: for each figure, the number of phases, the time, RSS change and
+    #             peak RSS growth of its outermost phases, and the highest peaks
+    #             of all
+    figures = {}
+    for record in __records:
+        fig = figures.setdefault(record['figure'], {'phases': 0, 'seconds': 0.0, 'rss_delta_bytes': 0,
+                                                    'max_rss_growth_bytes': 0, 'max_rss_bytes': None})
+        fig['phases'] += 1
+        if record['depth'] == 0:
+            fig['seconds'] += record['seconds']
+            fig['rss_delta_bytes'] += record['rss_delta_bytes'] or 0
+            fig['max_rss_growth_bytes'] += record['max_rss_growth_bytes'] or 0
+        fig['max_rss_bytes'] = __max_of(fig['max_rss_bytes'], record['max_rss_bytes'])
+
+    return {'phases':  [dict(record) for record in __records],
+            'figures': figures}
+
+
+# --------------------------------------------------------------------------------
+def memory_phase(figIdx, phase):
+    # Context manager around a phase of the work on figure figIdx, e.g.
+    #    with memory_phase(figIdx, 'flot.encode'):
+    # which does nothing unless profiling is on
+    if not __enabled:
+        return __no_phase
+
+    return __recorded_phase(figIdx, phase)
+
+
+class __NoPhase(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+__no_phase = __NoPhase()
+
+
+@contextmanager
+def __recorded_phase(figIdx, phase):
+    phases = __phases_of_thread()
+    record = {'figure': figIdx, 'phase': phase, 'depth': len(phases), 'failed': False, 'temporaries': []}
+
+    __begin_phase(record)
+    phases.append(record)
+    try:
+        yield record
+    except BaseException:
+        record['failed'] = True
+        raise
+    finally:
+        phases.pop()
+        __end_phase(record)
+
+
+# --------------------------------------------------------------------------------
+def note_temporary(name, obj):
+    # Notes the size of obj (an array, a string, or lists and tuples of those) in
+    # the phase of this thread being recorded, if it is at least large_bytes
+    if not __enabled:
+        return
+
+    phases = __phases_of_thread()
+    if not phases:
+        return
+
+    nbytes = __nbytes(obj)
+    if nbytes >= __large_bytes:
+        phases[-1]['temporaries'].append((name, nbytes))
+
+
+def __nbytes(obj):
+    if hasattr(obj, 'nbytes'):
+        return obj.nbytes
+    if isinstance(obj, (list, tuple)):
+        return sum([__nbytes(item) for item in obj])
+    if isinstance(obj, (bytes, type(u''))):
+        return len(obj)
+    return 0
+
+
+# --------------------------------------------------------------------------------
+def __phases_of_thread():
+    if not hasattr(__thread_phases, 'phases'):
+        __thread_phases.phases = []
+    return __thread_phases.phases
+
+
+def __begin_phase(record):
+    record['_start']   = time.time()
+    record['_rss']     = __rss_bytes()
+    record['_max_rss'] = __max_rss_bytes()
+
+
+def __end_phase(record):
+    # Completes the record of the phase with
+    #    seconds:              how long it took
+    #    rss_delta_bytes:      the change in RSS (None where it cannot be read)
+    #    max_rss_bytes:        the peak RSS of the process so far, from ru_maxrss
+    #                          (None where it cannot be read, e.g. on Windows)
+    #    max_rss_growth_bytes: how much the phase raised that peak
+    #    temporaries:          (name, bytes) of the large temporaries noted
+    rss     = __rss_bytes()
+    max_rss = __max_rss_bytes()
+
+    record['seconds']              = time.time() - record.pop('_start')
+    record['rss_delta_bytes']      = __diff_of(rss, record.pop('_rss'))
+    record['max_rss_bytes']        = max_rss
+    record['max_rss_growth_bytes'] = __diff_of(max_rss, record.pop('_max_rss'))
+
+    __records.append(record)
+
+    if __callback is not None:
+        __callback(dict(record))
+
+
+# --------------------------------------------------------------------------------
+def __rss_bytes():
+    # Current RSS, where /proc is available (Linux)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def __max_rss_bytes():
+    # Peak RSS of the process, in kilobytes on Linux, bytes on macOS
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def __diff_of(after, before):
+    if after is None or before is None:
+        return None
+    return after - before
+
+
+def __max_of(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
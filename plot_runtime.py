@@ -0,0 +1,90 @@
+"""
+   Module to be used with output_to_flot.py and output_to_nvd3.py, to write the
+   Javascript runtime shared by the generated HTML pages.
+
+   The runtime is written once per output folder, under a name that includes a
+   hash of its contents, e.g. plot_runtime_flot.0123456789.js. Each HTML page is
+   then only a small stub that refers to it, and browsers and CDNs can cache the
+   runtime for as long as they like, since a new version gets a new name.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import hashlib
+import shutil
+from os import path, makedirs
+
+from matlab_utils import *
+from output_files import OutputFile
+
+# Files already written or checked by this process, so that exporting many
+# figures to the same folder only touches the disk once per file
+__files_in_place = set()
+
+# --------------------------------------------------------------------------------
+def write_runtime_file(out_dir, runtime_name, runtime_str):
+    # Writes runtime_str to <out_dir>/<runtime_name>.<hash>.js, unless it is
+    # already there, and returns the file name to use in the HTML page
+    runtime_hash     = hashlib.md5(runtime_str.encode('utf-8')).hexdigest()[0:10]
+    runtime_filename = sprintf('%s.%s.js', runtime_name, runtime_hash)
+    runtime_path     = path.join(out_dir, runtime_filename)
+
+    if runtime_path not in __files_in_place:
+        if not path.exists(runtime_path):
+            with OutputFile(runtime_path) as fid:
+                fprintf(fid,'%s',runtime_str)
+                fclose(fid)
+        __files_in_place.add(runtime_path)
+
+    return runtime_filename
+
+
+# --------------------------------------------------------------------------------
+def page_url(filename, html_filename):
+    # The URL of the file filename (the path it was written to) for the page
+    # html_filename, which is relative to the folder of the page, e.g.
+    # data/plot.json for reports/data/plot.json and the page reports/plot.html
+    rel_path = path.relpath(filename, path.dirname(html_filename) or '.')
+    return rel_path.replace(path.sep, '/')
+
+
+# --------------------------------------------------------------------------------
+def copy_vendored_files(out_dir, vendor_folder, filenames, src_folder='flot'):
+    # Copies the Javascript libraries that come with this package, in src_folder,
+    # to <out_dir>/<vendor_folder>, if they are not there already.
+    # Nothing is copied if vendor_folder is a URL or an absolute path.
+    if not isempty(regexp(vendor_folder, '^([a-z]+:)?/')):
+        return
+
+    src_dir = path.join(path.dirname(path.abspath(__file__)), src_folder)
+    dst_dir = path.join(out_dir, vendor_folder)
+
+    for filename in filenames:
+        dst_path = path.join(dst_dir, filename)
+        if dst_path in __files_in_place:
+            continue
+
+        src_path = path.join(src_dir, filename)
+        if not path.exists(dst_path) and path.exists(src_path):
+            if not path.exists(dst_dir):
+                makedirs(dst_dir)
+            shutil.copyfile(src_path, dst_path)
+        __files_in_place.add(dst_path)
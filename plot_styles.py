@@ -0,0 +1,115 @@
+"""
+   Module to be used with matlab_plot_functions.py, with the parsing of the
+   plot_fmt strings given to plot(), e.g. 'r--o' or 'b[alpha:0.5]'. Scripts
+   tend to use the same few format strings over and over, so each one is
+   parsed once, and the PlotStyle for it is kept in a bounded cache and shared
+   by all the series plotted with it.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import re
+from collections import namedtuple
+
+from matlab_utils import *
+
+# linestyle, color_str and marker are what the figures store for each series,
+# e.g. '--', 'rgba(255, 0, 0, 0.5)' and 'circle'. color, marker_char and alpha
+# are the same as in the plot_fmt, e.g. 'r', 'o' and 0.5, which matplotlib
+# understands as they are.
+PlotStyle = namedtuple('PlotStyle', ['linestyle', 'color_str', 'marker', 'color', 'marker_char', 'alpha'])
+
+__fmt_color = {'b':'rgb(0, 0, 255)',  'r':'rgb(255, 0, 0)',  'g':'rgb(0, 255, 0)', 
+               'm':'rgb(255, 0, 255)','c':'rgb(0, 255, 255)','k':'rgb(0, 0,   0)'}
+
+__fmt_marker = {'o':'circle', 's':'square', 'd':'diamond', '^':'triangle', '+':'cross'}
+
+# The reverse lookups, for the styles of figures loaded by load_figures()
+__color_of_str  = dict([(val, key) for (key, val) in __fmt_color.items()])
+__char_of_marker = dict([(val, key) for (key, val) in __fmt_marker.items()])
+
+__plot_fmt_pattern = re.compile('(?P<color>[brgmck])?(?P<linestyle>-{1,2})?(?P<marker>[osd\^\+])?'
+                                '(?:\[alpha:(?P<alpha>[01]\.[0-9]+)\])?')
+__rgba_pattern = re.compile('^rgba\((.+), ([0-9.]+)\)$')
+
+# The parsed plot_fmt strings. Once there are __max_cached_styles of them, the
+# cache starts over, which only costs parsing the ones still in use again.
+__styles = {}
+__max_cached_styles = 1024
+
+# --------------------------------------------------------------------------------
+def parse_plot_fmt(plot_fmt):
+    # Returns the PlotStyle for plot_fmt
+    style = __styles.get(plot_fmt)
+    if style is not None:
+        return style
+
+    if not ischar(plot_fmt):
+        error('Badly formatted plot_fmt')
+
+    srch = __plot_fmt_pattern.match(plot_fmt)
+
+    color     = srch.group('color') or 'b'
+    linestyle = srch.group('linestyle') or '-'
+    alpha     = float(srch.group('alpha')) if srch.group('alpha') else 1
+
+    marker_char = srch.group('marker') or ''
+    marker      = __fmt_marker[marker_char] if marker_char else ''
+
+    color_str = __fmt_color[color]
+    if alpha < 1:
+        color_str = 'rgba(' + color_str[4:-1] + sprintf(', %g)', alpha)
+
+    style = PlotStyle(linestyle, color_str, marker, color, marker_char, alpha)
+
+    if len(__styles) >= __max_cached_styles:
+        __styles.clear()
+    __styles[plot_fmt] = style
+
+    return style
+
+
+# --------------------------------------------------------------------------------
+def series_style(figInfo, Id):
+    # The PlotStyle of series Id of the figure. Figures loaded with load_figures()
+    # only have the stored strings, from which it is rebuilt.
+    if 'styles' in figInfo:
+        return figInfo['styles'][Id]
+
+    key = (figInfo['linestyles'][Id], figInfo['colors'][Id], figInfo['markers'][Id])
+    style = __styles.get(key)
+    if style is not None:
+        return style
+
+    (linestyle, color_str, marker) = key
+    srch = __rgba_pattern.match(color_str)
+    if srch:
+        (color, alpha) = (__color_of_str['rgb(' + srch.group(1) + ')'], float(srch.group(2)))
+    else:
+        (color, alpha) = (__color_of_str[color_str], 1)
+
+    style = PlotStyle(linestyle, color_str, marker, color, __char_of_marker.get(marker, ''), alpha)
+
+    if len(__styles) >= __max_cached_styles:
+        __styles.clear()
+    __styles[key] = style
+
+    return style
@@ -5,6 +5,10 @@
 """
 
 from matlab_plot_functions import *
+from plot_watch import watch_figure, watch_figures
+import numpy as np
+import os
+import tempfile
 
 y1 = marray([99.86 , 95.60 , 104.21, 106.10, 113.05, 113.54, 110.52, 115.82, 121.35, 136.99, 143.66, 141.05]);
 y2 = marray([118.81, 114.28, 123.94, 126.12, 128.27, 130.99, 118.42, 115.05, 130.32, 135.54, 142.05, 139.39]);
@@ -51,11 +55,46 @@ plot(x2,y2,'r--^')
 legend('X','Y')
 title('Some data')
 xlabel('Time')
+events([20, 60], ['Start', 'Stop'])
+
+
+figure(4)
+clf()
+samples = randn(1,1000)
+hist(samples,30,'b')
+hold('on')
+histc(samples + 4,linspace(2,6,41),'r')
+legend('hist','histc')
+title('Histograms')
+
+
+# A figure that a long-running process updates on every tick, keeping only
+# the last 50 points
+figure(5)
+clf()
+for tick in mrange[1:200]:
+    append_points(5,1,tick,randn(1,1),capacity=50)
+title('Last 50 ticks')
+
+
+# The figures can be saved, and loaded back in another script, e.g. to export
+# them again without preparing the data. Here they go to a temporary file, read
+# back without memory-mapping it (lazy=0), so that it can be deleted right away.
+(fid, store_filename) = tempfile.mkstemp(suffix='.npz')
+os.close(fid)
+save_figures(store_filename)
+load_figures(store_filename, lazy=0)
+os.remove(store_filename)
+
+# Figures can also be drawn from CSV or .npy files without a script, with
+#    python -m matlab_plot_functions render spec.json
 
 # To visualize the plots, uncomment one of the following output options
 output = 'flot'
 # output = 'NVD3'
 # output = 'matplotlib'
+# output = 'export'
+# output = 'watch'
 
 num_figures = length(get_active_figures())
 
@@ -76,5 +115,33 @@ elif output == 'flot' or output == 'NVD3':
 
         open_html_file(output_html_file)
         
+elif output == 'export':
+    # All the formats at once, with the series converted to JSON only once. With
+    # content_hash, the data files are named after their contents.
+    for fig in mrange[1:num_figures]:
+        output_html_file = sprintf('test_plot_export_%i.html', fig)
+
+        export(fig, {'flot': (output_html_file, {'content_hash': 1}),
+                     'nvd3': sprintf('test_plot_export_NVD3_%i.html', fig),
+                     'png':  sprintf('test_plot_export_%i.png', fig)})
+
+        open_html_file(output_html_file)
+
+elif output == 'watch':
+    # Exports the page again each time test_plot_watch.csv changes, e.g. when it
+    # is edited and saved, until Ctrl+C. Only the figures whose files changed
+    # are exported again.
+    if not os.path.exists('test_plot_watch.csv'):
+        np.savetxt('test_plot_watch.csv', np.column_stack([np.ravel(x1), np.ravel(y1)]), fmt='%g', delimiter=',')
+
+    def draw_watched():
+        data = np.loadtxt('test_plot_watch.csv', delimiter=',', ndmin=2)
+        plot(data[:,0], data[:,1], 'b')
+        title('test_plot_watch.csv')
+
+    watch_figure('watched', draw_watched, ['test_plot_watch.csv'], {'flot': 'test_plot_watch.html'})
+    print('Edit test_plot_watch.csv to update test_plot_watch.html, Ctrl+C to stop')
+    watch_figures()
+
 else:
     error('Invalid value for output')
@@ -0,0 +1,180 @@
+"""
+   Module to be used with matlab_plot_functions.py, to keep the exported pages
+   of figures up to date with the data files they are drawn from, re-exporting
+   only the figures whose files changed:
+
+      watch_figure('cpu', draw_cpu, ['data/cpu.csv'], {'flot': 'cpu.html'})
+      watch_figure('mem', draw_mem, ['data/mem.npy'], {'flot': 'mem.html', 'nvd3': 'mem.nvd3.html'})
+      watch_figures(num_workers=4)
+
+   where draw_cpu() draws the figure into the current figure, e.g. with plot()
+   and title(). The files are polled for changes in their modification time and
+   size, which works on any OS and file system, including network ones.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+import os
+import time
+import signal
+import traceback
+import multiprocessing
+
+from matlab_utils import *
+from matlab_plot_functions import figure, close, export, get_active_figures
+
+# The registered figures, by name: (build_fn, input files, export targets)
+__figures = {}
+
+# --------------------------------------------------------------------------------
+def watch_figure(name, build_fn, inputs, targets):
+    # Registers figure name, drawn by build_fn() from the files in inputs, and
+    # exported with export(figIdx, targets) (see matlab_plot_functions.py) when
+    # they change. Registering a name again replaces it. Figures registered once
+    # watch_figures() is running are only picked up the next time it is called.
+    if ischar(inputs):
+        inputs = [inputs]
+
+    __figures[name] = (build_fn, list(inputs), dict(targets))
+
+
+def unwatch_figure(name):
+    __figures.pop(name, None)
+
+
+# --------------------------------------------------------------------------------
+def watch_figures(poll_interval=1.0, debounce=2.0, num_workers=1, on_rebuild=None, max_seconds=None):
+    # Polls the inputs of the registered figures every poll_interval seconds, and
+    # rebuilds a figure once its inputs have not changed for debounce seconds, so
+    # that a file that is still being written only triggers one rebuild. At the
+    # start, the figures with outputs that are missing or older than their inputs
+    # are rebuilt.
+    # With num_workers > 1, the figures are rebuilt by a pool of that many worker
+    # processes, with at most one rebuild of each figure at a time. A figure that
+    # changes during its rebuild is rebuilt again afterwards.
+    # on_rebuild(name, error, seconds) is called after each rebuild, with error
+    # None, or the traceback of the error. Runs until interrupted (Ctrl+C), or
+    # for max_seconds, and returns the number of rebuilds and of failures.
+    start = time.time()
+    counts = {'rebuilds': 0, 'failures': 0}
+
+    def finished(result):
+        (name, err, seconds) = result
+        counts['rebuilds'] += 1
+        if err is not None:
+            counts['failures'] += 1
+        if on_rebuild is not None:
+            on_rebuild(name, err, seconds)
+
+    names      = sorted(__figures.keys())
+    seen       = dict([(name, __input_states(name)) for name in names])
+    changed_at = dict([(name, -float('inf') if __is_stale(name, seen[name]) else None) for name in names])
+    running    = {}
+
+    # The workers are forked with the figures registered so far, so build_fn
+    # does not need to be picklable
+    pool = multiprocessing.Pool(num_workers, __ignore_interrupts) if num_workers > 1 else None
+    try:
+        while max_seconds is None or time.time() - start < max_seconds:
+            now = time.time()
+            for name in names:
+                states = __input_states(name)
+                if states != seen[name]:
+                    seen[name] = states
+                    changed_at[name] = now
+
+                if changed_at[name] is None or now - changed_at[name] < debounce or name in running:
+                    continue
+
+                changed_at[name] = None
+                if pool is None:
+                    finished(__rebuild_figure(name))
+                else:
+                    running[name] = pool.apply_async(__rebuild_figure, (name,))
+
+            for name in [name for name in running if running[name].ready()]:
+                finished(running.pop(name).get())
+
+            time.sleep(poll_interval)
+
+        # Let the rebuilds under way finish
+        for name in list(running.keys()):
+            finished(running.pop(name).get())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return counts
+
+
+# --------------------------------------------------------------------------------
+def __ignore_interrupts():
+    # Ctrl+C is for the watching process, which then stops the workers. A worker
+    # interrupted while waiting for work would leave the pool unable to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def __rebuild_figure(name):
+    # Draws figure name into a figure of its own, exports it, and closes it.
+    # Returns (name, None or the error, seconds taken).
+    (build_fn, inputs, targets) = __figures[name]
+
+    start  = time.time()
+    figIdx = max(list(get_active_figures()) + [0]) + 1
+    try:
+        figure(figIdx)
+        build_fn()
+        export(figIdx, targets)
+        return (name, None, time.time() - start)
+    except Exception:
+        return (name, traceback.format_exc(), time.time() - start)
+    finally:
+        close(figIdx)
+
+
+def __input_states(name):
+    # (modification time, size) of each input file of figure name, None if missing
+    states = []
+    for filename in __figures[name][1]:
+        try:
+            st = os.stat(filename)
+            states.append((st.st_mtime, st.st_size))
+        except OSError:
+            states.append(None)
+    return states
+
+
+def __is_stale(name, states):
+    # Whether an output of figure name is missing or older than one of its inputs
+    output_mtimes = []
+    for target in __figures[name][2].values():
+        filename = target if ischar(target) or target is None else target[0]
+        if filename is None:
+            continue
+        if not os.path.exists(filename):
+            return True
+        output_mtimes.append(os.stat(filename).st_mtime)
+
+    input_mtimes = [state[0] for state in states if state is not None]
+    return bool(output_mtimes) and bool(input_mtimes) and min(output_mtimes) < max(input_mtimes)
@@ -0,0 +1,233 @@
+"""
+   Module to be used with output_to_flot.py and output_to_nvd3.py, with the
+   Javascript code for loading the plot data in a Web Worker. The worker
+   fetches and parses the JSON file and decimates each series to the resolution
+   of the plot, so the page only receives render-ready typed arrays.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+# --------------------------------------------------------------------------------
+def get_worker_str_array():
+    # Function with the code of the worker. It is not called by the page itself,
+    # but its source is turned into the worker script by plot_worker_start()
+    return [
+        'function plot_worker_main() {',
+        '    // Full resolution x and y data of each series, kept by the worker so that',
+        '    // zooming only needs to send back the decimated points in the new range',
+        '    var series_xy = [];',
+        '',
+        '    self.onmessage = function(e) {',
+        '        var msg = e.data;',
+        '        try {',
+        '            if (msg.cmd == "load") { load_data(msg); }',
+        '            if (msg.cmd == "range") { post_series(msg, null); }',
+        '        }',
+        '        catch (err) {',
+        '            self.postMessage({ cmd: "error", id: msg.id, message: String(err) });',
+        '        }',
+        '    };',
+        '',
+        '    function load_data(msg) {',
+        '        var xhr = new XMLHttpRequest();',
+        '        xhr.open("GET", msg.url, true);',
+        '        xhr.onload = function() {',
+        '            try {',
+        '                if (xhr.status != 200 && xhr.status != 0) { throw "HTTP status " + xhr.status; }',
+        '',
+        '                var data_ext = JSON.parse(xhr.responseText);',
+        '                var all_data = data_ext.all_data;',
+        '                var xbase    = data_ext.xbase || 0;',
+        '                delete data_ext.xbase; // the points sent back already include it',
+        '                series_xy = [];',
+        '                for (var idx = 0; idx < all_data.length; idx++)',
+        '                {',
+        '                    series_xy.push(to_typed_arrays(all_data[idx][msg.points_key], xbase));',
+        '                    delete all_data[idx][msg.points_key];',
+        '                }',
+        '                post_series(msg, data_ext);',
+        '            }',
+        '            catch (err) {',
+        '                self.postMessage({ cmd: "error", id: msg.id, message: String(err) });',
+        '            }',
+        '        };',
+        '        xhr.onerror = function() { self.postMessage({ cmd: "error", id: msg.id, message: "Could not load " + msg.url }); };',
+        '        xhr.send();',
+        '    }',
+        '',
+        '    function to_typed_arrays(points, xbase) {',
+        '        // Converts [[x, y], ...] into Float64Arrays, adding xbase to x. A null point',
+        '        // or a null y is a gap in the line, which is kept as a NaN y value.',
+        '        if (points == undefined) { return null; }',
+        '',
+        '        var n = points.length;',
+        '        var xs = new Float64Array(n), ys = new Float64Array(n);',
+        '        var sorted = true, k = 0;',
+        '        for (var i = 0; i < n; i++)',
+        '        {',
+        '            var p = points[i];',
+        '            if (p == null || p[1] == null)',
+        '            {',
+        '                if (k == 0) { continue; } // nothing to break before the first point',
+        '                xs[k] = (p == null) ? xs[k-1] : p[0] + xbase;',
+        '                ys[k] = NaN;',
+        '            }',
+        '            else',
+        '            {',
+        '                xs[k] = p[0] + xbase;',
+        '                ys[k] = p[1];',
+        '            }',
+        '            if (k > 0 && xs[k] < xs[k-1]) { sorted = false; }',
+        '            k++;',
+        '        }',
+        '        return { x: xs.subarray(0, k), y: ys.subarray(0, k), sorted: sorted };',
+        '    }',
+        '',
+        '    function post_series(msg, data_ext) {',
+        '        var xmin = (msg.xmin == undefined) ? -Infinity : msg.xmin;',
+        '        var xmax = (msg.xmax == undefined) ?  Infinity : msg.xmax;',
+        '        var series = [], buffers = [];',
+        '        for (var idx = 0; idx < series_xy.length; idx++)',
+        '        {',
+        '            if (series_xy[idx] == null) { series.push(null); continue; }',
+        '',
+        '            var s = decimate(series_xy[idx], xmin, xmax, msg.target_points);',
+        '            series.push(s);',
+        '            buffers.push(s.points.buffer);',
+        '        }',
+        '        // The point buffers are transferred to the page, not copied',
+        '        self.postMessage({ cmd: msg.cmd, id: msg.id, data_ext: data_ext, series: series }, buffers);',
+        '    }',
+        '',
+        '    function bisect(xs, x, lo, hi) {',
+        '        // First index in [lo, hi) with xs[index] >= x',
+        '        while (lo < hi)',
+        '        {',
+        '            var mid = (lo + hi) >>> 1;',
+        '            if (xs[mid] < x) { lo = mid + 1; } else { hi = mid; }',
+        '        }',
+        '        return lo;',
+        '    }',
+        '',
+        '    function decimate(s, xmin, xmax, num_buckets) {',
+        '        // Returns the points of s in [xmin, xmax] as an interleaved Float64Array',
+        '        // [x1, y1, x2, y2, ...]. Series that are sorted in x and have more than',
+        '        // two points per bucket are reduced to the min and max point of each of',
+        '        // num_buckets equal-width buckets, which keeps the shape of the line.',
+        '        var xs = s.x, ys = s.y, i0 = 0, i1 = xs.length;',
+        '        var out, k = 0, has_gaps = false;',
+        '',
+        '        if (s.sorted)',
+        '        {',
+        '            // Keep one point outside each end of the range, so lines reach the plot edges',
+        '            i0 = Math.max(bisect(xs, xmin, 0, xs.length) - 1, 0);',
+        '            i1 = Math.min(bisect(xs, xmax, i0, xs.length) + 1, xs.length);',
+        '        }',
+        '',
+        '        if (!s.sorted || (i1 - i0) <= 2*num_buckets)',
+        '        {',
+        '            out = new Float64Array(2*(i1 - i0));',
+        '            for (var i = i0; i < i1; i++)',
+        '            {',
+        '                out[k++] = xs[i]; out[k++] = ys[i];',
+        '                if (ys[i] !== ys[i]) { has_gaps = true; }',
+        '            }',
+        '            return { points: out, has_gaps: has_gaps };',
+        '        }',
+        '',
+        '        out = new Float64Array(6*num_buckets);',
+        '        var x_lo = xs[i0], width = (xs[i1-1] - x_lo) / num_buckets, i = i0;',
+        '        for (var b = 0; b < num_buckets && i < i1; b++)',
+        '        {',
+        '            var b_end = (b == num_buckets-1) ? Infinity : x_lo + (b+1)*width;',
+        '            var i_min = -1, i_max = -1, gap = false;',
+        '            for (; i < i1 && xs[i] < b_end; i++)',
+        '            {',
+        '                var y = ys[i];',
+        '                if (y !== y) { gap = true; continue; }',
+        '                if (i_min < 0 || y < ys[i_min]) { i_min = i; }',
+        '                if (i_max < 0 || y > ys[i_max]) { i_max = i; }',
+        '            }',
+        '            if (i_min >= 0)',
+        '            {',
+        '                var i_first = Math.min(i_min, i_max), i_second = Math.max(i_min, i_max);',
+        '                out[k++] = xs[i_first]; out[k++] = ys[i_first];',
+        '                if (i_second != i_first) { out[k++] = xs[i_second]; out[k++] = ys[i_second]; }',
+        '            }',
+        '            if (gap) { out[k++] = xs[i-1]; out[k++] = NaN; has_gaps = true; }',
+        '        }',
+        '        return { points: out.slice(0, k), has_gaps: has_gaps };',
+        '    }',
+        '}'
+    ]
+
+
+# --------------------------------------------------------------------------------
+def get_worker_client_str_array():
+    # Functions used by the page to start the worker and to send it requests
+    return [
+        '    // Helper functions for the Web Worker, which fetches, parses and decimates',
+        '    // the data off the main thread',
+        '    function plot_worker_start(url, points_key, target_points, on_data, on_error) {',
+        '        var worker;',
+        '        try {',
+        '            var src = "(" + plot_worker_main.toString() + ")();";',
+        '            worker = new Worker(URL.createObjectURL(new Blob([src], { type: "text/javascript" })));',
+        '            url = new URL(url, document.baseURI).href; // The worker cannot resolve relative URLs',
+        '        }',
+        '        catch (err) {',
+        '            on_error(err);',
+        '            return null;',
+        '        }',
+        '',
+        '        worker.loaded    = false;',
+        '        worker.next_id   = 0;',
+        '        worker.callbacks = {};',
+        '        worker.onmessage = function(e) {',
+        '            var msg      = e.data;',
+        '            var callback = worker.callbacks[msg.id];',
+        '            delete worker.callbacks[msg.id];',
+        '            if (msg.cmd == "error")',
+        '            {',
+        '                // Only a failed load needs the caller to fall back to the main thread',
+        '                if (!worker.loaded) { worker.terminate(); on_error(msg.message); }',
+        '            }',
+        '            else',
+        '            {',
+        '                worker.loaded = true;',
+        '                if (!(callback == undefined)) { callback(msg); }',
+        '            }',
+        '        };',
+        '        worker.onerror = function(e) {',
+        '            e.preventDefault();',
+        '            if (!worker.loaded) { worker.terminate(); on_error(e.message); }',
+        '        };',
+        '',
+        '        plot_worker_request(worker, { cmd: "load", url: url, points_key: points_key, target_points: target_points }, on_data);',
+        '        return worker;',
+        '    }',
+        '',
+        '    function plot_worker_request(worker, msg, on_reply) {',
+        '        msg.id = worker.next_id++;',
+        '        worker.callbacks[msg.id] = on_reply;',
+        '        worker.postMessage(msg);',
+        '    }'
+    ]
@@ -0,0 +1,79 @@
+"""
+   Module to be used with matlab_plot_functions.py, with the fixed-capacity
+   store behind append_points(). Each value is written twice, at i and at
+   i + capacity, so that the last values are always one contiguous piece of
+   the store, which can be handed to the exporters as a NumPy view, without
+   copying it, however many values have been appended.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+from numpy import empty
+
+from matlab_utils import *
+from plot_encoding import as_vector
+
+# --------------------------------------------------------------------------------
+class RingBuffer(object):
+    # The last `capacity` values appended, in the order they were appended
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            error('The capacity must be at least 1')
+
+        self.capacity = int(capacity)
+        self.store    = empty(2*self.capacity)
+        self.start    = 0  # index of the oldest value
+        self.size     = 0
+
+    def append(self, values):
+        values = as_vector(values)
+
+        # Of more values than fit, only the last ones are kept
+        if len(values) > self.capacity:
+            values = values[-self.capacity:]
+
+        num_values = len(values)
+        if num_values == 0:
+            return
+
+        # Written after the newest value, wrapping around at the capacity, to both
+        # copies of the store
+        pos = (self.start + self.size) % self.capacity
+        num_first = min(num_values, self.capacity - pos)
+        for offset in (0, self.capacity):
+            self.store[offset+pos:offset+pos+num_first] = values[0:num_first]
+            self.store[offset:offset+num_values-num_first] = values[num_first:]
+
+        num_dropped = max(self.size + num_values - self.capacity, 0)
+        self.start = (self.start + num_dropped) % self.capacity
+        self.size  = min(self.size + num_values, self.capacity)
+
+    def values(self):
+        # A view of the store, only valid until the next append()
+        return self.store[self.start:self.start+self.size]
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return self.store.nbytes
@@ -0,0 +1,200 @@
+"""
+   Module to be used with output_to_flot.py and output_to_nvd3.py, to create a
+   lightweight static SVG image of a figure. The image is embedded in the HTML
+   page, so there is something to see right away, and it is replaced by the
+   interactive plot once the data has been loaded.
+
+   To keep the image small, each line is first reduced to the min and max point
+   of each pixel column, and then simplified with the Douglas-Peucker algorithm,
+   dropping the points that are within a fraction of a pixel of the line.
+
+   Copyright (c) 2017 Andrew Sendonaris.
+
+   Permission is hereby granted, free of charge, to any person obtaining a copy
+   of this software and associated documentation files (the "Software"), to deal
+   in the Software without restriction, including without limitation the rights
+   to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+   copies of the Software, and to permit persons to whom the Software is
+   furnished to do so, subject to the following conditions:
+
+   The above copyright notice and this permission notice shall be included in all
+   copies or substantial portions of the Software.
+
+   THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+   IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+   FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+   AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+   LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+   OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+   SOFTWARE.
+"""
+
+from numpy import isfinite, absolute, hypot, around, flatnonzero, zeros, concatenate, diff, arange, floor, \
+                  cumsum, minimum, maximum, unique, int64
+
+from matlab_utils import *
+from plot_encoding import as_vector, decimate_minmax, bar_outline, data_domain, time_label
+
+# Margins of the plot area inside the image, in pixels: left, right, top, bottom
+__margins = [40, 10, 10, 25]
+
+# Width of the columns of column_minmax() for the lines, in pixels. About the
+# width of the lines themselves, so that a line that zigzags within a column
+# looks the same drawn with just its lowest and highest points.
+__column_width = 2
+
+# --------------------------------------------------------------------------------
+def simplify_path(px, py, tolerance=0.5):
+    # Douglas-Peucker simplification of the path (px, py), in pixels. Returns the
+    # indices of the points to keep. Each step computes the distance of all the
+    # points of a segment to its chord at once.
+    num_points = len(px)
+    if num_points <= 2:
+        return arange(0, num_points)
+
+    keep = zeros(num_points, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    segments = [(0, num_points-1)]
+    while segments:
+        i0, i1 = segments.pop()
+        if i1 - i0 < 2:
+            continue
+
+        dx = px[i1] - px[i0]
+        dy = py[i1] - py[i0]
+        chord_len = hypot(dx, dy)
+
+        sx = px[i0+1:i1] - px[i0]
+        sy = py[i0+1:i1] - py[i0]
+        if chord_len > 0:
+            dist = absolute(dx*sy - dy*sx) / chord_len
+        else:
+            dist = hypot(sx, sy)
+
+        i_max = dist.argmax()
+        if dist[i_max] > tolerance:
+            i_split = i0 + 1 + i_max
+            keep[i_split] = True
+            segments.append((i0, i_split))
+            segments.append((i_split, i1))
+
+    return flatnonzero(keep)
+
+
+# --------------------------------------------------------------------------------
+def column_minmax(px, py, column_width=1):
+    # For a path (px, py) in pixels that goes from left to right, returns the
+    # indices of the points to keep so that each column of column_width pixels
+    # has at most two, those with the lowest and highest y, plus the ends of the
+    # path. This bounds the size of the path by the width of the image, as
+    # simplify_path() keeps most of the points of a noisy series.
+    num_points = len(px)
+    if num_points <= 2:
+        return arange(0, num_points)
+
+    col     = floor(px / float(column_width))
+    new_col = concatenate([[True], col[1:] != col[0:-1]])
+    col_idx = cumsum(new_col) - 1
+    starts  = flatnonzero(new_col)
+
+    keep = zeros(num_points, dtype=bool)
+    keep[0] = keep[-1] = True
+    keep[__first_of_columns(py == minimum.reduceat(py, starts)[col_idx], col_idx)] = True
+    keep[__first_of_columns(py == maximum.reduceat(py, starts)[col_idx], col_idx)] = True
+
+    return flatnonzero(keep)
+
+
+def __first_of_columns(match, col_idx):
+    # The index of the first match in each column that has one
+    idx = flatnonzero(match)
+    return idx[unique(col_idx[idx], return_index=True)[1]]
+
+
+# --------------------------------------------------------------------------------
+def figure_to_svg(figInfo, width, height, tolerance=0.5, svg_id=''):
+    # Returns the SVG markup of the figure, for an image of width x height pixels.
+    # The image is stretched to the size of the element that contains it.
+    left, right, top, bottom = __margins
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+
+    (xmin, xmax), (ymin, ymax) = data_domain(figInfo)
+    if not isfinite([xmin, xmax, ymin, ymax]).all():
+        xmin, xmax, ymin, ymax = 0, 1, 0, 1
+    if xmax == xmin:
+        xmin, xmax = xmin - 1, xmax + 1
+    if ymax == ymin:
+        ymin, ymax = ymin - 1, ymax + 1
+
+    x_scale = plot_w / float(xmax - xmin)
+    y_scale = plot_h / float(ymax - ymin)
+
+    if figInfo['xmode'] == 'time':
+        xmin_str = time_label(xmin, xmax - xmin)
+        xmax_str = time_label(xmax, xmax - xmin)
+    else:
+        xmin_str = sprintf('%g', xmin)
+        xmax_str = sprintf('%g', xmax)
+
+    svg_array = [
+        sprintf('<svg%s xmlns="http://www.w3.org/2000/svg" viewBox="0 0 %i %i" width="100%%" height="100%%" preserveAspectRatio="none" style="position:absolute;left:0;top:0;">',
+                ' id="'+svg_id+'"' if not isempty(svg_id) else '', width, height),
+        sprintf('<rect x="%i" y="%i" width="%i" height="%i" fill="none" stroke="#ccc"/>', left, top, plot_w, plot_h),
+        sprintf('<g font-family="sans-serif" font-size="11" fill="#545454"><text x="%i" y="%i">%s</text><text x="%i" y="%i" text-anchor="end">%s</text>',
+                left, height - bottom + 14, xmin_str, width - right, height - bottom + 14, xmax_str),
+        sprintf('<text x="%i" y="%i" text-anchor="end">%g</text><text x="%i" y="%i" text-anchor="end">%g</text></g>',
+                left - 4, height - bottom, ymin, left - 4, top + 10, ymax),
+    ]
+
+    for Id in range(0,length(figInfo['data'])):
+        x = as_vector(figInfo['data'][Id]['x'])
+        y = as_vector(figInfo['data'][Id]['y'])
+
+        if figInfo['plot_types'][Id] == 'bar':
+            # Bars are drawn as their filled outline
+            x, y = bar_outline(x, y, figInfo['bar_widths'][Id])
+        else:
+            # No point in keeping more than the min and max of each pixel column
+            x, y = decimate_minmax(x, y, plot_w)
+
+        px = left + (x - xmin)*x_scale
+        py = top + plot_h - (y - ymin)*y_scale
+
+        # Break the line at missing values, and simplify each piece on its own
+        finite = isfinite(px) & isfinite(py)
+        edges  = flatnonzero(diff(concatenate([[False], finite, [False]]).astype(int)))
+        path_str = ''
+        for i0, i1 in zip(edges[0::2], edges[1::2]):
+            (piece_x, piece_y) = (px[i0:i1], py[i0:i1])
+            if figInfo['plot_types'][Id] != 'bar' and (diff(piece_x) >= 0).all():
+                idx = column_minmax(piece_x, piece_y, __column_width)
+                (piece_x, piece_y) = (piece_x[idx], piece_y[idx])
+
+            idx = simplify_path(piece_x, piece_y, tolerance)
+            path_str += __path_str(piece_x[idx], piece_y[idx])
+
+        if isempty(path_str):
+            continue
+
+        dash_str = ' stroke-dasharray="5,5"' if figInfo['linestyles'][Id] == '--' else ''
+        fill_str = 'fill="%s" fill-opacity="0.6"' % figInfo['colors'][Id] if figInfo['plot_types'][Id] == 'bar' else 'fill="none"'
+        svg_array.append(sprintf('<path d="%s" %s stroke="%s" stroke-width="1.5"%s/>',
+                                 path_str, fill_str, figInfo['colors'][Id], dash_str))
+
+    svg_array.append('</svg>')
+
+    return ''.join(svg_array)
+
+
+def __path_str(px, py):
+    # 'M x0 y0 l dx1 dy1 dx2 dy2 ...', to a tenth of a pixel. The steps are taken
+    # between the rounded points, so that the rounding errors do not add up.
+    tx = around(px*10).astype(int64)
+    ty = around(py*10).astype(int64)
+
+    path_str = 'M%g %g' % (tx[0]/10.0, ty[0]/10.0)
+    if len(tx) > 1:
+        path_str += 'l' + ' '.join(['%g %g' % (dx/10.0, dy/10.0) for (dx, dy) in zip(diff(tx), diff(ty))])
+    return path_str